@@ -5,10 +5,13 @@ Models
 Models for ABCSMC.
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from .parameters import Parameter
 from typing import Callable, Any
 from .epsilon import Epsilon
 from .distance_functions import DistanceFunction
+from .sampler.asyncio_sampler import event_loop_running
 from .acceptor import Acceptor
 
 
@@ -24,6 +27,26 @@ class ModelResult:
         self.accepted = accepted
 
 
+def _run_in_new_loop(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _run_coroutine(coroutine):
+    """
+    Run the coroutine to completion in a new event loop. As a loop cannot
+    be run while another one runs in the same thread, the new loop is run
+    in a separate thread in that case.
+    """
+    if not event_loop_running():
+        return _run_in_new_loop(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(_run_in_new_loop, coroutine).result()
+
+
 class Model:
     """
     General model. This is the most flexible model class, but
@@ -41,6 +64,11 @@ class Model:
     can be overwritten.
 
     To use this class, at least the sample method has to be overriden.
+    Models which wait for external resources, e.g. a simulation service
+    or a subprocess, can instead override the coroutine ``async_sample``.
+    It is awaited by the :class:`pyabc.sampler.AsyncioSampler`, which
+    evaluates many of such models concurrently in a single thread.
+    Other samplers run it in an own event loop.
 
     .. note::
 
@@ -81,8 +109,37 @@ class Model:
         sample: any
             The sampled data.
         """
+        if self.is_async:
+            return _run_coroutine(self.async_sample(pars))
         raise NotImplementedError()
 
+    async def async_sample(self, pars):
+        """
+        Optional asynchronous variant of :meth:`sample`, e.g. awaiting
+        a request to a simulation service or an
+        ``asyncio.create_subprocess_exec`` call.
+
+        Parameters
+        ----------
+
+        pars: Parameter
+            Dictionary of parameters.
+
+        Returns
+        -------
+
+        sample: any
+            The sampled data.
+        """
+        raise NotImplementedError()
+
+    @property
+    def is_async(self) -> bool:
+        """
+        Whether the model implements :meth:`async_sample`.
+        """
+        return type(self).async_sample is not Model.async_sample
+
     def summary_statistics(self,
                            t,
                            pars,
@@ -116,6 +173,21 @@ class Model:
         sum_stats = sum_stats_calculator(raw_data)
         return ModelResult(sum_stats=sum_stats)
 
+    async def async_summary_statistics(self,
+                                       t,
+                                       pars,
+                                       sum_stats_calculator) -> ModelResult:
+        """
+        Asynchronous variant of :meth:`summary_statistics`, which awaits
+        :meth:`async_sample`. Models which are not asynchronous are
+        evaluated via :meth:`summary_statistics`.
+        """
+        if not self.is_async:
+            return self.summary_statistics(t, pars, sum_stats_calculator)
+        raw_data = await self.async_sample(pars)
+        sum_stats = sum_stats_calculator(raw_data)
+        return ModelResult(sum_stats=sum_stats)
+
     def distance(self,
                  t,
                  pars,
@@ -228,6 +300,35 @@ class Model:
 
         return result
 
+    async def async_accept(self,
+                           t,
+                           pars,
+                           sum_stats_calculator,
+                           distance_calculator: DistanceFunction,
+                           eps_calculator: Epsilon,
+                           acceptor: Acceptor,
+                           x_0):
+        """
+        Asynchronous variant of :meth:`accept`, which awaits
+        :meth:`async_summary_statistics`. Models which are not
+        asynchronous are evaluated via :meth:`accept`.
+        """
+        if not self.is_async:
+            return self.accept(t, pars, sum_stats_calculator,
+                               distance_calculator, eps_calculator,
+                               acceptor, x_0)
+        result = await self.async_summary_statistics(t,
+                                                     pars,
+                                                     sum_stats_calculator)
+        distance, accepted = acceptor(t,
+                                      distance_calculator,
+                                      eps_calculator,
+                                      result.sum_stats, x_0)
+        result.distance = distance
+        result.accepted = accepted
+
+        return result
+
 
 class SimpleModel(Model):
     """
@@ -242,6 +343,8 @@ class SimpleModel(Model):
     sample_function: Callable[[Parameter], Any]
         Returns the sample to be passed to the summary statistics method.
         This function as a single argument which is a Parameter.
+        It can also be a coroutine function, i.e. defined via
+        ``async def``, which is then used as :meth:`Model.async_sample`.
 
     name: str. optional
         The name of the model. If not provided, the names if inferred from
@@ -256,8 +359,17 @@ class SimpleModel(Model):
         self.sample_function = sample_function
 
     def sample(self, pars):
+        if self.is_async:
+            return super().sample(pars)
         return self.sample_function(pars)
 
+    async def async_sample(self, pars):
+        return await self.sample_function(pars)
+
+    @property
+    def is_async(self) -> bool:
+        return asyncio.iscoroutinefunction(self.sample_function)
+
     @staticmethod
     def assert_model(model_or_function):
         """
@@ -1,4 +1,5 @@
 from typing import List, Callable
+import numpy as np
 import pandas
 from pyabc.parameters import Parameter
 
@@ -43,6 +44,12 @@ class Particle:
     accepted: bool
         True if particle was accepted, False if not.
 
+    weighted: bool, optional
+        True if the weight is the final importance weight. Particles are
+        created unweighted if :attr:`pyabc.ABCSMC.deferred_weighting` is
+        set, and weighted in the main process afterwards.
+        Defaults to False.
+
     .. note::
         There are two different ways of weighting particles: First, the weights
         can be calculated as emerges from the importance sampling. Second, the
@@ -56,13 +63,18 @@ class Particle:
         multiplying the weights with the model probabilities.
     """
 
+    __slots__ = ("m", "parameter", "weight", "accepted_distances",
+                 "accepted_sum_stats", "all_sum_stats", "accepted",
+                 "weighted")
+
     def __init__(self, m: int,
                  parameter: Parameter,
                  weight: float,
                  accepted_distances: List[float],
                  accepted_sum_stats: List[dict],
                  all_sum_stats: List[dict],
-                 accepted: bool):
+                 accepted: bool,
+                 weighted: bool = False):
 
         self.m = m
         self.parameter = parameter
@@ -71,6 +83,7 @@ class Particle:
         self.accepted_sum_stats = accepted_sum_stats
         self.all_sum_stats = all_sum_stats
         self.accepted = accepted
+        self.weighted = weighted
 
     def __getitem__(self, item):
         return getattr(self, item)
@@ -92,33 +105,98 @@ class Particle:
                               self.accepted_distances,
                               self.accepted_sum_stats,
                               self.all_sum_stats,
-                              self.accepted)
+                              self.accepted,
+                              self.weighted)
+
+
+def _flatten_parameter(parameter) -> dict:
+    """
+    The parameter with dictionary values flattened to ``key_subkey``
+    entries, and float values.
+    """
+    flat = {}
+    for key, value in parameter.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                flat[key + "_" + sub_key] = float(sub_value)
+        else:
+            flat[key] = float(value)
+    return flat
 
 
 class Population:
     """
-    A population contains a list of particles and offers standardized access
-    to them. Upon initialization, the particle weights are normalized and model
-    probabilities computed as described in _normalize_weights.
+    A population contains the accepted particles and offers standardized
+    access to them. Upon initialization, the particle weights are normalized
+    and model probabilities computed as described in _normalize_weights.
+
+    Internally, the population is stored column-wise: The model indices,
+    weights and distances are held in numpy arrays, and a parameter matrix
+    with column names is created on demand. The passed particles are
+    neither copied nor modified. The :class:`Particle` objects returned by
+    :meth:`get_list` and :meth:`to_dict` are lightweight views onto these
+    columns, carrying the normalized weights and current distances.
     """
 
     def __init__(self, particles: List[Particle]):
-        self._list = [particle.copy() for particle in particles]
+        if any(particle is None for particle in particles):
+            print("Warning: Empty particle.")
+            particles = [particle for particle in particles
+                         if particle is not None]
+
+        self._m = np.array([particle.m for particle in particles],
+                           dtype=int)
+        self._weights = np.array([particle.weight for particle in particles],
+                                 dtype=float)
+        self._parameters = [particle.parameter for particle in particles]
+        self._all_sum_stats = [particle.all_sum_stats
+                               for particle in particles]
+
+        # the distances and accepted summary statistics of all particles
+        # are concatenated, the offsets mark the particle boundaries
+        n_distances = np.array([len(particle.accepted_distances)
+                                for particle in particles], dtype=int)
+        self._distance_offsets = np.concatenate(([0], np.cumsum(n_distances)))
+        self._distance_owner = np.repeat(np.arange(len(particles)),
+                                         n_distances)
+        self._distances = np.array(
+            [distance for particle in particles
+             for distance in particle.accepted_distances], dtype=float)
+        self._accepted_sum_stats = [
+            sum_stat for particle in particles
+            for sum_stat in particle.accepted_sum_stats]
+
+        self._parameter_matrix = None
+        self._parameter_names = None
+        self._model_parameter_names = None
         self._model_probabilities = None
         self._normalize_weights()
 
     def __len__(self):
-        return len(self._list)
+        return len(self._m)
+
+    def _particle(self, index: int) -> Particle:
+        """
+        Create a view of the particle at position ``index``.
+        """
+        start, stop = self._distance_offsets[index:index + 2]
+        return Particle(int(self._m[index]),
+                        self._parameters[index],
+                        float(self._weights[index]),
+                        self._distances[start:stop].tolist(),
+                        self._accepted_sum_stats[start:stop],
+                        self._all_sum_stats[index],
+                        True)
 
     def get_list(self) -> List[Particle]:
         """
         Returns
         -------
 
-        A copy of the underlying particle list.
+        A list of views of the particles.
         """
 
-        return self._list.copy()
+        return [self._particle(index) for index in range(len(self))]
 
     def _normalize_weights(self):
         """
@@ -126,23 +204,18 @@ class Population:
         to 1, and compute the model probabilities. Should only be called once.
         """
 
-        store = self.to_dict()
-
-        model_total_weights = {m: sum(particle.weight for particle in plist)
-                               for m, plist in store.items()}
-        population_total_weight = sum(model_total_weights.values())
-        model_probabilities = {m: w / population_total_weight
-                               for m, w in model_total_weights.items()}
+        models, model_index = np.unique(self._m, return_inverse=True)
+        model_total_weights = np.bincount(model_index, weights=self._weights,
+                                          minlength=len(models))
+        population_total_weight = model_total_weights.sum()
 
         # update model_probabilities attribute
-        self._model_probabilities = model_probabilities
+        self._model_probabilities = dict(zip(
+            models.tolist(),
+            (model_total_weights / population_total_weight).tolist()))
 
         # normalize weights within each model
-        for m in store:
-            model_total_weight = model_total_weights[m]
-            plist = store[m]
-            for particle in plist:
-                particle.weight /= model_total_weight
+        self._weights = self._weights / model_total_weights[model_index]
 
     def update_distances(self,
                          distance_to_ground_truth: Callable[[dict], float]):
@@ -156,10 +229,9 @@ class Population:
             Distance function to the observed summary statistics.
         """
 
-        for particle in self._list:
-            for i in range(len(particle.accepted_distances)):
-                particle.accepted_distances[i] = distance_to_ground_truth(
-                    particle.accepted_sum_stats[i])
+        self._distances = np.array(
+            [distance_to_ground_truth(sum_stat)
+             for sum_stat in self._accepted_sum_stats], dtype=float)
 
     def get_model_probabilities(self) -> dict:
         """
@@ -190,17 +262,78 @@ class Population:
             A pandas.DataFrame containing in column 'distance' the distances
             and in column 'w' the scaled weights.
         """
-        rows = []
-        for particle in self._list:
-            model_probability = self._model_probabilities[particle.m]
-            for distance in particle.accepted_distances:
-                rows.append({'distance': distance,
-                             'w': particle.weight * model_probability})
+        model_probabilities = np.array(
+            [self._model_probabilities[m] for m in self._m], dtype=float)
+        w = (self._weights * model_probabilities)[self._distance_owner]
 
-        weighted_distances = pandas.DataFrame(rows)
+        weighted_distances = pandas.DataFrame({'distance': self._distances,
+                                               'w': w})
 
         return weighted_distances
 
+    def get_parameter_matrix(self) -> (np.ndarray, List[str]):
+        """
+        Parameters of all particles as matrix.
+
+        As in the database, see :meth:`pyabc.History.append_population`,
+        dictionary valued parameters are flattened to ``key_subkey``
+        columns, and the values are converted to float.
+
+        Returns
+        -------
+
+        matrix, names: np.ndarray, List[str]
+            A (n_particles, n_parameters) matrix and the sorted parameter
+            names labeling its columns. In the case of several models with
+            different parameters, the entries of parameters a model does not
+            have are NaN.
+        """
+        if self._parameter_matrix is None:
+            parameters = [_flatten_parameter(parameter)
+                          for parameter in self._parameters]
+            model_names = {}
+            for m, parameter in zip(self._m, parameters):
+                model_names.setdefault(int(m), set()).update(parameter)
+            names = sorted(set().union(*model_names.values()))
+            column = {name: j for j, name in enumerate(names)}
+            matrix = np.full((len(self), len(names)), np.nan)
+            for i, parameter in enumerate(parameters):
+                for key, value in parameter.items():
+                    matrix[i, column[key]] = value
+            self._parameter_matrix = matrix
+            self._parameter_names = names
+            self._model_parameter_names = {
+                m: sorted(keys) for m, keys in model_names.items()}
+        return self._parameter_matrix, self._parameter_names
+
+    def get_distribution(self, m: int) -> (pandas.DataFrame, np.ndarray):
+        """
+        Parameters and weights of the particles of one model, in the same
+        format as :meth:`pyabc.History.get_distribution`.
+
+        Parameters
+        ----------
+
+        m: int
+            The model index.
+
+        Returns
+        -------
+
+        df, w: pandas.DataFrame, np.ndarray
+            A DataFrame of the parameters of model m, with columns sorted
+            by name, and the normalized weights of these particles.
+        """
+        matrix, names = self.get_parameter_matrix()
+        rows = self._m == m
+        # only the parameters of model m
+        model_names = self._model_parameter_names.get(m, [])
+        columns = np.array([names.index(name) for name in model_names],
+                           dtype=int)
+        df = pandas.DataFrame(matrix[np.ix_(rows, columns)],
+                              columns=model_names)
+        return df, self._weights[rows]
+
     def to_dict(self) -> dict:
         """
         Create a dictionary representation, creating a list of particles for
@@ -214,14 +347,12 @@ class Population:
             each model as values.
         """
 
-        store = dict()
+        order = np.argsort(self._m, kind="stable")
+        models, starts = np.unique(self._m[order], return_index=True)
+        stops = np.append(starts[1:], len(order))
 
-        for particle in self._list:
-            if particle is not None:
-                # setdefault: similar to get(), sets dict[key] = default if key
-                # is not in dict yet.
-                store.setdefault(particle.m, []).append(particle)
-            else:
-                print("Warning: Empty particle.")
+        store = {int(m): [self._particle(index)
+                          for index in order[start:stop]]
+                 for m, start, stop in zip(models, starts, stops)}
 
         return store
@@ -2,6 +2,8 @@ import logging
 from abc import ABC, abstractmethod
 from functools import reduce
 from typing import Union
+import numpy as np
+import pandas as pd
 from .parameters import Parameter, ParameterStructure
 rv_logger = logging.getLogger("RV")
 
@@ -23,8 +25,16 @@ class RVBase(ABC):
         It is important to be able to pickle them to execute the ACBSMC
         algorithm in a distributed cluster
         environment
+
+    Random variables which set ``vectorized`` to True accept arrays in
+    ``pdf``, ``pmf`` and ``cdf``, and a ``size`` argument in ``rvs``,
+    such that many parameters can be drawn and evaluated at once.
+    Otherwise, they are called per parameter.
     """
 
+    #: Whether the methods also operate on arrays
+    vectorized = False
+
     @abstractmethod
     def copy(self) -> "RVBase":
         """
@@ -75,12 +85,14 @@ class RVBase(ABC):
         ----------
         x: float
             Probability density at x.
+            An array, if the random variable is ``vectorized``.
 
         Returns
         -------
 
         density: float
             Probability density at x.
+            An array of densities for an array ``x``.
         """
 
     @abstractmethod
@@ -169,6 +181,8 @@ class RV(RVBase):
         distribution = getattr(st, self.name)
         self.distribution = distribution(*self.args, **self.kwargs)
 
+    vectorized = True
+
     def copy(self):
         return self.__class__(self.name, *self.args, **self.kwargs)
 
@@ -288,10 +302,16 @@ class LowerBoundDecorator(RVDecorator):
     def copy(self):
         return self.__class__(self.component.copy(), self.lower_bound)
 
+    @property
+    def vectorized(self):
+        return getattr(self.component, "vectorized", False)
+
     def decorator_repr(self):
         return "Lower: X > {lower:2f}".format(lower=self.lower_bound)
 
-    def rvs(self):
+    def rvs(self, size=None):
+        if size is not None:
+            return np.array([self.rvs() for _ in range(size)])
         for _ in range(LowerBoundDecorator.MAX_TRIES):
             sample = self.component.rvs()
             # not sure whether > is the exact opposite. but <= is consistent
@@ -300,24 +320,45 @@ class LowerBoundDecorator(RVDecorator):
         return None
 
     def pdf(self, x):
+        if not np.isscalar(x):
+            return np.where(np.asarray(x) <= self.lower_bound, 0.,
+                            self.component.pdf(x)
+                            / (1 - self.component.cdf(self.lower_bound)))
         if x <= self.lower_bound:
             return 0.
         return (self.component.pdf(x)
                 / (1 - self.component.cdf(self.lower_bound)))
 
     def pmf(self, x):
+        if not np.isscalar(x):
+            return np.where(np.asarray(x) <= self.lower_bound, 0.,
+                            self.component.pmf(x)
+                            / (1 - self.component.cdf(self.lower_bound)))
         if x <= self.lower_bound:
             return 0.
         return (self.component.pmf(x)
                 / (1 - self.component.cdf(self.lower_bound)))
 
     def cdf(self, x):
+        lower_mass = self.component.cdf(self.lower_bound)
+        if not np.isscalar(x):
+            return np.where(np.asarray(x) <= self.lower_bound, 0.,
+                            (self.component.cdf(x) - lower_mass)
+                            / (1 - lower_mass))
         if x <= self.lower_bound:
             return 0.
-        lower_mass = self.component.cdf(self.lower_bound)
         return (self.component.cdf(x) - lower_mass) / (1 - lower_mass)
 
 
+def _density(rv, x):
+    try:
+        # works for continuous variables
+        return rv.pdf(x)
+    except AttributeError:
+        # discrete variables do not have a pdf but a pmf
+        return rv.pmf(x)
+
+
 class Distribution(ParameterStructure):
     """
     Distribution of parameters for a model.
@@ -402,18 +443,32 @@ class Distribution(ParameterStructure):
 
         return sorted(self.keys())
 
-    def rvs(self) -> Parameter:
+    def rvs(self, size: int = None) -> Union[Parameter, pd.DataFrame]:
         """
         Sample from joint distribution
 
+        Parameters
+        ----------
+
+        size: int, optional
+            Number of parameters to sample at once.
+
         Returns
         -------
 
-        parameter: Parameter
+        parameter: Union[Parameter, pd.DataFrame]
             A parameter which was sampled.
+            If ``size`` is given, a DataFrame of ``size`` parameters
+            with the parameter names as columns.
         """
 
-        return Parameter(**{key: val.rvs() for key, val in self.items()})
+        if size is None:
+            return Parameter(**{key: val.rvs() for key, val in self.items()})
+        return pd.DataFrame(
+            {key: (val.rvs(size=size) if getattr(val, "vectorized", False)
+                   else [val.rvs() for _ in range(size)])
+             for key, val in self.items()},
+            index=range(size))
 
     def pdf(self, x: Union[Parameter, dict]):
         """
@@ -423,8 +478,12 @@ class Distribution(ParameterStructure):
 
         Parameters
         ----------
-        x : Union[Parameter, dict]
+        x : Union[Parameter, dict, pd.DataFrame]
             Evaluate at the given Parameter ``x``.
+            If a pandas DataFrame with the parameter names as columns is
+            passed, the densities of all rows are returned as array.
+            They are evaluated at once for ``vectorized`` random variables,
+            and row by row otherwise.
         """
         # check if the parameters match
         if sorted(x.keys()) != sorted(self.keys()):
@@ -434,12 +493,13 @@ class Distribution(ParameterStructure):
         if len(self) > 0:
             res = []
             for key, val in x.items():
-                try:
-                    # works for continuous variables
-                    res.append(self[key].pdf(val))
-                except AttributeError:
-                    # discrete variables do not have a pdf but a pmf
-                    res.append(self[key].pmf(val))
+                rv = self[key]
+                if (isinstance(val, pd.Series)
+                        and not getattr(rv, "vectorized", False)):
+                    # evaluate parameter by parameter
+                    res.append(np.array([_density(rv, v) for v in val]))
+                else:
+                    res.append(_density(rv, val))
             return reduce(lambda s, t: s*t, res)
         else:
             return 1
@@ -480,7 +540,7 @@ class ModelPerturbationKernel:
         return RV('rv_discrete',
                   values=(range(len(probabilities)), probabilities))
 
-    def rvs(self, m: int) -> int:
+    def rvs(self, m: int, size: int = None) -> Union[int, np.ndarray]:
         """
         Sample a Kernel jump from model ``m`` to another model.
 
@@ -489,19 +549,24 @@ class ModelPerturbationKernel:
         m: int
             Model source nr.
 
+        size: int, optional
+            Number of independent jumps to sample.
+            If omitted, a single jump is sampled.
+
         Returns
         -------
 
-        target: int
-            Target model nr.
+        target: int or np.ndarray
+            Target model nr, or an array of ``size`` target model nrs.
         """
 
         if not 0 <= m <= self.nr_of_models-1:
             raise Exception('m has to be between 0 and nr_of_models - 1')
         if self.nr_of_models == 1:
-            return 0  # always stay, no other choice
+            # always stay, no other choice
+            return 0 if size is None else np.zeros(size, dtype=int)
         else:
-            return self._get_discrete_rv(m).rvs()
+            return self._get_discrete_rv(m).rvs(size=size)
 
     def pmf(self, n: int, m: int) -> float:
         """
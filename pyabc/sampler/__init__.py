@@ -7,22 +7,33 @@ See also the `explanation of the samplers <sampler.html>`_.
 """
 
 from .singlecore import SingleCoreSampler
-from .mapping import MappingSampler
+from .mapping import MappingSampler, EvalParallelMappingSampler
 from .multicore import MulticoreParticleParallelSampler
 from .base import Sample, Sampler
 from .dask_sampler import DaskDistributedSampler
 from .multicore_evaluation_parallel import MulticoreEvalParallelSampler
+from .thread_evaluation_parallel import (ThreadEvalParallelSampler,
+                                         thread_rng)
 from .redis_eps import (RedisEvalParallelSampler,
                         RedisEvalParallelSamplerServerStarter)
 from .concurrent_future import ConcurrentFutureSampler
+from .asyncio_sampler import AsyncioSampler
+from .cancellation import SimulationCancelled, cancelled, raise_if_cancelled
 
 __all__ = ["Sample",
            "Sampler",
            "SingleCoreSampler",
            "MulticoreParticleParallelSampler",
            "MappingSampler",
+           "EvalParallelMappingSampler",
            "DaskDistributedSampler",
            "RedisEvalParallelSampler",
            "MulticoreEvalParallelSampler",
+           "ThreadEvalParallelSampler",
+           "thread_rng",
            "RedisEvalParallelSamplerServerStarter",
-           "ConcurrentFutureSampler"]
+           "ConcurrentFutureSampler",
+           "AsyncioSampler",
+           "SimulationCancelled",
+           "cancelled",
+           "raise_if_cancelled"]
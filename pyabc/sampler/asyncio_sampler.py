@@ -0,0 +1,142 @@
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from .base import Sampler
+
+
+def event_loop_running() -> bool:
+    """
+    Whether an event loop is running in the calling thread, e.g. in a
+    Jupyter notebook.
+    """
+    try:
+        return asyncio.get_event_loop().is_running()
+    except RuntimeError:
+        # no event loop set in this thread
+        return False
+
+
+def async_simulate_function(simulate_one):
+    """
+    The coroutine function evaluating a single particle.
+    This is the ``async_simulate_one`` attribute of ``simulate_one``,
+    if provided, as for functions created by :class:`pyabc.ABCSMC`.
+    Otherwise, ``simulate_one`` is called synchronously.
+    """
+    try:
+        return simulate_one.async_simulate_one
+    except AttributeError:
+        async def async_simulate_one():
+            return simulate_one()
+        return async_simulate_one
+
+
+class AsyncioSampler(Sampler):
+    """
+    Evaluate particles concurrently as coroutines in a single thread.
+
+    Suitable for models which mostly wait for external resources, e.g.
+    a simulation service called over the network, or a subprocess.
+    Such models implement :meth:`pyabc.Model.async_sample`, or are passed
+    as ``async def`` functions. Compared to one process per evaluation,
+    this requires neither additional memory nor pickling.
+    Synchronous models are evaluated one after another.
+
+    As :class:`pyabc.sampler.MulticoreEvalParallelSampler`, this sampler
+    assigns increasing IDs to the evaluations in the order in which they
+    are started, and returns the first ``n`` accepted particles by ID,
+    to avoid a bias toward short running evaluations.
+    Once ``n`` particles are accepted, no further evaluations are started,
+    and evaluations with larger IDs than the ``n``-th accepted one are
+    cancelled.
+
+    The evaluations run in a new event loop per generation. If the
+    sampler is called from within a running event loop, e.g. in a Jupyter
+    notebook, this loop is run in a separate thread.
+
+    Parameters
+    ----------
+
+    max_concurrency: int, optional
+        Maximum number of evaluations running at a time. Defaults to 100.
+    """
+
+    def __init__(self, max_concurrency: int = 100):
+        super().__init__()
+        self.max_concurrency = max_concurrency
+
+    def sample_until_n_accepted(self, n, simulate_one):
+        if not event_loop_running():
+            return self._run_until_n_accepted(n, simulate_one)
+        # a loop cannot be run while another one runs in the same thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(self._run_until_n_accepted,
+                                   n, simulate_one).result()
+
+    def _run_until_n_accepted(self, n, simulate_one):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(
+                self._sample_until_n_accepted(n, simulate_one, loop))
+        finally:
+            loop.close()
+
+    async def _sample_until_n_accepted(self, n, simulate_one, loop):
+        async_simulate_one = async_simulate_function(simulate_one)
+
+        # running evaluations by task, and finished ones by ID
+        running = {}
+        id_results = []
+        # the n smallest accepted IDs, negated, as heapq is a min-heap
+        accepted_ids = []
+        cutoff = None
+        next_id = 0
+
+        try:
+            while True:
+                if cutoff is None:
+                    for _ in range(self.max_concurrency - len(running)):
+                        task = loop.create_task(async_simulate_one())
+                        running[task] = next_id
+                        next_id += 1
+
+                if len(running) == 0:
+                    break
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    particle_id = running.pop(task)
+                    particle = task.result()
+                    id_results.append((particle_id, particle))
+                    if particle.accepted:
+                        heapq.heappush(accepted_ids, -particle_id)
+                        if len(accepted_ids) > n:
+                            heapq.heappop(accepted_ids)
+
+                if len(accepted_ids) == n:
+                    # later evaluations cannot be among the first n accepted
+                    cutoff = -accepted_ids[0]
+                    cancelled = [task for task, particle_id in running.items()
+                                 if particle_id > cutoff]
+                    for task in cancelled:
+                        task.cancel()
+                        del running[task]
+                    await asyncio.gather(*cancelled, return_exceptions=True)
+        except BaseException:
+            # do not leave evaluations behind in the loop
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            raise
+
+        self.nr_evaluations_ = next_id
+
+        # avoid bias toward short running evaluations
+        id_results.sort(key=lambda x: x[0])
+        sample = self._create_empty_sample()
+        for particle_id, particle in id_results:
+            if particle_id <= cutoff:
+                sample.append(particle)
+
+        return sample
@@ -1,12 +1,49 @@
 from abc import ABC, abstractmethod
 from pyabc.population import Particle, Population
-from typing import List
+from typing import Callable, List
+
+
+def simulate_batch(simulate_one: Callable[[], Particle],
+                   k: int) -> List[Particle]:
+    """
+    Simulate ``k`` particles.
+
+    The function passed by :class:`pyabc.ABCSMC` to the samplers
+    carries a vectorized ``simulate_batch`` attribute, which proposes and
+    weights all ``k`` particles at once. This is used if available.
+    Otherwise, ``simulate_one`` is simply called ``k`` times.
+
+    Parameters
+    ----------
+
+    simulate_one: Callable[[], Particle]
+        The function passed to :meth:`Sampler.sample_until_n_accepted`.
+
+    k: int
+        Number of particles to simulate.
+
+    Returns
+    -------
+
+    particles: List[Particle]
+        The ``k`` simulated (accepted or rejected) particles, in the order
+        in which they were proposed.
+    """
+    try:
+        batch_function = simulate_one.simulate_batch
+    except AttributeError:
+        return [simulate_one() for _ in range(k)]
+    return batch_function(k)
 
 
 class Sample:
     """
     A Sample is created and filled during the sampling process by the Sampler.
 
+    Accepted and rejected particles are kept in separate lists, such that
+    the number of accepted particles is available without scanning
+    through all particles.
+
     Parameters
     ----------
 
@@ -16,7 +53,8 @@ class Sample:
     """
 
     def __init__(self, record_all_sum_stats: bool=False):
-        self._particles = []
+        self._accepted_particles = []
+        self._rejected_particles = []
         self.record_all_sum_stats = record_all_sum_stats
 
     @property
@@ -31,19 +69,11 @@ class Sample:
             Concatenation of all the all_sum_stats lists of all
             particles added and accepted to this sample via append().
         """
-        return sum((particle.all_sum_stats
-                    for particle in self._particles), [])
-
-    @property
-    def _accepted_particles(self) -> List[Particle]:
-        """
-        Returns
-        -------
-
-        List of only the accepted particles.
-        """
-        return [particle.copy()
-                for particle in self._particles if particle.accepted]
+        return [sum_stat
+                for particles in (self._accepted_particles,
+                                  self._rejected_particles)
+                for particle in particles
+                for sum_stat in particle.all_sum_stats]
 
     def append(self, particle: Particle):
         """
@@ -58,13 +88,55 @@ class Sample:
         """
 
         # add to population if accepted
-        if particle.accepted or self.record_all_sum_stats:
-            self._particles.append(particle)
+        if particle.accepted:
+            self._accepted_particles.append(particle)
+        elif self.record_all_sum_stats:
+            self._rejected_particles.append(particle)
 
     def __add__(self, other: "Sample"):
-        sample = self.__class__(self.record_all_sum_stats)
-        sample._particles = self._particles + other._particles
-        return sample
+        return self.merge([self, other])
+
+    @classmethod
+    def merge(cls, samples: List["Sample"]) -> "Sample":
+        """
+        Merge several samples into a single new sample.
+
+        The particles are not copied, and the cost is linear in the total
+        number of particles. Hence, collecting the results of n workers
+        via a single merge is preferable to adding them up one by one.
+
+        Parameters
+        ----------
+
+        samples: List[Sample]
+            The samples to merge. The new sample records all summary
+            statistics if the first sample does.
+
+        Returns
+        -------
+
+        sample: Sample
+            A new sample containing the particles of all samples,
+            in the order of ``samples``.
+        """
+        record_all_sum_stats = (samples[0].record_all_sum_stats
+                                if len(samples) > 0 else False)
+        merged = cls(record_all_sum_stats)
+        for sample in samples:
+            merged._accepted_particles.extend(sample._accepted_particles)
+            merged._rejected_particles.extend(sample._rejected_particles)
+        return merged
+
+    @property
+    def accepted_particles(self) -> List[Particle]:
+        """
+        Returns
+        -------
+
+        accepted_particles: List[Particle]
+            The accepted particles, not copied.
+        """
+        return self._accepted_particles
 
     @property
     def n_accepted(self) -> int:
@@ -84,6 +156,8 @@ class Sample:
 
         population: Population
             A population of only the accepted particles.
+            The population does not modify the particles, so these are not
+            copied.
         """
         return Population(self._accepted_particles)
 
@@ -138,6 +212,19 @@ class Sampler(ABC):
     def _create_empty_sample(self) -> Sample:
         return self.sample_factory()
 
+    def stop(self):
+        """
+        Release resources which are kept across generations, such as
+        persistent worker processes. Called at the end of
+        :meth:`pyabc.ABCSMC.run`. The default does nothing.
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
     @abstractmethod
     def sample_until_n_accepted(self, n, simulate_one) -> Sample:
         """
@@ -155,6 +242,9 @@ class Sampler(ABC):
             sampling parameters, simulating data, and comparing to observed
             data to check for acceptance, as indicated via the
             particle.accepted flag.
+            Samplers which evaluate several particles in a row should use
+            :func:`simulate_batch` to make use of the vectorized proposal
+            generation, if provided.
 
         Returns
         -------
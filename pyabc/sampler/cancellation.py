@@ -0,0 +1,60 @@
+"""
+Cooperative cancellation of simulations
+=======================================
+
+Once a sampler has collected enough accepted particles, evaluations with
+larger IDs can no longer be part of the population. Samplers which support
+cancellation signal this to the evaluation currently running in a worker.
+Long running simulators can poll :func:`cancelled` or call
+:func:`raise_if_cancelled` to abort early, the result of a cancelled
+evaluation is discarded.
+The check is thread-local, such that threads evaluating in parallel
+are cancelled independently.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+
+class SimulationCancelled(Exception):
+    """
+    Raised by :func:`raise_if_cancelled` to abort a cancelled simulation.
+    """
+
+
+# the check of the evaluation currently running in this thread
+_local = threading.local()
+
+
+def cancelled() -> bool:
+    """
+    Whether the evaluation currently running in this thread is cancelled,
+    i.e. its result is not needed any more.
+    Always False outside of samplers supporting cancellation.
+    """
+    check = getattr(_local, "check", None)
+    return check is not None and check()
+
+
+def raise_if_cancelled():
+    """
+    Raise :class:`SimulationCancelled` if the evaluation currently running
+    in this thread is cancelled.
+    """
+    if cancelled():
+        raise SimulationCancelled()
+
+
+@contextmanager
+def cancellable(check: Callable[[], bool]):
+    """
+    Install ``check`` as the cancellation check of the evaluations run
+    within the context. To be used by the samplers' workers.
+    """
+    previous = getattr(_local, "check", None)
+    _local.check = check
+    try:
+        yield
+    finally:
+        _local.check = previous
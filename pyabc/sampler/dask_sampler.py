@@ -1,4 +1,4 @@
-from distributed import Client
+from distributed import Client, as_completed
 from .base import Sampler
 from .eps_mixin import EPSMixin
 import numpy as np
@@ -31,6 +31,8 @@ class DaskDistributedSampler(EPSMixin, Sampler):
         functions, which can not be pickled using default pickle, at the cost
         of an additional pickling overhead. For dask, this workaround should
         not be necessary and it should be save to use default_pickle=false.
+        In both cases, the simulation function is scattered to the workers
+        only once per generation, the tasks refer to it via a future.
 
     batchsize: int, optional
         Number of parameter samples that are evaluated in one remote execution
@@ -69,3 +71,12 @@ class DaskDistributedSampler(EPSMixin, Sampler):
 
     def client_cores(self):
         return sum(self.my_client.ncores().values())
+
+    def scatter(self, simulate_one):
+        # broadcast once, the tasks only reference the future.
+        # Not hashed, as the content changes from generation to generation.
+        return self.my_client.scatter(simulate_one, broadcast=True,
+                                      hash=False)
+
+    def as_completed(self):
+        return as_completed()
@@ -1,67 +1,144 @@
+import queue
 import numpy as np
 import cloudpickle as pickle
 from sortedcontainers import SortedListWithKey
+from .base import simulate_batch
+
+
+def evaluate_batch(simulate_one, batchsize, job_id):
+    """
+    Evaluate a batch of ``batchsize`` particles with the IDs ``job_id``.
+    Module level, such that the submitted tasks only reference it.
+    """
+    result_batch = []
+    for j, eval_result in enumerate(simulate_batch(simulate_one, batchsize)):
+        eval_accept = eval_result.accepted
+        result_batch.append((eval_result, eval_accept, job_id[j]))
+    return result_batch
+
+
+def evaluate_pickled_batch(simulate_one_pickled, batchsize, job_id):
+    """
+    As :func:`evaluate_batch`, for a pickled ``simulate_one``.
+    """
+    return evaluate_batch(pickle.loads(simulate_one_pickled), batchsize,
+                          job_id)
+
+
+class AsCompleted:
+    """
+    Iterator over :class:`concurrent.futures.Future` objects in the order
+    in which they finish. Futures can be added while iterating, and each
+    finished one is handed over via a done callback, so the cost per
+    completion does not depend on the number of running futures.
+    Iteration blocks until the next added future is done.
+    """
+
+    def __init__(self):
+        self._done = queue.Queue()
+
+    def add(self, future):
+        future.add_done_callback(self._done.put)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._done.get()
 
 
 class EPSMixin:
-    def full_submit_function_pickle(self, job_id):
-        simulate_one = pickle.loads(self.simulate_accept_one)
-        result_batch = []
-        for j in range(self.batchsize):
-            eval_result = simulate_one()
-            eval_accept = eval_result.accepted
-            result_batch.append((eval_result, eval_accept, job_id[j]))
-        return result_batch
+    """
+    Evaluation parallel sampling via a client with a ``submit`` method
+    returning futures. Requires the attributes ``my_client``,
+    ``client_max_jobs``, ``default_pickle`` and ``batchsize``, and the
+    method ``client_cores``.
+
+    The tasks are module level functions, which receive the simulation
+    function as an argument. Clients able to do so distribute the
+    simulation function only once per generation via :meth:`scatter`.
+
+    The master blocks until at least one of the running jobs is done,
+    it does not poll.
+    """
+
+    def as_completed(self):
+        """
+        Create an iterator over the submitted jobs in the order in which
+        they finish, with an ``add`` method to register further jobs.
+        By default an :class:`AsCompleted`, for futures implementing
+        ``add_done_callback`` as :class:`concurrent.futures.Future`.
+        """
+        return AsCompleted()
+
+    def scatter(self, simulate_one):
+        """
+        Make ``simulate_one`` available to the workers once per
+        generation. The returned handle is passed to every submitted task
+        in place of ``simulate_one``. By default, ``simulate_one``
+        itself is returned, i.e. it is sent along with every task.
+        """
+        return simulate_one
 
     def sample_until_n_accepted(self, n, simulate_one):
         # For default pickling
         if self.default_pickle:
-            self.simulate_accept_one = pickle.dumps(simulate_one)
-            full_submit_function = self.full_submit_function_pickle
+            simulate_one = pickle.dumps(simulate_one)
+            full_submit_function = evaluate_pickled_batch
         else:
             # For advanced pickling, e.g. cloudpickle
-            def full_submit_function(job_id):
-                result_batch = []
-                for j in range(self.batchsize):
-                    eval_result = simulate_one()
-                    eval_accept = eval_result.accepted
-                    result_batch.append((eval_result, eval_accept, job_id[j]))
-                return result_batch
+            full_submit_function = evaluate_batch
+        simulate_one = self.scatter(simulate_one)
 
         num_accepted_total = 0
         num_accepted_sequential = 0
         next_job_id = 0
-        running_jobs = []
+        running_jobs = set()
+        finished_jobs = self.as_completed()
         unprocessed_results = SortedListWithKey(key=lambda x: x[0])
         all_results = SortedListWithKey(key=lambda x: x[0])
         next_valid_index = -1
 
         # Main Loop, leave once we have enough material
         while True:
-            # Gather finished jobs
+            # Update information on scheduler state
+            # Only submit more jobs if:
+            # Number of jobs open < max_jobs
+            # Number of jobs open < self.scheduler_workers_running *
+            # worker_load_factor
+            # num_accepted_total < jobs required
+            # At least one job is kept running, to not wait idly
+            # until workers become available
+            if num_accepted_total < n:
+                n_jobs = max(int(np.minimum(self.client_max_jobs,
+                                            self.client_cores())), 1)
+                for _ in range(n_jobs - len(running_jobs)):
+                    job_id_batch = []
+                    for i in range(self.batchsize):
+                        job_id_batch.append(next_job_id)
+                        next_job_id += 1
+
+                    job = self.my_client.submit(full_submit_function,
+                                                simulate_one, self.batchsize,
+                                                job_id_batch)
+                    running_jobs.add(job)
+                    finished_jobs.add(job)
+
+            # Gather the next finished job, blocking until it is done
             # make sure to track and update both
             # total accepted and sequentially
             # accepted jobs
-            for curJob in running_jobs:
-                if curJob.done():
-                    remote_batch = curJob.result()
-                    running_jobs.remove(curJob)
-                    for i in range(self.batchsize):
-                        remote_evaluated = remote_batch[i]
-                        remote_result = remote_evaluated[0]
-                        remote_accept = remote_evaluated[1]
-                        remote_jobid = remote_evaluated[2]
-                        # print("Received result on job ", remote_jobid)
-                        unprocessed_results.add((remote_jobid, remote_accept,
-                                                 remote_result))
-                        if remote_accept:
-                            num_accepted_total += 1
-
-            if len(unprocessed_results) > 0:
-                next_index = unprocessed_results[0][0]
-            else:
-                next_index = np.nan
-            while next_index == next_valid_index+1:
+            curJob = next(finished_jobs)
+            running_jobs.remove(curJob)
+            for remote_result, remote_accept, remote_jobid \
+                    in curJob.result():
+                unprocessed_results.add((remote_jobid, remote_accept,
+                                         remote_result))
+                if remote_accept:
+                    num_accepted_total += 1
+
+            while (len(unprocessed_results) > 0
+                   and unprocessed_results[0][0] == next_valid_index + 1):
                 seq_evaluated = unprocessed_results.pop(0)
                 # add to all_results
                 all_results.add((seq_evaluated[0], seq_evaluated[2]))
@@ -69,38 +146,12 @@ class EPSMixin:
                 if seq_evaluated[1]:
                     num_accepted_sequential += 1
                 next_valid_index += 1
-                if len(unprocessed_results) > 0:
-                    next_index = unprocessed_results[0][0]
-                else:
-                    next_index = np.nan
 
             # If num_accepted >= n
             # return the first n accepted results
             if num_accepted_sequential >= n:
                 break
 
-            # Update information on scheduler state
-            # Only submit more jobs if:
-            # Number of jobs open < max_jobs
-            # Number of jobs open < self.scheduler_workers_running *
-            # worker_load_factor
-            # num_accepted_total < jobs required
-            if (len(running_jobs) < self.client_max_jobs) and \
-                    (len(running_jobs) < self.client_cores()) and \
-                    (num_accepted_total < n):
-                for _ in range(0,
-                               np.minimum(self.client_max_jobs,
-                                          self.client_cores()).astype(int)
-                               - len(running_jobs)):
-                    job_id_batch = []
-                    for i in range(self.batchsize):
-                        job_id_batch.append(next_job_id)
-                        next_job_id += 1
-
-                    running_jobs.append(
-                        self.my_client.submit(full_submit_function,
-                                              job_id_batch))
-
         # cancel all unfinished jobs
         for curJob in running_jobs:
             curJob.cancel()
@@ -1,10 +1,11 @@
 import functools
 import random
+from math import ceil
 
 import dill as pickle
 import numpy as np
 
-from .base import Sampler
+from .base import Sample, Sampler, simulate_batch
 
 
 class MappingSampler(Sampler):
@@ -109,12 +110,138 @@ latest/task.html#quick-and-easy-parallelism)
         self.nr_evaluations_ = sum(evals)
 
         # aggregate all results to 1 to-be-returned sample
-        sample = self._create_empty_sample()
-        for result in results:
-            sample += result
+        sample = Sample.merge(results)
 
         return sample
 
 
+class EvalParallelMappingSampler(MappingSampler):
+    """
+    Parallelize via a map operation, in waves of chunked tasks.
+
+    In contrast to the :class:`MappingSampler`, each mapped task
+    evaluates a fixed chunk of consecutive evaluation IDs, instead of
+    sampling until it gets one accepted particle. The tasks of a wave
+    are sized from the acceptance rate observed so far, s.t. the wave is
+    expected to yield all missing particles, times ``over_provisioning``.
+    The results are consumed in the order of the tasks, and
+    consumption stops as soon as enough particles are accepted. If
+    these are not enough, a further wave is submitted.
+    As in the evaluation parallel samplers, the accepted particles with
+    the smallest IDs are returned, which avoids a bias toward short
+    running evaluations.
+
+    Each wave is a single call of ``map``. If ``map`` returns an iterator,
+    e.g. ``multiprocessing.Pool.imap``, the results are consumed as they
+    arrive. Evaluations of tasks whose results are not consumed are not
+    counted. Tasks for which ``map`` returns an ``Exception`` are skipped,
+    but if all tasks of a wave fail, the first exception is raised.
+
+    Parameters
+    ----------
+
+    map: map like function
+        See :class:`MappingSampler`.
+
+    mapper_pickles: bool, optional
+        See :class:`MappingSampler`.
+
+    tasks_per_wave: int, optional
+        Maximum number of tasks per wave, e.g. the number of workers.
+        Defaults to the number of particles to sample.
+
+    over_provisioning: float, optional
+        Factor by which each wave exceeds the expected number of
+        necessary evaluations. Defaults to 1.2.
+    """
+
+    def __init__(self, map=map, mapper_pickles=False, tasks_per_wave=None,
+                 over_provisioning=1.2):
+        super().__init__(map=map, mapper_pickles=mapper_pickles)
+        self.tasks_per_wave = tasks_per_wave
+        self.over_provisioning = over_provisioning
+        # estimate from the previous waves and generations
+        self.acceptance_rate_ = 1.
+
+    def chunk_function(self, simulate_one, task):
+        """
+        Evaluate the chunk ``task = (first_id, chunk_size)``.
+
+        Returns
+        -------
+
+        id_results, nr_simulations: List[Tuple[int, Sample]], int
+            The ID of each accepted particle with the sample of this
+            particle and the rejected ones before it, and the
+            number of evaluations.
+        """
+        first_id, chunk_size = task
+        simulate_one = self.unpickle(simulate_one)
+
+        np.random.seed()
+        random.seed()
+        id_results = []
+        sample = self._create_empty_sample()
+
+        for n_evaluated, new_sim in enumerate(
+                simulate_batch(simulate_one, chunk_size)):
+            sample.append(new_sim)
+            if new_sim.accepted:
+                id_results.append((first_id + n_evaluated, sample))
+                sample = self._create_empty_sample()
+
+        return id_results, chunk_size
+
+    def sample_until_n_accepted(self, n, simulate_one):
+        sample_simulate_accept = self.pickle(simulate_one)
+        chunk_function = functools.partial(self.chunk_function,
+                                           sample_simulate_accept)
+        tasks_per_wave = self.tasks_per_wave or n
+
+        id_results = []
+        nr_evaluations = 0
+        next_id = 0
+        while len(id_results) < n:
+            n_evaluations = ceil((n - len(id_results))
+                                 / self.acceptance_rate_
+                                 * self.over_provisioning)
+            chunk_size = ceil(n_evaluations / tasks_per_wave)
+            tasks = [(first_id, chunk_size) for first_id in range(
+                next_id, next_id + n_evaluations, chunk_size)]
+            next_id = tasks[-1][0] + chunk_size
+
+            # failed tasks are skipped, as in the MappingSampler, unless
+            # the whole wave fails, which would be repeated forever
+            errors = []
+            n_succeeded = 0
+            for result in self.map(chunk_function, tasks):
+                if isinstance(result, Exception):
+                    errors.append(result)
+                    continue
+                n_succeeded += 1
+                chunk_results, nr_simulations = result
+                id_results.extend(chunk_results)
+                nr_evaluations += nr_simulations
+                if len(id_results) >= n:
+                    # the results of all earlier tasks are in,
+                    # later tasks can only yield larger IDs
+                    break
+            if n_succeeded == 0:
+                raise errors[0]
+
+            # biased upwards, to not overshoot after a wave
+            # without acceptances
+            self.acceptance_rate_ = ((len(id_results) + 1)
+                                     / (nr_evaluations + 1))
+
+        self.nr_evaluations_ = nr_evaluations
+
+        # avoid bias toward short running evaluations
+        id_results.sort(key=lambda x: x[0])
+        results = [res[1] for res in id_results[:n]]
+
+        return Sample.merge(results)
+
+
 def identity(x):
     return x
@@ -3,7 +3,9 @@ from .singlecore import SingleCoreSampler
 import numpy as np
 import random
 import logging
+from .base import Sample
 from .multicorebase import MultiCoreSampler, get_if_worker_healthy
+from .shared_arrays import export_arrays, import_arrays
 
 
 logger = logging.getLogger("MulticoreSampler")
@@ -19,7 +21,8 @@ def feed(feed_q, n_jobs, n_proc):
         feed_q.put(SENTINEL)
 
 
-def work(feed_q, result_q, simulate_one, single_core_sampler):
+def work(feed_q, result_q, simulate_one, single_core_sampler,
+         shared_arrays: bool):
     random.seed()
     np.random.seed()
 
@@ -30,6 +33,8 @@ def work(feed_q, result_q, simulate_one, single_core_sampler):
 
         res = single_core_sampler.sample_until_n_accepted(
             1, simulate_one)
+        if shared_arrays:
+            export_arrays(res)
         result_q.put((res, single_core_sampler.nr_evaluations_))
 
 
@@ -49,7 +54,7 @@ class MulticoreParticleParallelSampler(MultiCoreSampler):
     If your summary statistics are only a dict with a couple of numbers,
     the overhead should not be substantial.
     However, if your summary statistics are large numpy arrays
-    or similar, this could cause overhead
+    or similar, this could cause overhead, unless ``shared_arrays`` is set.
 
 
     Parameters
@@ -58,6 +63,11 @@ class MulticoreParticleParallelSampler(MultiCoreSampler):
             If set to None, the Number of cores is determined according to
             :func:`pyabc.sge.nr_cores_available`.
 
+        shared_arrays: bool, optional
+            Transmit large numpy arrays among the summary statistics via
+            shared memory instead of pickling them,
+            see :class:`pyabc.sampler.multicorebase.MultiCoreSampler`.
+
 
     .. warning::
 
@@ -83,7 +93,8 @@ class MulticoreParticleParallelSampler(MultiCoreSampler):
 
         worker_processes = [Process(target=work, args=(feed_q, result_q,
                                                        simulate_one,
-                                                       single_core_sampler))
+                                                       single_core_sampler,
+                                                       self.shared_arrays))
                             for _ in range(n_procs)]
 
         for proc in worker_processes:
@@ -95,6 +106,8 @@ class MulticoreParticleParallelSampler(MultiCoreSampler):
 
         for _ in range(n):
             res = get_if_worker_healthy(worker_processes, result_q)
+            if self.shared_arrays:
+                import_arrays(res[0])
             collected_results.append(res)
 
         feed_process.join()
@@ -109,8 +122,6 @@ class MulticoreParticleParallelSampler(MultiCoreSampler):
         self.nr_evaluations_ = sum(evaluations)
 
         # create 1 to-be-returned sample from results
-        sample = self._create_empty_sample()
-        for result in results:
-            sample += result
+        sample = Sample.merge(results)
 
         return sample
@@ -1,43 +1,154 @@
-from multiprocessing import Process, Queue, Value
+from multiprocessing import Process, ProcessError, Queue, Value
 from ctypes import c_longlong
+import heapq
+import pickle
+from .base import Sample, simulate_batch
+from . import payload
 from .multicorebase import MultiCoreSampler
 from ..sge import nr_cores_available
 import numpy as np
 import random
 from .multicorebase import get_if_worker_healthy
+from .shared_arrays import (export_arrays, import_arrays, release_arrays,
+                            remove_arrays)
+from .cancellation import SimulationCancelled, cancellable
 
-DONE = "Done"
+GENERATION = "Generation"
+LOOK_AHEAD = "LookAhead"
+
+# cutoff while fewer than n particles are accepted
+NO_CUTOFF = 2 ** 63 - 1
 
 
 def work(simulate_one,
-         queue, n_eval: Value, n_particles: Value, sample_factory):
+         queue, n_eval: Value, n_particles: Value, cutoff: Value,
+         generation: Value, sample_factory, batch_size: int,
+         shared_arrays: bool):
     random.seed()
     np.random.seed()
 
-    sample = sample_factory()
+    work_generation(simulate_one, generation.value, queue, n_eval,
+                    n_particles, cutoff, generation, sample_factory,
+                    batch_size, shared_arrays)
 
-    while n_particles.value > 0:
-        with n_eval.get_lock():
-            particle_id = n_eval.value
-            n_eval.value += 1
 
-        new_sim = simulate_one()
-        sample.append(new_sim)
+def work_persistent(task_queue, queue, n_eval: Value, n_particles: Value,
+                    cutoff: Value, n_look_ahead: Value, look_ahead: Value,
+                    generation: Value, shared_arrays: bool):
+    """
+    Worker of the persistent pool, which evaluates one generation per
+    task until it receives None. In between generations, it may receive
+    a look-ahead task.
+    """
+    random.seed()
+    np.random.seed()
+    # the static objects of the last task by hash, see
+    # :mod:`pyabc.sampler.payload`
+    static_objects = {}
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        kind, dump, new_static, static_hashes, args = pickle.loads(task)
+        static_objects = {
+            content_hash: (static_objects[content_hash]
+                           if content_hash in static_objects
+                           else pickle.loads(new_static[content_hash]))
+            for content_hash in static_hashes}
+        # on a copy, as all static objects are kept for the next task
+        obj = payload.loads(dump, new_static.__getitem__,
+                            dict(static_objects))
+        if kind == LOOK_AHEAD:
+            look_ahead_round, = args
+            work_look_ahead(obj, look_ahead_round, queue,
+                            n_look_ahead, look_ahead, shared_arrays)
+        else:
+            simulate_one, sample_factory = obj
+            task_generation, batch_size = args
+            work_generation(simulate_one, task_generation, queue, n_eval,
+                            n_particles, cutoff, generation, sample_factory,
+                            batch_size, shared_arrays)
+
+
+def work_look_ahead(simulate_look_ahead, look_ahead_round: int, queue,
+                    n_look_ahead: Value, look_ahead: Value,
+                    shared_arrays: bool):
+    """
+    Simulate particles of the next generation from the preliminary
+    proposal until the next generation starts.
+    Each particle is sent for evaluation in the parent process.
+    """
+    while True:
+        # the flag is only changed under the counter's lock, s.t. the
+        # next generation knows all IDs reserved for look-ahead
+        with n_look_ahead.get_lock():
+            if not look_ahead.value:
+                return
+            particle_id = n_look_ahead.value
+            n_look_ahead.value += 1
+
+        particle = simulate_look_ahead()
+        if shared_arrays:
+            export_arrays(particle)
+        queue.put((LOOK_AHEAD, look_ahead_round, particle_id, particle))
+
+
+def work_generation(simulate_one, task_generation: int,
+                    queue, n_eval: Value, n_particles: Value, cutoff: Value,
+                    generation: Value, sample_factory, batch_size: int,
+                    shared_arrays: bool):
+    """
+    Evaluate batches of particles of the generation ``task_generation``
+    until enough particles are accepted, or the master has moved on to
+    the next generation.
+    Every batch is reported with the range of its IDs, also if none of
+    its particles is accepted, s.t. the master knows which IDs are done.
+    """
+    sample = sample_factory()
 
-        if new_sim.accepted:
+    def outdated():
+        return generation.value != task_generation
 
+    while True:
+        # reserve the IDs of the whole batch before simulating
+        with n_eval.get_lock():
+            if n_particles.value <= 0 or outdated():
+                return
+            first_id = n_eval.value
+            n_eval.value += batch_size
+
+        # the batch is cancelled if none of its IDs can be among
+        # the first n accepted ones any more
+        try:
+            with cancellable(lambda: first_id > cutoff.value or outdated()):
+                new_sims = simulate_batch(simulate_one, batch_size)
+        except SimulationCancelled:
+            queue.put((GENERATION, task_generation, first_id, batch_size,
+                       []))
+            continue
+
+        accepted = []
+        for n_batched, new_sim in enumerate(new_sims):
+            sample.append(new_sim)
+
+            if new_sim.accepted:
+                if shared_arrays:
+                    export_arrays(sample)
+                accepted.append((first_id + n_batched, sample))
+
+                # create empty sample and record until next accepted
+                sample = sample_factory()
+
+        if len(accepted) > 0:
             # reduce number of required particles
-            with n_particles.get_lock():
-                n_particles.value -= 1
-
-            # put into queue
-            queue.put((particle_id, sample))
+            with n_eval.get_lock():
+                if not outdated():
+                    n_particles.value -= len(accepted)
 
-            # create empty sample and record until next accepted
-            sample = sample_factory()
-
-    # indicate worker finished
-    queue.put(DONE)
+        # put the chunk into queue
+        queue.put((GENERATION, task_generation, first_id, batch_size,
+                   accepted))
 
 
 class MulticoreEvalParallelSampler(MultiCoreSampler):
@@ -64,7 +175,7 @@ class MulticoreEvalParallelSampler(MultiCoreSampler):
     If your summary statistics are only a dict with a couple of numbers,
     the overhead should not be substantial.
     However, if your summary statistics are large numpy arrays
-    or similar, this could cause overhead
+    or similar, this could cause overhead, unless ``shared_arrays`` is set.
 
 
     Parameters
@@ -73,61 +184,349 @@ class MulticoreEvalParallelSampler(MultiCoreSampler):
     n_procs: int, optional
         If set to None, the Number of cores is determined according to
         :func:`pyabc.sge.nr_cores_available`.
+
+    persistent: bool, optional
+        If True, the worker processes are started once and kept alive
+        across generations, until :meth:`stop` is called, e.g. at the end
+        of :meth:`pyabc.ABCSMC.run` or when leaving a ``with`` block.
+        Each generation, the ``simulate_one`` function is then pickled
+        and sent to the workers. The objects listed in its
+        ``static_objects`` attribute, e.g. the models, priors and observed
+        data, are only sent when they change, see
+        :mod:`pyabc.sampler.payload`.
+        Defaults to False, i.e. fresh workers are forked per generation.
+
+    shared_arrays: bool, optional
+        Transmit large numpy arrays among the summary statistics via
+        shared memory instead of pickling them,
+        see :class:`pyabc.sampler.multicorebase.MultiCoreSampler`.
+
+    batch_size: int, optional
+        Number of model evaluations the workers perform before accessing
+        the shared counters and the queue again. Defaults to 1. Increase
+        this value if model evaluation times are short or the number of
+        cores is large to reduce lock contention.
+
+    look_ahead: bool, optional
+        If True, workers which become idle at the end of a generation,
+        once enough particles are accepted, do not wait for the remaining
+        evaluations, but already simulate particles of the next generation
+        from a preliminary proposal, fitted to the incomplete population.
+        These particles are evaluated once the next generation has
+        started, and are weighted according to the preliminary proposal
+        they were drawn from. They receive the first IDs of the next
+        generation. Requires a ``simulate_one`` function created by
+        :class:`pyabc.ABCSMC`, and implies ``persistent``.
+        Defaults to False.
     """
 
+    def __init__(self, n_procs=None, daemon=True, persistent=False,
+                 shared_arrays=False, batch_size=1, look_ahead=False):
+        super().__init__(n_procs=n_procs, daemon=daemon,
+                         shared_arrays=shared_arrays)
+        self.persistent = persistent or look_ahead
+        self.batch_size = batch_size
+        self.look_ahead = look_ahead
+        self._pool = None
+        self._look_ahead_results = []
+        self._look_ahead_round = 0
+        self._generation = 0
+        # the static objects held by the persistent workers
+        self._static_hashes = set()
+
     @property
     def n_procs(self):
         if self._n_procs is not None:
             return self._n_procs
         return nr_cores_available()
 
-    def sample_until_n_accepted(self, n, simulate_one):
-        n_eval = Value(c_longlong)
-        n_eval.value = 0
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        d["_pool"] = None
+        d["_look_ahead_results"] = []
+        return d
 
+    def _start_pool(self):
+        n_eval = Value(c_longlong)
         n_particles = Value(c_longlong)
-        n_particles.value = n
-
+        cutoff = Value(c_longlong)
+        n_look_ahead = Value(c_longlong)
+        look_ahead = Value(c_longlong)
+        generation = Value(c_longlong)
         queue = Queue()
-
+        task_queues = [Queue() for _ in range(self.n_procs)]
         processes = [
-            Process(target=work,
-                    args=(simulate_one,
-                          queue, n_eval, n_particles,
-                          self._create_empty_sample),
+            Process(target=work_persistent,
+                    args=(task_queue, queue, n_eval, n_particles, cutoff,
+                          n_look_ahead, look_ahead, generation,
+                          self.shared_arrays),
                     daemon=self.daemon)
-            for _ in range(self.n_procs)
+            for task_queue in task_queues
         ]
-
         for proc in processes:
             proc.start()
+        self._pool = (processes, task_queues, queue,
+                      n_eval, n_particles, cutoff, n_look_ahead, look_ahead,
+                      generation)
+        self._look_ahead_results = []
+        self._static_hashes = set()
+
+    def _dump_task(self, kind, obj, static_objects, *args):
+        """
+        Pickle a task for the persistent workers. The ``static_objects``
+        referenced by ``obj`` are only included if the workers do not
+        hold them from the previous task.
+        """
+        dump, static = payload.dumps(obj, static_objects)
+        new_static = {content_hash: static_dump
+                      for content_hash, static_dump in static.items()
+                      if content_hash not in self._static_hashes}
+        self._static_hashes = set(static)
+        return pickle.dumps((kind, dump, new_static, list(static), args))
+
+    def stop(self):
+        """
+        Shut down the persistent worker pool, if running.
+        """
+        if self._pool is None:
+            return
+        processes, task_queues = self._pool[:2]
+        n_look_ahead, look_ahead = self._pool[6:8]
+        self._pool = None
+        self._discard_look_ahead_results()
+        with n_look_ahead.get_lock():
+            look_ahead.value = 0
+        for proc, task_queue in zip(processes, task_queues):
+            if proc.is_alive():
+                task_queue.put(None)
+        for proc in processes:
+            proc.join(5)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+        self._remove_arrays(processes)
+
+    def _discard_look_ahead_results(self):
+        """
+        Discard the received look-ahead particles of the next generation.
+        """
+        if self.shared_arrays:
+            for _, _, particle in self._look_ahead_results:
+                release_arrays(particle)
+        self._look_ahead_results = []
+
+    def _remove_arrays(self, processes):
+        """
+        Remove the shared array files of the terminated ``processes``
+        which were not received.
+        """
+        if self.shared_arrays:
+            for proc in processes:
+                remove_arrays(proc.pid)
+
+    def _start_look_ahead(self, simulate_one, id_results, n):
+        """
+        Send the preliminary simulation function of the next generation,
+        created from the first ``n`` accepted results, to the workers.
+        """
+        try:
+            create_look_ahead = simulate_one.look_ahead
+        except AttributeError:
+            return
+        sample = Sample.merge([res[1] for res in heapq.nsmallest(
+            n, id_results, key=lambda x: x[0])])
+        self._look_ahead_round += 1
+        task = self._dump_task(
+            LOOK_AHEAD, create_look_ahead(sample),
+            getattr(simulate_one, "static_objects", []),
+            self._look_ahead_round)
+
+        task_queues = self._pool[1]
+        n_look_ahead, look_ahead = self._pool[6:8]
+        with n_look_ahead.get_lock():
+            n_look_ahead.value = 0
+            look_ahead.value = 1
+        for task_queue in task_queues:
+            task_queue.put(task)
+
+    def _receive_look_ahead(self, simulate_one, evaluate_look_ahead,
+                            particle_id, particle, id_results,
+                            rejected_results):
+        """
+        Evaluate a look-ahead particle for the current generation and add
+        it to the results, if the simulation function supports it.
+        Returns whether it was accepted.
+        """
+        if not evaluate_look_ahead:
+            if self.shared_arrays:
+                release_arrays(particle)
+            return False
+        if self.shared_arrays:
+            import_arrays(particle)
+        sample = self._create_empty_sample()
+        sample.append(simulate_one.evaluate_look_ahead(particle))
+        if particle.accepted:
+            id_results.append((particle_id, sample))
+        else:
+            rejected_results.append((particle_id, sample))
+        return particle.accepted
+
+    def sample_until_n_accepted(self, n, simulate_one):
+        self._generation += 1
+        if self.persistent:
+            if self._pool is None:
+                self._start_pool()
+            (processes, task_queues, queue, n_eval, n_particles, cutoff,
+             n_look_ahead, look_ahead, generation) = self._pool
+            task = self._dump_task(
+                GENERATION, (simulate_one, self.sample_factory),
+                getattr(simulate_one, "static_objects", []),
+                self._generation, self.batch_size)
+
+            # workers still busy with the previous generation stop, and
+            # the look-ahead stops, its particles take the first IDs
+            with n_eval.get_lock():
+                generation.value = self._generation
+                with n_look_ahead.get_lock():
+                    look_ahead.value = 0
+                    n_eval.value = n_look_ahead.value
+                    n_look_ahead.value = 0
+        else:
+            n_eval = Value(c_longlong)
+            n_particles = Value(c_longlong)
+            cutoff = Value(c_longlong)
+            generation = Value(c_longlong)
+            generation.value = self._generation
+            queue = Queue()
+            processes = [
+                Process(target=work,
+                        args=(simulate_one,
+                              queue, n_eval, n_particles, cutoff,
+                              generation, self._create_empty_sample,
+                              self.batch_size, self.shared_arrays),
+                        daemon=self.daemon)
+                for _ in range(self.n_procs)
+            ]
+            n_eval.value = 0
 
         id_results = []
+        # rejected look-ahead particles, to record their summary statistics
+        rejected_results = []
+        look_ahead_started = not self.look_ahead
+        previous_round = self._look_ahead_round
+        evaluate_look_ahead = hasattr(simulate_one, "evaluate_look_ahead")
+
+        # all IDs up to accounted_id are evaluated and received,
+        # the ranges of IDs received beyond are kept in a heap
+        accounted_id = -1
+        received_ranges = []
+
+        def account(first_id, last_id):
+            nonlocal accounted_id
+            heapq.heappush(received_ranges, (first_id, last_id))
+            while (len(received_ranges) > 0
+                   and received_ranges[0][0] <= accounted_id + 1):
+                accounted_id = max(accounted_id,
+                                   heapq.heappop(received_ranges)[1])
+
+        n_accepted = 0
+        for _, particle_id, particle in self._look_ahead_results:
+            account(particle_id, particle_id)
+            n_accepted += self._receive_look_ahead(
+                simulate_one, evaluate_look_ahead, particle_id, particle,
+                id_results, rejected_results)
+        self._look_ahead_results = []
+
+        n_particles.value = n - n_accepted
+        cutoff.value = NO_CUTOFF
+        if len(id_results) >= n:
+            cutoff.value = heapq.nsmallest(
+                n, (res[0] for res in id_results))[-1]
+
+        if self.persistent:
+            for task_queue in task_queues:
+                task_queue.put(task)
+        else:
+            for proc in processes:
+                proc.start()
+
+        # wait until n particles are accepted and all IDs up to the n-th
+        # accepted one are evaluated, but not for evaluations with larger
+        # IDs, which can not be among the first n accepted ones
+        try:
+            while len(id_results) < n or accounted_id < cutoff.value:
+                kind, tag, *content = get_if_worker_healthy(processes,
+                                                            queue)
+                if kind == LOOK_AHEAD:
+                    particle_id, particle = content
+                    if tag == previous_round:
+                        # from the previous generation's look-ahead
+                        account(particle_id, particle_id)
+                        if self._receive_look_ahead(
+                                simulate_one, evaluate_look_ahead,
+                                particle_id, particle,
+                                id_results, rejected_results):
+                            with n_eval.get_lock():
+                                n_particles.value -= 1
+                    elif tag == self._look_ahead_round:
+                        # for the next generation
+                        self._look_ahead_results.append(
+                            (tag, particle_id, particle))
+                    elif self.shared_arrays:
+                        # from an earlier, abandoned look-ahead
+                        release_arrays(particle)
+                elif tag == self._generation:
+                    first_id, batch_size, accepted = content
+                    account(first_id, first_id + batch_size - 1)
+                    for id_result in accepted:
+                        if self.shared_arrays:
+                            import_arrays(id_result[1])
+                        id_results.append(id_result)
+                elif self.shared_arrays:
+                    # a late result of an earlier generation
+                    for _, sample in content[2]:
+                        release_arrays(sample)
+                if len(id_results) >= n:
+                    # later evaluations can be cancelled
+                    cutoff.value = heapq.nsmallest(
+                        n, (res[0] for res in id_results))[-1]
+                    if not look_ahead_started:
+                        look_ahead_started = True
+                        self._start_look_ahead(simulate_one, id_results, n)
+        except ProcessError:
+            if self.persistent:
+                # a broken pool is restarted in the next generation
+                self._pool = None
+                self._discard_look_ahead_results()
+            for proc in processes:
+                proc.terminate()
+            for proc in processes:
+                proc.join()
+            self._remove_arrays(processes)
+            raise
 
-        # make sure all results are collected
-        # and the queue is emptied to prevent deadlocks
-        n_done = 0
-        while n_done < len(processes):
-            val = get_if_worker_healthy(processes, queue)
-            if val == DONE:
-                n_done += 1
-            else:
-                id_results.append(val)
+        self.nr_evaluations_ = n_eval.value
 
-        for proc in processes:
-            proc.join()
+        if not self.persistent:
+            # the remaining evaluations are not needed
+            for proc in processes:
+                proc.terminate()
+            for proc in processes:
+                proc.join()
+            self._remove_arrays(processes)
 
         # avoid bias toward short running evaluations
         id_results.sort(key=lambda x: x[0])
         id_results = id_results[:n]
 
-        self.nr_evaluations_ = n_eval.value
-
         results = [res[1] for res in id_results]
+        if len(rejected_results) > 0 and len(id_results) > 0:
+            # rejected look-ahead particles before the last accepted one
+            last_id = id_results[-1][0]
+            results.extend(res[1] for res in rejected_results
+                           if res[0] < last_id)
 
         # create 1 to-be-returned sample from results
-        sample = self._create_empty_sample()
-        for j in range(n):
-            sample += results[j]
+        sample = Sample.merge(results)
 
         return sample
@@ -10,12 +10,22 @@ class MultiCoreSampler(Sampler):
     Multi-core sampler base class. This sampler is not functional but provides
     the number of cores selection functionality used by all the multiprocessing
     samplers.
+
+    Parameters
+    ----------
+
+    shared_arrays: bool, optional
+        If True, large numpy arrays among the summary statistics are
+        transmitted from the workers via memory-mapped files in shared
+        memory instead of being pickled,
+        see :mod:`pyabc.sampler.shared_arrays`. Defaults to False.
     """
 
-    def __init__(self, n_procs=None, daemon=True):
+    def __init__(self, n_procs=None, daemon=True, shared_arrays=False):
         super().__init__()
         self._n_procs = n_procs
         self.daemon = daemon
+        self.shared_arrays = shared_arrays
 
     @property
     def n_procs(self):
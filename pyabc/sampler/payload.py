@@ -0,0 +1,112 @@
+"""
+Payload of the simulation function
+==================================
+
+The simulation function is sent to the workers anew in every generation.
+Large parts of it, e.g. the models, the priors and the observed data,
+do not change during a run. Such static objects are pickled separately,
+identified by the hash of their pickled content, and stored only once.
+The pickled simulation function only references them by hash,
+and the workers keep the static objects of the last generation in
+memory.
+"""
+
+import io
+import hashlib
+import pickle
+from typing import Callable, Dict, List, Tuple
+import cloudpickle
+
+
+class StaticPickler(cloudpickle.CloudPickler):
+    """
+    Pickler which replaces the static objects by their hashes.
+
+    Parameters
+    ----------
+
+    file:
+        The file to write to.
+
+    static_hashes: Dict[int, str]
+        The content hash for the ``id`` of each static object.
+    """
+
+    def __init__(self, file, static_hashes: Dict[int, str]):
+        super().__init__(file)
+        self.static_hashes = static_hashes
+
+    def persistent_id(self, obj):
+        return self.static_hashes.get(id(obj))
+
+
+class StaticUnpickler(pickle.Unpickler):
+    """
+    Unpickler which resolves the hashes of static objects via
+    ``load_static``.
+    """
+
+    def __init__(self, file, load_static: Callable[[str], object]):
+        super().__init__(file)
+        self.load_static = load_static
+
+    def persistent_load(self, pid):
+        return self.load_static(pid)
+
+
+def dumps(obj, static_objects: List) -> Tuple[bytes, Dict[str, bytes]]:
+    """
+    Pickle ``obj`` without the ``static_objects`` it references.
+
+    Returns
+    -------
+
+    payload, static: bytes, Dict[str, bytes]
+        The pickled object and the pickled static objects by hash.
+    """
+    static = {}
+    static_hashes = {}
+    for static_object in static_objects:
+        if static_object is None:
+            continue
+        dump = cloudpickle.dumps(static_object)
+        content_hash = hashlib.sha256(dump).hexdigest()
+        static[content_hash] = dump
+        static_hashes[id(static_object)] = content_hash
+
+    file = io.BytesIO()
+    StaticPickler(file, static_hashes).dump(obj)
+    return file.getvalue(), static
+
+
+def loads(payload: bytes, fetch_static: Callable[[str], bytes],
+          cache: Dict[str, object]):
+    """
+    Unpickle a payload created by :func:`dumps`.
+
+    Parameters
+    ----------
+
+    payload: bytes
+        The pickled object.
+
+    fetch_static: Callable[[str], bytes]
+        Returns the pickled static object for a hash.
+        Only called for hashes not in the cache.
+
+    cache: Dict[str, object]
+        The static objects by hash. Updated in place to hold only
+        the static objects of this payload.
+    """
+    used = {}
+
+    def load_static(content_hash):
+        if content_hash not in cache:
+            cache[content_hash] = pickle.loads(fetch_static(content_hash))
+        used[content_hash] = cache[content_hash]
+        return used[content_hash]
+
+    obj = StaticUnpickler(io.BytesIO(payload), load_static).load()
+    cache.clear()
+    cache.update(used)
+    return obj
@@ -2,19 +2,30 @@ import sys
 import socket
 import signal
 from redis import StrictRedis
-import pickle
 import os
-import cloudpickle
+import threading
+import uuid
+from math import ceil
 from time import time
 import click
 from .redis_logging import worker_logger
-from .cmd import (N_WORKER, SSA, N_PARTICLES, N_EVAL, QUEUE, START, STOP,
-                  MSG, BATCH_SIZE)
+from ..base import simulate_batch
+from ..cancellation import SimulationCancelled, cancellable
+from .cmd import (WORKERS, LEASE, LEASE_TIME, SSA, N_PARTICLES, N_EVAL,
+                  QUEUE, START, STOP, MSG, BATCH_SIZE, CUTOFF, STATIC,
+                  MAX_OVERHEAD, MAX_BATCH_SIZE, RUNS, RUNS_VERSION, FAIR,
+                  PRIORITY, GENERATION, IN_FLIGHT, RESERVE_BATCH,
+                  REPORT_BATCH, SLEEP_TIME, key, live_workers)
+from .. import payload
+from . import frame
 from multiprocessing import Pool
 import numpy as np
 import random
 
 
+# the static objects of the last population, by content hash
+_static_cache = {}
+
 TIMES = {"s": 1,
          "m": 60,
          "h": 3600,
@@ -40,38 +51,296 @@ class KillHandler:
             sys.exit(0)
 
 
+class WorkerLease:
+    """
+    Registration of a worker at the population of a run.
+
+    The registration is kept alive by a heartbeat thread, also during
+    long simulations. If the worker dies, e.g. on a preempted node,
+    its lease expires after ``LEASE_TIME`` seconds, and the master does
+    not wait for it any longer.
+
+    Parameters
+    ----------
+
+    redis: StrictRedis
+        The Redis connection.
+
+    run_id: str
+        The run.
+    """
+
+    def __init__(self, redis: StrictRedis, run_id: str):
+        self.redis = redis
+        self.run_id = run_id
+        self.worker_id = "{}-{}-{}".format(socket.gethostname(), os.getpid(),
+                                           uuid.uuid4().hex[:8])
+        self._lease_key = key(run_id, LEASE + self.worker_id)
+        self._released = threading.Event()
+        self._heartbeat = threading.Thread(target=self._renew, daemon=True)
+
+    def acquire(self) -> int:
+        """
+        Register the worker and start the heartbeat.
+
+        Returns
+        -------
+
+        n_worker: int
+            The number of registered workers of the run.
+        """
+        pipeline = self.redis.pipeline()
+        pipeline.set(self._lease_key, 1, ex=LEASE_TIME)
+        pipeline.sadd(key(self.run_id, WORKERS), self.worker_id)
+        pipeline.scard(key(self.run_id, WORKERS))
+        n_worker = pipeline.execute()[-1]
+        self._heartbeat.start()
+        return n_worker
+
+    def _renew(self):
+        while not self._released.wait(LEASE_TIME / 3):
+            self.redis.set(self._lease_key, 1, ex=LEASE_TIME)
+
+    def release(self):
+        """
+        Stop the heartbeat and unregister the worker.
+        """
+        self._released.set()
+        self._heartbeat.join()
+        pipeline = self.redis.pipeline()
+        pipeline.srem(key(self.run_id, WORKERS), self.worker_id)
+        pipeline.delete(self._lease_key)
+        pipeline.execute()
+
+
+def cutoff_exceeded(redis: StrictRedis, run_id: str,
+                    particle_id: int, generation: bytes) -> bool:
+    """
+    Whether the master has already collected n accepted particles with
+    smaller IDs than ``particle_id``, or has finished the population
+    ``generation``.
+    """
+    pipeline = redis.pipeline()
+    pipeline.get(key(run_id, CUTOFF))
+    pipeline.get(key(run_id, GENERATION))
+    cutoff, current_generation = pipeline.execute()
+    return (current_generation != generation
+            or (cutoff is not None and particle_id > int(cutoff.decode())))
+
+
+class CutoffCheck:
+    """
+    Cancellation check of a batch, see :func:`cutoff_exceeded`.
+
+    Models may poll the check in tight loops, hence Redis is queried at
+    most once every ``SLEEP_TIME`` seconds, and the last answer is
+    returned in between. Once exceeded, the cutoff stays exceeded.
+
+    Parameters
+    ----------
+
+    redis: StrictRedis
+        The Redis connection.
+
+    run_id: str
+        The run.
+
+    particle_id: int
+        The smallest ID of the batch.
+
+    generation: bytes
+        The population the batch belongs to.
+    """
+
+    def __init__(self, redis: StrictRedis, run_id: str, particle_id: int,
+                 generation: bytes):
+        self.redis = redis
+        self.run_id = run_id
+        self.particle_id = particle_id
+        self.generation = generation
+        self._exceeded = False
+        self._last_query = None
+
+    def __call__(self) -> bool:
+        now = time()
+        if not self._exceeded and (self._last_query is None
+                                   or now - self._last_query >= SLEEP_TIME):
+            self._last_query = now
+            self._exceeded = cutoff_exceeded(
+                self.redis, self.run_id, self.particle_id, self.generation)
+        return self._exceeded
+
+
+def adapt_batch_size(simulation_time: float, latency: float,
+                     max_overhead: float, n_particles: int,
+                     acceptance_rate: float, n_worker: int) -> int:
+    """
+    Batch size for which the communication overhead stays below the
+    target fraction, but which does not exceed this worker's share of the
+    evaluations still expected to be necessary in this population.
+
+    Parameters
+    ----------
+
+    simulation_time: float
+        Mean time of a single evaluation.
+
+    latency: float
+        Mean time of the communication with the Redis server per batch.
+
+    max_overhead: float
+        Target upper bound of latency / (latency + batch time).
+
+    n_particles: int
+        Number of particles still to be accepted.
+
+    acceptance_rate: float
+        Estimated acceptance rate.
+
+    n_worker: int
+        Number of workers working on the population.
+
+    Returns
+    -------
+
+    batch_size: int
+        Between 1 and ``MAX_BATCH_SIZE``.
+    """
+    if simulation_time > 0:
+        batch_size = ceil(latency * (1 - max_overhead)
+                          / (max_overhead * simulation_time))
+    else:
+        batch_size = MAX_BATCH_SIZE
+    # avoid over-simulation near the end of the population
+    share = n_particles / acceptance_rate / max(n_worker, 1)
+    batch_size = min(batch_size, ceil(share), MAX_BATCH_SIZE)
+    return max(batch_size, 1)
+
+
+def choose_run(redis: StrictRedis, scheduling: str, current: str = None):
+    """
+    Choose the run to work on among the runs with a population in
+    progress.
+
+    With ``FAIR`` scheduling, the run with the fewest workers is chosen,
+    the priority breaks ties. With ``PRIORITY`` scheduling, the run with
+    the highest priority is chosen, the number of workers breaks ties.
+
+    Parameters
+    ----------
+
+    redis: StrictRedis
+        The Redis connection.
+
+    scheduling: str
+        ``FAIR`` or ``PRIORITY``.
+
+    current: str, optional
+        The run the worker currently works on. It is not counted among
+        its workers, and kept on ties.
+
+    Returns
+    -------
+
+    run_id: str
+        The chosen run, or None if no population is in progress.
+    """
+    runs = redis.zrange(RUNS, 0, -1, withscores=True)
+    pipeline = redis.pipeline()
+    for run_id, _ in runs:
+        pipeline.get(key(run_id.decode(), N_PARTICLES))
+        pipeline.scard(key(run_id.decode(), WORKERS))
+    replies = pipeline.execute()
+
+    candidates = []
+    for (run_id, priority), n_particles, n_worker in zip(
+            runs, replies[::2], replies[1::2]):
+        run_id = run_id.decode()
+        if n_particles is None or int(n_particles.decode()) <= 0:
+            continue
+        is_other = run_id != current
+        if not is_other:
+            n_worker -= 1
+        if scheduling == PRIORITY:
+            rank = (-priority, n_worker, is_other)
+        else:
+            rank = (n_worker, -priority, is_other)
+        candidates.append((rank, run_id))
+
+    if len(candidates) == 0:
+        return None
+    return min(candidates)[1]
+
+
+def work_on_runs(redis: StrictRedis,
+                 start_time: int,
+                 max_runtime_s: int,
+                 kill_handler: KillHandler,
+                 scheduling: str = FAIR):
+    """
+    Work on the populations of all runs, until none is in progress.
+    """
+    while True:
+        run_id = choose_run(redis, scheduling)
+        if run_id is None:
+            return
+        work_on_population(redis, start_time, max_runtime_s, kill_handler,
+                           run_id, scheduling)
+        if time() - start_time > max_runtime_s:
+            return
+
+
 def work_on_population(redis: StrictRedis,
                        start_time: int,
                        max_runtime_s: int,
-                       kill_handler: KillHandler):
+                       kill_handler: KillHandler,
+                       run_id: str,
+                       scheduling: str = FAIR):
     population_start_time = time()
     cumulative_simulation_time = 0
 
     pipeline = redis.pipeline()
-    pipeline.get(SSA)
-    pipeline.get(N_PARTICLES)
-    pipeline.get(BATCH_SIZE)
-    ssa, n_particles_bytes, batch_size_bytes = pipeline.execute()
+    pipeline.get(key(run_id, SSA))
+    pipeline.get(key(run_id, N_PARTICLES))
+    pipeline.get(key(run_id, BATCH_SIZE))
+    pipeline.get(key(run_id, MAX_OVERHEAD))
+    pipeline.get(RUNS_VERSION)
+    pipeline.get(key(run_id, GENERATION))
+    (ssa, n_particles_bytes, batch_size_bytes,
+     max_overhead_bytes, runs_version, generation) = pipeline.execute()
 
     if ssa is None:
         return
 
     kill_handler.exit = False
 
-    n_particles_bytes = redis.get(N_PARTICLES)
-    if n_particles_bytes is None:
+    if n_particles_bytes is None or generation is None:
         return
     n_particles = int(n_particles_bytes.decode())
     batch_size = int(batch_size_bytes.decode())
-
-    # load sampler options
-    simulate_one, sample_factory = pickle.loads(ssa)
-
-    n_worker = redis.incr(N_WORKER)
-    worker_logger.info(f"Begin population, "
+    # None if the batch size is fixed
+    max_overhead = (float(max_overhead_bytes.decode())
+                    if max_overhead_bytes is not None else None)
+
+    # load sampler options, the static objects are fetched only if
+    # they changed since the last population
+    simulate_one, sample_factory = payload.loads(
+        ssa,
+        lambda content_hash: redis.get(key(run_id, STATIC + content_hash)),
+        _static_cache)
+
+    reserve_batch = redis.register_script(RESERVE_BATCH)
+    report_batch = redis.register_script(REPORT_BATCH)
+
+    lease = WorkerLease(redis, run_id)
+    n_worker = lease.acquire()
+    worker_logger.info(f"Begin population of run {run_id}, "
                        f"batch size {batch_size}. "
                        f"I am worker {n_worker}")
     internal_counter = 0
+    n_accepted = 0
+    n_batches = 0
+    cumulative_communication_time = 0
 
     # create empty sample
     sample = sample_factory()
@@ -82,7 +351,7 @@ def work_on_population(redis: StrictRedis,
                                "Terminating in the middle of a population"
                                " after {} samples."
                                .format(n_worker, internal_counter))
-            redis.decr(N_WORKER)
+            lease.release()
             sys.exit(0)
 
         current_runtime = time() - start_time
@@ -91,39 +360,90 @@ def work_on_population(redis: StrictRedis,
                                "max runtime {} is exceeded {}"
                                .format(n_worker, max_runtime_s,
                                        current_runtime))
-            redis.decr(N_WORKER)
+            lease.release()
+            kill_handler.exit = True
             return
 
-        particle_max_id = redis.incr(N_EVAL, batch_size)
+        communication_start = time()
+        particle_max_id = reserve_batch(
+            keys=[key(run_id, GENERATION), key(run_id, N_EVAL),
+                  key(run_id, IN_FLIGHT)],
+            args=[generation, batch_size, lease.worker_id])
+        cumulative_communication_time += time() - communication_start
+        if particle_max_id < 0:
+            # the master has finished the population
+            break
 
         this_sim_start = time()
+        # the batch is cancelled if none of its IDs can be among
+        # the first n accepted ones any more
+        min_id = particle_max_id - batch_size + 1
+        try:
+            with cancellable(CutoffCheck(redis, run_id, min_id,
+                                         generation)):
+                new_sims = simulate_batch(simulate_one, batch_size)
+        except SimulationCancelled:
+            worker_logger.debug("Worker {} cancelled a batch."
+                                .format(n_worker))
+            new_sims = []
         accepted_samples = []
-        for n_batched in range(batch_size):
-            new_sim = simulate_one()
+        for n_batched, new_sim in enumerate(new_sims):
             sample.append(new_sim)
             internal_counter += 1
             if new_sim.accepted:
                 # the order of the IDs is reversed, but this does not
                 # matter. Important is only that the IDs are specified
                 # before the simulation starts
-                accepted_samples.append(cloudpickle.dumps((particle_max_id -
-                                                           n_batched, sample)))
+                accepted_samples.append(frame.encode(particle_max_id -
+                                                     n_batched, sample))
                 sample = sample_factory()
         cumulative_simulation_time += time() - this_sim_start
 
-        if len(accepted_samples) > 0:
-            pipeline = redis.pipeline()
-            pipeline.decr(N_PARTICLES, len(accepted_samples))
-            pipeline.rpush(QUEUE, *accepted_samples)
-            n_particles, _ = pipeline.execute()
-        else:
-            n_particles = int(redis.get(N_PARTICLES).decode())
-
-    redis.decr(N_WORKER)
+        communication_start = time()
+        # also batches without accepted particles are reported, s.t.
+        # the master knows which IDs are evaluated. Once the master has
+        # finished the population, the results are discarded.
+        pipeline = redis.pipeline()
+        report_batch(
+            keys=[key(run_id, GENERATION), key(run_id, N_PARTICLES),
+                  key(run_id, QUEUE), key(run_id, IN_FLIGHT)],
+            args=[generation, lease.worker_id, *accepted_samples],
+            client=pipeline)
+        pipeline.scard(key(run_id, WORKERS))
+        pipeline.get(RUNS_VERSION)
+        (n_particles, n_registered,
+         new_runs_version) = pipeline.execute()
+        cumulative_communication_time += time() - communication_start
+        n_accepted += len(accepted_samples)
+        n_batches += 1
+
+        if max_overhead is not None and internal_counter > 0:
+            # the acceptance rate estimate is biased upwards, to rather
+            # choose too small batches before the first acceptance
+            batch_size = adapt_batch_size(
+                cumulative_simulation_time / internal_counter,
+                cumulative_communication_time / n_batches,
+                max_overhead, n_particles,
+                (n_accepted + 1) / (internal_counter + 1),
+                n_registered)
+
+        if new_runs_version != runs_version:
+            # another run started or finished a population
+            runs_version = new_runs_version
+            if (n_particles > 0 and choose_run(redis, scheduling, run_id)
+                    != run_id):
+                worker_logger.info("Worker {} leaves run {} for another "
+                                   "run.".format(n_worker, run_id))
+                break
+
+    lease.release()
     kill_handler.exit = True
     population_total_time = time() - population_start_time
     worker_logger.info(f"Finished population, did {internal_counter} samples. "
                        f"Simulation time: {cumulative_simulation_time:.2f}s, "
+                       f"communication time: "
+                       f"{cumulative_communication_time:.2f}s, "
+                       f"final batch size {batch_size}, "
                        f" total time {population_total_time:.2f}.")
 
 
@@ -139,19 +459,26 @@ def work_on_population(redis: StrictRedis,
                    'a day you could do 0.5d.')
 @click.option('--processes', type=int, default=1, help="The number of worker "
                                                        "processes to start")
-def work(host="localhost", port=6379, runtime="2h", processes=1):
+@click.option('--scheduling', type=click.Choice([FAIR, PRIORITY]),
+              default=FAIR,
+              help="How to choose among several concurrent ABC runs. "
+                   "'fair' joins the run with the fewest workers, "
+                   "'priority' the run with the highest priority.")
+def work(host="localhost", port=6379, runtime="2h", processes=1,
+         scheduling=FAIR):
     # start a single process right here, not within pool
     # this handles the problem of starting a daemon process within a
     # daemon process
     if processes == 1:
-        return _work(host, port, runtime)
+        return _work(host, port, runtime, scheduling)
 
     with Pool(processes) as pool:
-        res = pool.starmap(_work, [(host, port, runtime)] * processes)
+        res = pool.starmap(_work,
+                           [(host, port, runtime, scheduling)] * processes)
     return res
 
 
-def _work(host="localhost", port=6379, runtime="2h"):
+def _work(host="localhost", port=6379, runtime="2h", scheduling=FAIR):
     np.random.seed()
     random.seed()
 
@@ -174,7 +501,8 @@ def _work(host="localhost", port=6379, runtime="2h"):
 
         # check if it is int to (first iteration) run at least once
         if data == START or isinstance(data, int):
-            work_on_population(redis, start_time, max_runtime_s, kill_handler)
+            work_on_runs(redis, start_time, max_runtime_s, kill_handler,
+                         scheduling)
 
         if data == STOP:
             worker_logger.info("Received stop signal. Shutdown redis worker.")
@@ -191,12 +519,13 @@ def _work(host="localhost", port=6379, runtime="2h"):
                     "The command can be 'info' or 'stop'. "
                     "For 'stop' the workers are shut down cleanly "
                     "after the current population. "
-                    "For 'info' you'll see how many workers are connected, "
+                    "For 'info' you'll see for each run with a population "
+                    "in progress how many workers are connected, "
                     "how many evaluations the current population has, and "
                     "how many particles are still missing. "
-                    "For 'reset-workers', the worker count will be resetted to"
-                    "zero. This does not cancel the sampling. This is useful "
-                    "if workers were unexpectedly killed.")
+                    "For 'reset-workers', all workers are unregistered. "
+                    "This does not cancel the sampling. Killed workers are "
+                    "unregistered automatically once their lease expires.")
 @click.option('--host', default="localhost", help='Redis host.')
 @click.option('--port', default=6379, type=int, help='Redis port.')
 @click.argument('command', type=str)
@@ -206,17 +535,22 @@ def manage(command, host="localhost", port=6379):
 
 def _manage(command, host="localhost", port=6379):
     redis = StrictRedis(host=host, port=port)
+    runs = redis.zrange(RUNS, 0, -1, withscores=True)
     if command == "info":
-        pipe = redis.pipeline()
-        pipe.get(N_WORKER)
-        pipe.get(N_EVAL)
-        pipe.get(N_PARTICLES)
-        res = pipe.execute()
-        res = [r.decode() if r is not None else r for r in res]
-        print("Workers={} Evaluations={} Particles={}".format(*res))
+        for run_id, priority in runs:
+            run_id = run_id.decode()
+            pipe = redis.pipeline()
+            pipe.get(key(run_id, N_EVAL))
+            pipe.get(key(run_id, N_PARTICLES))
+            res = pipe.execute()
+            res = [live_workers(redis, run_id)] + [
+                r.decode() if r is not None else r for r in res]
+            print("Run={} Priority={} Workers={} Evaluations={} "
+                  "Particles={}".format(run_id, priority, *res))
     elif command == "stop":
         redis.publish(MSG, STOP)
     elif command == "reset-workers":
-        redis.set(N_WORKER, 0)
+        for run_id, _ in runs:
+            redis.delete(key(run_id.decode(), WORKERS))
     else:
         print("Unknown command:", command)
@@ -1,11 +1,107 @@
+from typing import List
+
+# keys of a run, namespaced via key(run_id, ...)
 QUEUE = "queue"
 N_EVAL = "n_eval"
 N_PARTICLES = "n_particles"
 SSA = "sample_simulate_accept"
-N_WORKER = "n_workers"
+WORKERS = "workers"
+LEASE = "lease_"
+GENERATION = "generation"
+IN_FLIGHT = "in_flight"
+BATCH_SIZE = "batch_size"
+MAX_OVERHEAD = "max_overhead"
+CUTOFF = "cutoff"
+STATIC = "static_"
 
+# global keys, shared by all runs
+RUNS = "runs"
+RUNS_VERSION = "runs_version"
 MSG = "msg_pubsub"
+
+# messages published on MSG
 START = "start"
 STOP = "stop"
-BATCH_SIZE = "batch_size"
+
 SLEEP_TIME = .1
+# seconds until the registration of a dead worker expires
+LEASE_TIME = 30
+MAX_BATCH_SIZE = 1000
+RESULT_CHUNK = 1000
+
+# worker scheduling among concurrent runs
+FAIR = "fair"
+PRIORITY = "priority"
+
+
+def key(run_id: str, name: str) -> str:
+    """
+    The key ``name`` in the namespace of the run ``run_id``.
+    """
+    return "{}:{}".format(run_id, name)
+
+
+def live_workers(redis, run_id: str) -> int:
+    """
+    Number of workers of the run ``run_id`` with a valid lease.
+    Workers whose lease has expired are unregistered.
+    """
+    worker_ids = list(redis.smembers(key(run_id, WORKERS)))
+    if len(worker_ids) == 0:
+        return 0
+    pipeline = redis.pipeline()
+    for worker_id in worker_ids:
+        pipeline.exists(key(run_id, LEASE + worker_id.decode()))
+    dead = [worker_id for worker_id, alive
+            in zip(worker_ids, pipeline.execute()) if not alive]
+    if len(dead) > 0:
+        redis.srem(key(run_id, WORKERS), *dead)
+    return len(worker_ids) - len(dead)
+
+
+# Reserve the IDs of a batch and register them as in flight, unless the
+# population of the worker is over.
+# KEYS: generation, n_eval, in_flight. ARGV: generation, batch size, worker.
+# Returns the largest reserved ID, or -1.
+RESERVE_BATCH = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return -1
+end
+local max_id = redis.call('INCRBY', KEYS[2], ARGV[2])
+redis.call('HSET', KEYS[3], ARGV[3], max_id - tonumber(ARGV[2]) + 1)
+return max_id
+"""
+
+# Push the accepted results of a batch and unregister it as in flight,
+# unless the population of the worker is over.
+# KEYS: generation, n_particles, queue, in_flight.
+# ARGV: generation, worker, results.
+# Returns the number of particles still required, or -1.
+REPORT_BATCH = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return -1
+end
+redis.call('HDEL', KEYS[4], ARGV[2])
+if #ARGV > 2 then
+    redis.call('RPUSH', KEYS[3], unpack(ARGV, 3))
+    return redis.call('DECRBY', KEYS[2], #ARGV - 2)
+end
+return tonumber(redis.call('GET', KEYS[2]))
+"""
+
+
+def in_flight_ids(redis, run_id: str) -> List[int]:
+    """
+    The smallest IDs of the batches which live workers of the run
+    ``run_id`` are evaluating. The batches of dead workers are dropped.
+    """
+    live_workers(redis, run_id)
+    pipeline = redis.pipeline()
+    pipeline.hgetall(key(run_id, IN_FLIGHT))
+    pipeline.smembers(key(run_id, WORKERS))
+    in_flight, workers = pipeline.execute()
+    dead = [worker_id for worker_id in in_flight if worker_id not in workers]
+    if len(dead) > 0:
+        redis.hdel(key(run_id, IN_FLIGHT), *dead)
+    return [int(min_id) for worker_id, min_id in in_flight.items()
+            if worker_id in workers]
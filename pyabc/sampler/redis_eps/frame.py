@@ -0,0 +1,177 @@
+"""
+Binary result frames
+====================
+
+The workers send each accepted particle, together with the rejected
+particles recorded before it, as one frame to the master.
+Instead of pickling the :class:`pyabc.sampler.Sample` as a whole, the
+model indices, weights, parameters and distances are packed column-wise
+into numpy arrays, and numpy arrays among the summary statistics are
+stored as raw buffers. Only a small skeleton of the remaining structure
+is pickled. The master creates the columns directly on top of the
+received bytes, without copying them. The arrays among the summary
+statistics are copied once, s.t. they are writeable and do not keep the
+whole frame alive.
+
+If a parameter value is not a float, the sample is pickled instead.
+"""
+
+import struct
+import pickle
+from typing import Tuple
+import cloudpickle
+import numpy as np
+from ...parameters import Parameter
+from ...population import Particle
+from ..base import Sample
+
+
+# kind of frame, length of the pickled skeleton
+HEADER = struct.Struct("<BQ")
+PICKLED = 0
+COLUMNAR = 1
+
+# buffers start at multiples of this number of bytes
+ALIGNMENT = 8
+
+
+class ArrayRef:
+    """
+    Placeholder of a numpy array stored in the buffer section of a frame.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+
+
+def _padding(nbytes: int) -> int:
+    return -nbytes % ALIGNMENT
+
+
+def encode(particle_id: int, sample: Sample) -> bytes:
+    """
+    Encode the sample with the ID of its accepted particle into a frame.
+    """
+    particles = sample._accepted_particles + sample._rejected_particles
+    if not all(isinstance(value, float)
+               for particle in particles
+               for value in particle.parameter.values()):
+        return (HEADER.pack(PICKLED, 0)
+                + cloudpickle.dumps((particle_id, sample)))
+
+    key_sets = {}
+    key_indices = [key_sets.setdefault(tuple(particle.parameter.keys()),
+                                       len(key_sets))
+                   for particle in particles]
+    buffers = [
+        np.array([particle.m for particle in particles], dtype=np.int64),
+        np.array([particle.weight for particle in particles],
+                 dtype=np.float64),
+        np.array(key_indices, dtype=np.int64),
+        np.array([value for particle in particles
+                  for value in particle.parameter.values()],
+                 dtype=np.float64),
+        np.array([len(particle.accepted_distances)
+                  for particle in particles], dtype=np.int64),
+        np.array([distance for particle in particles
+                  for distance in particle.accepted_distances],
+                 dtype=np.float64),
+    ]
+
+    # shared summary statistics dictionaries are replaced only once
+    skeletons = {}
+
+    def skeleton(sum_stat):
+        if not isinstance(sum_stat, dict):
+            return sum_stat
+        if id(sum_stat) not in skeletons:
+            replaced = {}
+            for key, value in sum_stat.items():
+                if (isinstance(value, np.ndarray)
+                        and not value.dtype.hasobject):
+                    buffers.append(np.ascontiguousarray(value))
+                    value = ArrayRef(len(buffers) - 1)
+                replaced[key] = value
+            skeletons[id(sum_stat)] = replaced
+        return skeletons[id(sum_stat)]
+
+    sum_stats = [([skeleton(sum_stat)
+                   for sum_stat in particle.accepted_sum_stats],
+                  [skeleton(sum_stat)
+                   for sum_stat in particle.all_sum_stats])
+                 for particle in particles]
+
+    meta = cloudpickle.dumps((
+        particle_id, sample.record_all_sum_stats,
+        len(sample._accepted_particles), list(key_sets), sum_stats,
+        [(buffer.dtype.str, buffer.shape) for buffer in buffers]))
+
+    chunks = [HEADER.pack(COLUMNAR, len(meta)), meta,
+              bytes(_padding(HEADER.size + len(meta)))]
+    for buffer in buffers:
+        chunks.append(buffer.tobytes())
+        chunks.append(bytes(_padding(buffer.nbytes)))
+    return b"".join(chunks)
+
+
+def decode(frame: bytes) -> Tuple[int, Sample]:
+    """
+    Decode a frame created by :func:`encode`.
+
+    Returns
+    -------
+
+    particle_id, sample: int, Sample
+        The ID of the accepted particle and the sample.
+    """
+    kind, meta_length = HEADER.unpack_from(frame)
+    if kind == PICKLED:
+        return pickle.loads(frame[HEADER.size:])
+
+    offset = HEADER.size + meta_length
+    (particle_id, record_all_sum_stats, n_accepted, key_sets, sum_stats,
+     specs) = pickle.loads(frame[HEADER.size:offset])
+    offset += _padding(offset)
+
+    buffers = []
+    for dtype, shape in specs:
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        buffers.append(np.frombuffer(frame, dtype=dtype, count=count,
+                                     offset=offset).reshape(shape))
+        nbytes = count * dtype.itemsize
+        offset += nbytes + _padding(nbytes)
+    ms, weights, key_indices, values, n_distances, distances = buffers[:6]
+
+    # resolve the array references, each skeleton only once
+    resolved = {}
+
+    def resolve(sum_stat):
+        if not isinstance(sum_stat, dict):
+            return sum_stat
+        if id(sum_stat) not in resolved:
+            for key, value in sum_stat.items():
+                if isinstance(value, ArrayRef):
+                    # views on the frame would be read-only
+                    sum_stat[key] = buffers[value.index].copy()
+            resolved[id(sum_stat)] = sum_stat
+        return sum_stat
+
+    sample = Sample(record_all_sum_stats)
+    value_offset = 0
+    distance_offset = 0
+    for index, (accepted_sum_stats, all_sum_stats) in enumerate(sum_stats):
+        keys = key_sets[key_indices[index]]
+        parameter = Parameter(dict(zip(
+            keys, values[value_offset:value_offset + len(keys)].tolist())))
+        value_offset += len(keys)
+        n = int(n_distances[index])
+        particle = Particle(
+            int(ms[index]), parameter, float(weights[index]),
+            distances[distance_offset:distance_offset + n].tolist(),
+            [resolve(sum_stat) for sum_stat in accepted_sum_stats],
+            [resolve(sum_stat) for sum_stat in all_sum_stats],
+            index < n_accepted)
+        distance_offset += n
+        sample.append(particle)
+    return particle_id, sample
@@ -3,11 +3,13 @@ from subprocess import Popen
 from multiprocessing import Process
 import psutil
 from .cli import work, _manage
+from .cmd import MSG
 from .sampler import RedisEvalParallelSampler
 
 
 class RedisEvalParallelSamplerServerStarter(RedisEvalParallelSampler):
-    def __init__(self, host="localhost", port=6379, batch_size=1):
+    def __init__(self, host="localhost", port=6379, batch_size=1,
+                 adapt_batch_size=False, max_overhead=.05):
         conn = psutil.net_connections()
         ports = [c.laddr[1] for c in conn]
         port = max(ports) + 1
@@ -15,7 +17,9 @@ class RedisEvalParallelSamplerServerStarter(RedisEvalParallelSampler):
         self.__redis_server = Popen(["redis-server", "--port", str(port)])
         sleep(1)
 
-        super().__init__(host, port, batch_size=batch_size)
+        super().__init__(host, port, batch_size=batch_size,
+                         adapt_batch_size=adapt_batch_size,
+                         max_overhead=max_overhead)
 
         self.__worker = [
             Process(target=work,
@@ -26,6 +30,14 @@ class RedisEvalParallelSamplerServerStarter(RedisEvalParallelSampler):
         for p in self.__worker:
             p.start()
 
+        # messages published before the workers subscribed, e.g. the
+        # stop message of cleanup, would be lost
+        while (self.redis.pubsub_numsub(MSG)[0][1]
+               < len(self.__worker)):
+            if not all(p.is_alive() for p in self.__worker):
+                raise RuntimeError("A worker failed to start.")
+            sleep(.1)
+
     def cleanup(self):
         _manage("stop", port=self.__port)
         for p in self.__worker:
@@ -1,10 +1,14 @@
-import pickle
+import heapq
+import uuid
 from time import sleep
-import cloudpickle
 from redis import StrictRedis
-from ...sampler import Sampler
-from .cmd import (SSA, N_EVAL, N_PARTICLES, N_WORKER, QUEUE, MSG, START,
-                  SLEEP_TIME, BATCH_SIZE)
+from ...sampler import Sample, Sampler
+from .cmd import (SSA, N_EVAL, N_PARTICLES, WORKERS, QUEUE, MSG, START,
+                  SLEEP_TIME, BATCH_SIZE, CUTOFF, STATIC, MAX_OVERHEAD,
+                  RESULT_CHUNK, RUNS, RUNS_VERSION, GENERATION, IN_FLIGHT,
+                  key, in_flight_ids)
+from .. import payload
+from . import frame
 from .redis_logging import worker_logger
 
 
@@ -33,6 +37,18 @@ class RedisEvalParallelSampler(Sampler):
     Start as many workers as you wish. Workers can be dynamically added
     during the ABC run.
 
+    Several ABC runs can use the same Redis server concurrently, the keys
+    of each run are prefixed by its ``run_id``. The workers serve all
+    runs, see the ``--scheduling`` option of ``abc-redis-worker``.
+
+    The ``simulate_one`` function is sent to the workers each generation.
+    The objects listed in its ``static_objects`` attribute, which
+    :class:`pyabc.ABCSMC` sets to the models, priors and observed data,
+    are stored separately in Redis under the hash of their content,
+    and workers keep them in memory across generations. Hence, only the
+    parts which change between generations are transmitted each time.
+    The stored static objects are removed by :meth:`stop`.
+
     Parameters
     ----------
 
@@ -49,13 +65,43 @@ class RedisEvalParallelSampler(Sampler):
         the REDIS server. Defaults to 1. Increase this value if model
         evaluation times are short or the number of workers is large
         to reduce communication overhead.
+        If ``adapt_batch_size`` is set, this is the initial batch size.
+
+    adapt_batch_size: bool, optional
+        If True, each worker tunes its batch size after every batch from
+        its measured mean evaluation time and Redis round-trip time,
+        s.t. the communication takes at most the fraction
+        ``max_overhead`` of the time. The batch size is bounded by the
+        worker's share of the evaluations still expected to be necessary,
+        to limit over-simulation at the end of a generation.
+        Defaults to False.
+
+    max_overhead: float, optional
+        Target fraction of communication time for ``adapt_batch_size``.
+        Defaults to 0.05.
+
+    run_id: str, optional
+        Prefix of the keys of this run. Defaults to a random identifier.
+
+    priority: float, optional
+        Priority of this run for workers with priority scheduling.
+        Defaults to 0.
     """
-    def __init__(self, host="localhost", port=6379, batch_size=1):
+    def __init__(self, host="localhost", port=6379, batch_size=1,
+                 adapt_batch_size=False, max_overhead=.05,
+                 run_id=None, priority=0):
         super().__init__()
         worker_logger.debug("Redis sampler: host={} port={}"
                             .format(host, port))
         self.redis = StrictRedis(host=host, port=port)
         self.batch_size = batch_size
+        self.adapt_batch_size = adapt_batch_size
+        self.max_overhead = max_overhead
+        if run_id is None:
+            run_id = uuid.uuid4().hex
+        self.run_id = run_id
+        self.priority = priority
+        self._static_hashes = set()
 
     def n_worker(self):
         """
@@ -68,15 +114,79 @@ class RedisEvalParallelSampler(Sampler):
         """
         return self.redis.pubsub_numsub(MSG)[0][-1]
 
+    def _collect_queue(self, id_results, pipeline=None):
+        """
+        Pop up to ``RESULT_CHUNK`` results from the queue at once.
+        Further commands can be passed via ``pipeline``, which is executed
+        as one transaction with the pop.
+
+        Returns
+        -------
+
+        n_results, *replies: int
+            The number of popped results and the replies of the further
+            commands.
+        """
+        if pipeline is None:
+            pipeline = self.redis.pipeline()
+        pipeline.lrange(self._key(QUEUE), 0, RESULT_CHUNK - 1)
+        pipeline.ltrim(self._key(QUEUE), RESULT_CHUNK, -1)
+        *replies, dumps, _ = pipeline.execute()
+        id_results.extend(frame.decode(dump) for dump in dumps)
+        return (len(dumps), *replies)
+
+    def _key(self, name):
+        return key(self.run_id, name)
+
+    def _set_cutoff(self, id_results, n):
+        cutoff = heapq.nsmallest(n, (res[0] for res in id_results))[-1]
+        self.redis.set(self._key(CUTOFF), cutoff)
+        return cutoff
+
+    def _dump_simulate_one(self, simulate_one, pipeline):
+        """
+        Pickle the simulation function for the workers, and add the
+        static objects not yet stored to the pipeline.
+        """
+        ssa, static = payload.dumps(
+            (simulate_one, self.sample_factory),
+            getattr(simulate_one, "static_objects", []))
+        for content_hash, dump in static.items():
+            if content_hash not in self._static_hashes:
+                pipeline.set(self._key(STATIC + content_hash), dump)
+                self._static_hashes.add(content_hash)
+        return ssa
+
+    def stop(self):
+        """
+        Remove the static objects stored for the workers, and the
+        generation counter.
+        """
+        self.redis.delete(self._key(GENERATION))
+        if len(self._static_hashes) > 0:
+            self.redis.delete(*(self._key(STATIC + content_hash)
+                                for content_hash in self._static_hashes))
+            self._static_hashes = set()
+
     def sample_until_n_accepted(self, n, simulate_one):
         pipeline = self.redis.pipeline()
-        self.redis.set(SSA,
-                       cloudpickle.dumps((simulate_one, self.sample_factory)))
-        pipeline.set(N_EVAL, 0)
-        pipeline.set(N_PARTICLES, n)
-        pipeline.set(N_WORKER, 0)
-        pipeline.set(BATCH_SIZE, self.batch_size)
-        pipeline.delete(QUEUE)
+        ssa = self._dump_simulate_one(simulate_one, pipeline)
+        pipeline.set(self._key(SSA), ssa)
+        pipeline.set(self._key(N_EVAL), 0)
+        pipeline.set(self._key(N_PARTICLES), n)
+        pipeline.delete(self._key(WORKERS))
+        pipeline.set(self._key(BATCH_SIZE), self.batch_size)
+        if self.adapt_batch_size:
+            pipeline.set(self._key(MAX_OVERHEAD), self.max_overhead)
+        else:
+            pipeline.delete(self._key(MAX_OVERHEAD))
+        pipeline.delete(self._key(QUEUE))
+        pipeline.delete(self._key(CUTOFF))
+        pipeline.delete(self._key(IN_FLIGHT))
+        pipeline.incr(self._key(GENERATION))
+        # announce the population to the workers
+        pipeline.zadd(RUNS, {self.run_id: self.priority})
+        pipeline.incr(RUNS_VERSION)
         pipeline.execute()
 
         id_results = []
@@ -84,25 +194,46 @@ class RedisEvalParallelSampler(Sampler):
         self.redis.publish(MSG, START)
 
         while len(id_results) < n:
-            dump = self.redis.blpop(QUEUE)[1]
-            particle_with_id = pickle.loads(dump)
-            id_results.append(particle_with_id)
-
-        while int(self.redis.get(N_WORKER).decode()) > 0:
-            sleep(SLEEP_TIME)
-
-        # make sure all results are collected
-        while self.redis.llen(QUEUE) > 0:
-            id_results.append(pickle.loads(self.redis.blpop(QUEUE)[1]))
+            if self._collect_queue(id_results)[0] == 0:
+                # wait for the next result
+                id_results.append(frame.decode(
+                    self.redis.blpop(self._key(QUEUE))[1]))
+
+        # evaluations with larger IDs than the n-th accepted one
+        # can be cancelled, wait only until all smaller IDs are reported
+        cutoff = self._set_cutoff(id_results, n)
+        while True:
+            if self._collect_queue(id_results)[0] > 0:
+                cutoff = self._set_cutoff(id_results, n)
+            elif all(min_id > cutoff
+                     for min_id in in_flight_ids(self.redis, self.run_id)):
+                # results are pushed atomically with the removal of their
+                # batch from the in-flight ones, dead workers' batches
+                # are dropped once their lease expired
+                if self._collect_queue(id_results)[0] == 0:
+                    break
+                cutoff = self._set_cutoff(id_results, n)
+            else:
+                sleep(SLEEP_TIME)
 
         # set total number of evaluations
-        self.nr_evaluations_ = int(self.redis.get(N_EVAL).decode())
+        self.nr_evaluations_ = int(
+            self.redis.get(self._key(N_EVAL)).decode())
 
         pipeline = self.redis.pipeline()
-        pipeline.delete(SSA)
-        pipeline.delete(N_EVAL)
-        pipeline.delete(N_PARTICLES)
-        pipeline.delete(BATCH_SIZE)
+        # workers still evaluating stop, and their results are discarded
+        pipeline.incr(self._key(GENERATION))
+        pipeline.zrem(RUNS, self.run_id)
+        pipeline.incr(RUNS_VERSION)
+        pipeline.delete(self._key(SSA))
+        pipeline.delete(self._key(N_EVAL))
+        pipeline.delete(self._key(N_PARTICLES))
+        pipeline.delete(self._key(WORKERS))
+        pipeline.delete(self._key(BATCH_SIZE))
+        pipeline.delete(self._key(MAX_OVERHEAD))
+        pipeline.delete(self._key(CUTOFF))
+        pipeline.delete(self._key(IN_FLIGHT))
+        pipeline.delete(self._key(QUEUE))
         pipeline.execute()
 
         # avoid bias toward short running evaluations
@@ -112,8 +243,6 @@ class RedisEvalParallelSampler(Sampler):
         results = [res[1] for res in id_results]
 
         # create 1 to-be-returned sample from results
-        sample = self._create_empty_sample()
-        for j in range(n):
-            sample += results[j]
+        sample = Sample.merge(results)
 
         return sample
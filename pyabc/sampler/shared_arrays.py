@@ -0,0 +1,158 @@
+"""
+Shared memory transport of summary statistics
+=============================================
+
+The multicore samplers transmit the samples from the worker processes
+to the parent process through a :class:`multiprocessing.Queue`, i.e.
+pickled. For summary statistics which are large numpy arrays, the workers
+can instead write these arrays into memory-mapped files in shared memory
+(``/dev/shm``, if available), and only small descriptors are pickled.
+The parent maps the files and uses the arrays without copying them.
+"""
+
+import glob
+import os
+import tempfile
+import uuid
+import numpy as np
+from typing import Union
+from ..population import Particle
+from .base import Sample
+
+
+#: Directory of the memory-mapped files.
+#: A RAM-backed file system on Linux, the temporary directory otherwise.
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") \
+    else tempfile.gettempdir()
+
+#: Arrays smaller than this number of bytes are pickled as usual.
+MIN_NBYTES = 2 ** 16
+
+
+class SharedArray:
+    """
+    Descriptor of a numpy array written to a memory-mapped file.
+
+    Parameters
+    ----------
+
+    path: str
+        The file.
+
+    dtype: np.dtype
+        The array's data type.
+
+    shape: tuple
+        The array's shape.
+    """
+
+    def __init__(self, path: str, dtype: np.dtype, shape: tuple):
+        self.path = path
+        self.dtype = dtype
+        self.shape = shape
+
+    @classmethod
+    def export(cls, array: np.ndarray) -> "SharedArray":
+        """
+        Write ``array`` to a new memory-mapped file.
+        """
+        path = os.path.join(SHARED_DIR, "pyabc-{}-{}".format(
+            os.getpid(), uuid.uuid4().hex))
+        mapped = np.memmap(path, dtype=array.dtype, mode="w+",
+                           shape=array.shape)
+        mapped[...] = array
+        mapped.flush()
+        return cls(path, array.dtype, array.shape)
+
+    def load(self) -> np.ndarray:
+        """
+        Map the file and remove it from the file system. The memory is
+        released once the returned array is garbage collected.
+        """
+        mapped = np.memmap(self.path, dtype=self.dtype, mode="r+",
+                           shape=self.shape)
+        os.unlink(self.path)
+        return mapped.view(np.ndarray)
+
+    def release(self):
+        """
+        Remove the file without mapping it.
+        """
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _sum_stat_dicts(sample: Union[Sample, Particle]):
+    """
+    All summary statistics dictionaries of the sample or particle, each
+    only once. The accepted summary statistics of a particle are usually
+    also contained in its all_sum_stats.
+    """
+    if isinstance(sample, Particle):
+        groups = ([sample],)
+    else:
+        groups = (sample._accepted_particles, sample._rejected_particles)
+    seen = set()
+    for particles in groups:
+        for particle in particles:
+            for sum_stat in (particle.accepted_sum_stats
+                             + particle.all_sum_stats):
+                if isinstance(sum_stat, dict) and id(sum_stat) not in seen:
+                    seen.add(id(sum_stat))
+                    yield sum_stat
+
+
+def export_arrays(sample: Union[Sample, Particle],
+                  min_nbytes: int = MIN_NBYTES) -> Union[Sample, Particle]:
+    """
+    Replace the large numpy arrays among the summary statistics of the
+    sample (or single particle) in place by :class:`SharedArray` descriptors.
+    To be called in the worker process before sending the sample.
+    """
+    for sum_stat in _sum_stat_dicts(sample):
+        for key, value in sum_stat.items():
+            if (isinstance(value, np.ndarray) and not value.dtype.hasobject
+                    and value.nbytes >= min_nbytes):
+                sum_stat[key] = SharedArray.export(value)
+    return sample
+
+
+def import_arrays(sample: Union[Sample, Particle]) \
+        -> Union[Sample, Particle]:
+    """
+    Replace the :class:`SharedArray` descriptors among the summary
+    statistics of the sample (or single particle) in place by the mapped
+    arrays. To be called in the parent process for every received sample.
+    """
+    for sum_stat in _sum_stat_dicts(sample):
+        for key, value in sum_stat.items():
+            if isinstance(value, SharedArray):
+                sum_stat[key] = value.load()
+    return sample
+
+
+def release_arrays(sample: Union[Sample, Particle]):
+    """
+    Remove the files of the :class:`SharedArray` descriptors among the
+    summary statistics of a received sample (or single particle), which is
+    discarded without importing it.
+    """
+    for sum_stat in _sum_stat_dicts(sample):
+        for value in sum_stat.values():
+            if isinstance(value, SharedArray):
+                value.release()
+
+
+def remove_arrays(pid: int):
+    """
+    Remove the files exported by the process ``pid`` which were not
+    imported, e.g. after the process was terminated.
+    """
+    for path in glob.glob(os.path.join(SHARED_DIR,
+                                       "pyabc-{}-*".format(pid))):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
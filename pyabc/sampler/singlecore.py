@@ -1,22 +1,27 @@
-from .base import Sampler
+from .base import Sampler, simulate_batch
 
 
 class SingleCoreSampler(Sampler):
     """
     Sample on a single core. No parallelization.
+
+    Particles are simulated in batches of the number of still missing
+    accepted particles. As at most that many particles can be accepted
+    within a batch, this never overshoots, and the number of evaluations
+    is distributed as when simulating particle by particle.
     """
 
     def sample_until_n_accepted(self, n, simulate_one):
         nr_simulations = 0
+        n_accepted = 0
         sample = self._create_empty_sample()
 
-        for _ in range(n):
-            while True:
-                new_sim = simulate_one()
+        while n_accepted < n:
+            for new_sim in simulate_batch(simulate_one, n - n_accepted):
                 sample.append(new_sim)
                 nr_simulations += 1
                 if new_sim.accepted:
-                    break
+                    n_accepted += 1
         self.nr_evaluations_ = nr_simulations
         assert sample.n_accepted == n
 
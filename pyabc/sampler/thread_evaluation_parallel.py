@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import threading
+import numpy as np
+from .base import Sampler, simulate_batch
+from ..sge import nr_cores_available
+from .cancellation import SimulationCancelled, cancellable
+
+# cutoff while fewer than n particles are accepted
+NO_CUTOFF = 2 ** 63 - 1
+
+# the random number generator of the current thread
+_local = threading.local()
+
+
+def thread_rng() -> np.random.Generator:
+    """
+    The random number generator of the calling thread.
+
+    Within the worker threads of a
+    :class:`pyabc.sampler.ThreadEvalParallelSampler`, each thread has an
+    own, independently seeded stream. Models should draw their random
+    numbers from it, as a generator must not be shared among threads.
+    Other threads get a freshly seeded generator on first use.
+    """
+    try:
+        return _local.rng
+    except AttributeError:
+        _local.rng = np.random.default_rng()
+        return _local.rng
+
+
+class ThreadEvalParallelSampler(Sampler):
+    """
+    Thread based evaluation parallel sampler.
+
+    Implements the same strategy as
+    :class:`pyabc.sampler.MulticoreEvalParallelSampler`,
+    but with threads of the master process instead of forked processes.
+    The threads share the memory of the master, so large read-only data
+    is not duplicated, and the results are neither pickled nor
+    transmitted.
+
+    This sampler is only faster than a single core if the models release
+    the GIL during their evaluation, as e.g. most NumPy operations on large
+    arrays or Numba functions compiled with ``nogil=True`` do.
+    Models have to be thread-safe. For random numbers, they should use
+    the generator of their thread, :func:`pyabc.sampler.thread_rng`.
+
+    .. note::
+
+        Only the models' random numbers come from the per-thread streams.
+        The parameters are still proposed from the process-global
+        ``np.random`` state, by the transitions and priors, which is
+        shared by all threads. Its access is serialized by the GIL, but
+        which thread draws next depends on the scheduling, so runs are
+        not reproducible even when seeding ``np.random``.
+
+    The threads reserve the IDs of their evaluations from a shared counter
+    and keep their results in thread-local lists, which are only merged
+    once all threads are done. The first ``n`` accepted particles by ID
+    are returned, to avoid a bias toward short running evaluations.
+    Evaluations with larger IDs than the ``n``-th accepted one are
+    cancelled, see :mod:`pyabc.sampler.cancellation`.
+
+    Parameters
+    ----------
+
+    n_threads: int, optional
+        If set to None, the number of threads is determined according to
+        :func:`pyabc.sge.nr_cores_available`.
+
+    batch_size: int, optional
+        Number of model evaluations the threads perform before accessing
+        the shared counter again. Defaults to 1.
+    """
+
+    def __init__(self, n_threads=None, batch_size=1):
+        super().__init__()
+        self._n_threads = n_threads
+        self.batch_size = batch_size
+
+    @property
+    def n_threads(self):
+        if self._n_threads is not None:
+            return self._n_threads
+        return nr_cores_available()
+
+    def sample_until_n_accepted(self, n, simulate_one):
+        # the next batch's first ID, drawn atomically under the GIL
+        batch_ids = itertools.count(0, self.batch_size)
+        # written by the threads, only decreases in effect
+        cutoff = [NO_CUTOFF]
+        accepted_ids = []
+        errors = []
+        n_threads = self.n_threads
+        thread_results = [[] for _ in range(n_threads)]
+        seeds = np.random.SeedSequence().spawn(n_threads)
+
+        def work(id_results, seed):
+            _local.rng = np.random.default_rng(seed)
+            try:
+                while True:
+                    first_id = next(batch_ids)
+                    if first_id > cutoff[0] or len(errors) > 0:
+                        return
+                    try:
+                        with cancellable(lambda: first_id > cutoff[0]):
+                            new_sims = simulate_batch(simulate_one,
+                                                      self.batch_size)
+                    except SimulationCancelled:
+                        continue
+
+                    for n_batched, new_sim in enumerate(new_sims):
+                        id_results.append((first_id + n_batched, new_sim))
+                        if new_sim.accepted:
+                            accepted_ids.append(first_id + n_batched)
+                    if len(accepted_ids) >= n:
+                        # an upper bound of the final cutoff, from a copy,
+                        # as other threads append meanwhile
+                        cutoff[0] = min(cutoff[0], heapq.nsmallest(
+                            n, accepted_ids[:])[-1])
+            except Exception as e:
+                # stop the other threads
+                cutoff[0] = -1
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(id_results, seed),
+                                    daemon=True)
+                   for id_results, seed in zip(thread_results, seeds)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        self.nr_evaluations_ = sum(len(id_results)
+                                   for id_results in thread_results)
+
+        # avoid bias toward short running evaluations
+        last_id = heapq.nsmallest(n, accepted_ids)[-1]
+        id_results = sorted(
+            (id_result for id_results in thread_results
+             for id_result in id_results if id_result[0] <= last_id),
+            key=lambda x: x[0])
+
+        sample = self._create_empty_sample()
+        for _, particle in id_results:
+            sample.append(particle)
+
+        return sample
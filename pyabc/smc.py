@@ -7,20 +7,21 @@ Most of the other classes serve to configure it. (I.e. the other classes
 implement a Strategy pattern.)
 """
 
+import asyncio
 import datetime
 import logging
 from typing import List, Callable, TypeVar
+import numpy as np
 import pandas as pd
-import scipy as sp
 from .distance_functions import to_distance
 from .epsilon import Epsilon, MedianEpsilon
 from .model import Model
+from .parameters import Parameter
 from .population import Particle
 from .transition import Transition, MultivariateNormalTransition
 from .random_variables import RV, ModelPerturbationKernel, Distribution
 from .storage import History
 from .populationstrategy import PopulationStrategy
-from .pyabc_rand_choice import fast_random_choice
 from typing import Union
 from .model import SimpleModel
 from .populationstrategy import ConstantPopulationSize
@@ -133,6 +134,12 @@ class ABCSMC:
         Defaults to False. Set this to true if you want to stop ABCSMC
         automatically as soon as only a single model has survived.
 
+    deferred_weighting: bool
+        Defaults to False. If set to True, the samplers' workers only
+        simulate and evaluate particles, and the importance weights of all
+        accepted particles are computed afterwards in the main process,
+        in one vectorized transition density call per model.
+
 
 
     .. [#tonistumpf] Toni, Tina, and Michael P. H. Stumpf.
@@ -207,6 +214,7 @@ class ABCSMC:
         self.acceptor = SimpleAcceptor.assert_acceptor(acceptor)
 
         self.stop_if_only_single_model_alive = False
+        self.deferred_weighting = False
         self.x_0 = None
         self.history = None  # type: History
         self._initial_sum_stats = None
@@ -215,6 +223,9 @@ class ABCSMC:
     def __getstate__(self):
         state_red_dict = self.__dict__.copy()
         del state_red_dict['sampler']
+        # the simulation functions sent to the workers do not access
+        # the database
+        state_red_dict['history'] = None
         return state_red_dict
 
     def do_not_stop_when_only_single_model_alive(self):
@@ -427,14 +438,9 @@ class ABCSMC:
         the history of the distance function or the epsilon.
         """
 
-        # simulation function, simplifying some parts compared to later
-        def simulate_one():
-            m = int(self.model_prior.rvs())
-            theta = self.parameter_priors[m].rvs()
+        def create_particle(m, theta, model_result):
             sum_stats = []
             all_sum_stats = []
-            model_result = self.models[m].summary_statistics(
-                t, theta, self.summary_statistics)
             all_sum_stats.append(model_result.sum_stats)
             weight = 0
             accepted_distances = []
@@ -444,6 +450,23 @@ class ABCSMC:
                 m, theta, weight, accepted_distances,
                 sum_stats, all_sum_stats, accepted)
 
+        # simulation function, simplifying some parts compared to later
+        def simulate_one():
+            m = int(self.model_prior.rvs())
+            theta = self.parameter_priors[m].rvs()
+            model_result = self.models[m].summary_statistics(
+                t, theta, self.summary_statistics)
+            return create_particle(m, theta, model_result)
+
+        async def async_simulate_one():
+            m = int(self.model_prior.rvs())
+            theta = self.parameter_priors[m].rvs()
+            model_result = await self.models[m].async_summary_statistics(
+                t, theta, self.summary_statistics)
+            return create_particle(m, theta, model_result)
+
+        simulate_one.async_simulate_one = async_simulate_one
+
         # call sampler
         sample = self.sampler.sample_until_n_accepted(
             self.population_strategy.nr_particles, simulate_one)
@@ -451,67 +474,124 @@ class ABCSMC:
         # return all generated summary statistics
         return sample.all_sum_stats
 
-    def _generate_valid_proposal(self, t, m, p):
+    def _generate_valid_proposals(self, t, m, p, k, transitions=None):
         """
-        Sample a parameter for a model.
+        Sample ``k`` parameters at once.
+
+        The model indices are drawn in one go, the parameters are drawn
+        model-wise via ``Transition.rvs(size)`` and checked against
+        the prior in one vectorized call per model. Proposals which are
+        invalid according to the prior are redrawn.
 
         Parameters
         ----------
         t: Population number
         m: Indices of alive models
         p: Probabilities of alive models
+        k: Number of proposals
+        transitions: The transitions to propose from,
+            defaults to ``self.transitions``
 
         Returns
         -------
 
-        Model, parameter.
+        Models, parameters.
+        A numpy array of the ``k`` model indices and a list of the ``k``
+        corresponding parameters, in the order in which they were drawn.
 
         """
 
         # first generation
-        if t == 0:  # sample from prior
-            m_ss = int(self.model_prior.rvs())
-            theta_ss = self.parameter_priors[m_ss].rvs()
-            return m_ss, theta_ss
+        if t == 0:  # sample from prior, model-wise
+            if getattr(self.model_prior, "vectorized", False):
+                ms = np.array(self.model_prior.rvs(size=k), dtype=int)
+            else:
+                ms = np.array([self.model_prior.rvs() for _ in range(k)],
+                              dtype=int)
+            thetas = [None] * k
+            for model in np.unique(ms):
+                indices = np.flatnonzero(ms == model)
+                df = self.parameter_priors[model].rvs(size=len(indices))
+                # records keep the types of the parameters
+                for index, record in zip(indices, df.to_dict("records")):
+                    thetas[index] = Parameter(record)
+            return ms, thetas
 
         # later generation
-        while True:  # find m_s and theta_ss, valid according to prior
+        if transitions is None:
+            transitions = self.transitions
+        ms = np.empty(0, dtype=int)
+        thetas = []
+        cumulative_p = np.cumsum(p)
+        while len(ms) < k:  # find m_ss and theta_ss, valid according to prior
+            n_missing = k - len(ms)
             if len(m) > 1:
-                index = fast_random_choice(p)
-                m_s = m[index]
-                m_ss = self.model_perturbation_kernel.rvs(m_s)
+                indices = np.searchsorted(
+                    cumulative_p, np.random.rand(n_missing) * cumulative_p[-1])
+                m_s = np.asarray(m)[indices]
+                m_ss = np.empty(n_missing, dtype=int)
+                for m_source in np.unique(m_s):
+                    source = m_s == m_source
+                    m_ss[source] = self.model_perturbation_kernel.rvs(
+                        m_source, size=source.sum())
                 # theta_s is None if the population m_ss has died out.
                 # This can happen since the model_perturbation
                 # _kernel can return  a model nr which has died out.
-                if m_ss not in m:
-                    continue
+                m_ss = m_ss[np.isin(m_ss, m)]
             else:
-                m_ss = m[0]
-            theta_ss = self.transitions[m_ss].rvs()
-
-            if (self.model_prior.pmf(m_ss)
-                    * self.parameter_priors[m_ss].pdf(theta_ss) > 0):
-                return m_ss, theta_ss
-
-    def _evaluate_proposal(self, m_ss,
-                           theta_ss,
-                           t,
-                           model_probabilities) -> Particle:
+                m_ss = np.full(n_missing, m[0], dtype=int)
+
+            # draw model-wise, but keep the drawing order
+            theta_ss = [None] * len(m_ss)
+            valid = np.zeros(len(m_ss), dtype=bool)
+            for model in np.unique(m_ss):
+                indices = np.flatnonzero(m_ss == model)
+                df = transitions[model].rvs(size=len(indices))
+                prior_density = (
+                    self.model_prior.pmf(model)
+                    * np.broadcast_to(self.parameter_priors[model].pdf(df),
+                                      (len(indices),)))
+                valid[indices] = prior_density > 0
+                for index, row in zip(indices, df.values):
+                    theta_ss[index] = Parameter(dict(zip(df.columns, row)))
+
+            ms = np.concatenate((ms, m_ss[valid]))
+            thetas.extend(theta for theta, is_valid in zip(theta_ss, valid)
+                          if is_valid)
+
+        return ms, thetas
+
+    def _evaluate_proposal(self, m_ss, theta_ss, t) -> Particle:
         """
         Corresponds to Sampler.simulate_one. Data for the given parameters
         theta_ss are simulated, summary statistics computed and evaluated.
 
         This is where the actual model evaluation happens.
+        The weight of the returned particle is not yet set, see
+        :meth:`_calc_proposal_weights`.
         """
 
         # from here, theta_ss is valid according to the prior
 
-        accepted_distances = []
-        accepted_sum_stats = []
-        all_sum_stats = []
+        model_results = [
+            self.models[m_ss].accept(
+                t,
+                theta_ss,
+                self.summary_statistics,
+                self.distance_function,
+                self.eps,
+                self.acceptor,
+                self.x_0)
+            for _ in range(self.population_strategy.nr_samples_per_parameter)]
+        return self._create_proposal_particle(m_ss, theta_ss, model_results)
 
-        for _ in range(self.population_strategy.nr_samples_per_parameter):
-            model_result = self.models[m_ss].accept(
+    async def _async_evaluate_proposal(self, m_ss, theta_ss, t) -> Particle:
+        """
+        Asynchronous variant of :meth:`_evaluate_proposal`, which awaits
+        the model evaluations concurrently.
+        """
+        model_results = await asyncio.gather(*(
+            self.models[m_ss].async_accept(
                 t,
                 theta_ss,
                 self.summary_statistics,
@@ -519,6 +599,21 @@ class ABCSMC:
                 self.eps,
                 self.acceptor,
                 self.x_0)
+            for _ in range(
+                self.population_strategy.nr_samples_per_parameter)))
+        return self._create_proposal_particle(m_ss, theta_ss, model_results)
+
+    @staticmethod
+    def _create_proposal_particle(m_ss, theta_ss, model_results) -> Particle:
+        """
+        Create the particle of the evaluated parameter ``theta_ss``
+        from the results of its model evaluations.
+        """
+        accepted_distances = []
+        accepted_sum_stats = []
+        all_sum_stats = []
+
+        for model_result in model_results:
             # append to all_sum_stats in either case to allow for the situation
             # that in population.all_sum_stats() one is only interested in
             # accepted particles
@@ -529,46 +624,214 @@ class ABCSMC:
 
         accepted = len(accepted_sum_stats) > 0
 
-        if accepted:
-            weight = self._calc_proposal_weight(
-                accepted_distances, m_ss, theta_ss, t, model_probabilities)
-        else:
-            weight = 0
-
         return Particle(
-            m_ss, theta_ss, weight, accepted_distances,
+            m_ss, theta_ss, 0, accepted_distances,
             accepted_sum_stats, all_sum_stats, accepted)
 
-    def _calc_proposal_weight(self,
-                              distance_list,
-                              m_ss,
-                              theta_ss,
-                              t, model_probabilities):
+    def _calc_proposal_weights(self, particles: List[Particle], t,
+                               model_probabilities):
         """
-        Calculate the weight for the generated parameter.
+        Calculate the weights of the accepted particles in ``particles``
+        and set them in place, marking them as weighted.
+        Rejected particles keep weight 0.
+
+        The transition and prior densities are evaluated in one
+        vectorized call per model.
         """
 
+        accepted = [particle for particle in particles if particle.accepted]
+        nr_samples_per_parameter = \
+            self.population_strategy.nr_samples_per_parameter
+
         if t == 0:
-            weight = (len(distance_list)
-                      / self.population_strategy.nr_samples_per_parameter)
-        else:
-            model_factor = sum(
-                row.p * self.model_perturbation_kernel.pmf(m_ss, m)
-                for m, row in model_probabilities.iterrows())
-            particle_factor = self.transitions[m_ss].pdf(
-                pd.Series(dict(theta_ss)))
-            normalization = model_factor * particle_factor
-            if normalization == 0:
-                print('normalization is zero!')
+            for particle in accepted:
+                particle.weight = (len(particle.accepted_distances)
+                                   / nr_samples_per_parameter)
+                particle.weighted = True
+            return
+
+        ms = np.array([particle.m for particle in accepted], dtype=int)
+        for m_ss in np.unique(ms):
+            model_particles = [particle for particle, model
+                               in zip(accepted, ms) if model == m_ss]
+            weights = self._importance_weights(
+                m_ss, model_particles, model_probabilities, self.transitions)
             # reflects stochasticity of the model
-            fraction_accepted_runs_for_single_parameter = (
-                len(distance_list)
-                / self.population_strategy.nr_samples_per_parameter)
-            weight = (self.model_prior.pmf(m_ss)
-                      * self.parameter_priors[m_ss].pdf(theta_ss)
-                      * fraction_accepted_runs_for_single_parameter
-                      / normalization)
-        return weight
+            fraction_accepted_runs_for_single_parameter = np.array(
+                [len(particle.accepted_distances)
+                 for particle in model_particles]) / nr_samples_per_parameter
+            weights = weights * fraction_accepted_runs_for_single_parameter
+            for particle, weight in zip(model_particles, weights):
+                particle.weight = float(weight)
+                particle.weighted = True
+
+    def _importance_weights(self, m_ss, particles: List[Particle],
+                            model_probabilities, transitions):
+        """
+        Ratio of prior and proposal density of the parameters of
+        ``particles``, which all belong to model ``m_ss``.
+        The proposal is defined by the model probabilities and the
+        fitted transitions.
+        """
+        thetas = pd.DataFrame([dict(particle.parameter)
+                               for particle in particles])
+        n = len(particles)
+
+        model_factor = sum(
+            row.p * self.model_perturbation_kernel.pmf(m_ss, m)
+            for m, row in model_probabilities.iterrows())
+        particle_factor = np.broadcast_to(
+            transitions[m_ss].pdf(thetas), (n,))
+        normalization = model_factor * particle_factor
+        if (normalization == 0).any():
+            print('normalization is zero!')
+        prior_density = (
+            self.model_prior.pmf(m_ss)
+            * np.broadcast_to(self.parameter_priors[m_ss].pdf(thetas),
+                              (n,)))
+        return prior_density / normalization
+
+    def _create_look_ahead_function(self, t, sample, model_probabilities):
+        """
+        Create a preliminary simulation function for generation ``t + 1``
+        from the incomplete ``sample`` of generation ``t``, see
+        :meth:`_create_simulate_function`.
+
+        Copies of the transitions are fitted to the accepted particles of
+        the sample. The returned function proposes a particle from these,
+        simulates its summary statistics, and sets its weight to the ratio
+        of prior and preliminary proposal density. The particle is not yet
+        evaluated, as distance and epsilon of generation ``t + 1`` are not
+        known before generation ``t`` is complete,
+        see :meth:`_evaluate_look_ahead`.
+        """
+
+        if self.deferred_weighting:
+            self._calc_proposal_weights(sample.accepted_particles, t,
+                                        model_probabilities)
+        population = sample.get_accepted_population()
+        probabilities = population.get_model_probabilities()
+        preliminary_probabilities = pd.DataFrame(
+            {"p": list(probabilities.values())},
+            index=list(probabilities.keys()))
+        m = np.array(preliminary_probabilities.index)
+        p = np.array(preliminary_probabilities.p)
+        transitions = copy.deepcopy(self.transitions)
+        for model in m:
+            particles, w = population.get_distribution(model)
+            transitions[model].fit(particles, w)
+
+        def simulate_look_ahead():
+            ms, thetas = self._generate_valid_proposals(
+                t + 1, m, p, 1, transitions)
+            m_ss, theta_ss = ms[0], thetas[0]
+            all_sum_stats = [
+                self.models[m_ss].summary_statistics(
+                    t + 1, theta_ss, self.summary_statistics).sum_stats
+                for _ in range(
+                    self.population_strategy.nr_samples_per_parameter)]
+            particle = Particle(m_ss, theta_ss, 0, [], [], all_sum_stats,
+                                False)
+            particle.weight = float(self._importance_weights(
+                m_ss, [particle], preliminary_probabilities,
+                transitions)[0])
+            return particle
+
+        return simulate_look_ahead
+
+    def _evaluate_look_ahead(self, particle: Particle, t) -> Particle:
+        """
+        Evaluate a particle of the look-ahead function of generation ``t``,
+        see :meth:`_create_look_ahead_function`, with the distance function
+        and epsilon of generation ``t``. The weight is multiplied by the
+        fraction of accepted simulations, as in
+        :meth:`_calc_proposal_weights`.
+
+        The acceptor is applied to the simulated summary statistics
+        directly, i.e. custom implementations of
+        :meth:`pyabc.Model.accept` are bypassed.
+        """
+        for sum_stats in particle.all_sum_stats:
+            distance, accepted = self.acceptor(
+                t, self.distance_function, self.eps, sum_stats, self.x_0)
+            if accepted:
+                particle.accepted_distances.append(distance)
+                particle.accepted_sum_stats.append(sum_stats)
+
+        particle.accepted = len(particle.accepted_sum_stats) > 0
+        particle.weight *= (len(particle.accepted_distances)
+                            / self.population_strategy
+                            .nr_samples_per_parameter)
+        particle.weighted = True
+        return particle
+
+    def _create_simulate_function(self, t, model_probabilities):
+        """
+        Create the simulation function for generation ``t``, which is passed
+        to the sampler.
+
+        The returned ``simulate_one`` function evaluates a single particle.
+        It additionally carries a ``simulate_batch(k)`` attribute, which
+        proposes, evaluates and weights ``k`` particles at once, and which
+        the samplers use via :func:`pyabc.sampler.base.simulate_batch`.
+        If ``deferred_weighting`` is set, the particles are not weighted.
+
+        The ``static_objects`` attribute lists the parts of the function
+        which do not change between generations, such that samplers
+        sending it to remote workers can transmit these only once.
+
+        The coroutine function ``async_simulate_one`` evaluates a single
+        particle awaiting asynchronous models, see
+        :class:`pyabc.sampler.AsyncioSampler`.
+
+        For samplers with look-ahead, it also carries
+        ``look_ahead(sample)``, which creates the preliminary simulation
+        function of generation ``t + 1`` from the incomplete sample, and
+        ``evaluate_look_ahead(particle)``, which evaluates a particle of
+        the preliminary simulation function of generation ``t``.
+        """
+
+        m = np.array(model_probabilities.index)
+        p = np.array(model_probabilities.p)
+        deferred_weighting = self.deferred_weighting
+
+        def simulate_batch(k):
+            ms, thetas = self._generate_valid_proposals(t, m, p, k)
+            particles = [self._evaluate_proposal(m_ss, theta_ss, t)
+                         for m_ss, theta_ss in zip(ms, thetas)]
+            if not deferred_weighting:
+                self._calc_proposal_weights(particles, t,
+                                            model_probabilities)
+            return particles
+
+        def simulate_one():
+            return simulate_batch(1)[0]
+
+        async def async_simulate_one():
+            ms, thetas = self._generate_valid_proposals(t, m, p, 1)
+            particle = await self._async_evaluate_proposal(
+                ms[0], thetas[0], t)
+            if not deferred_weighting:
+                self._calc_proposal_weights([particle], t,
+                                            model_probabilities)
+            return particle
+
+        def look_ahead(sample):
+            return self._create_look_ahead_function(
+                t, sample, model_probabilities)
+
+        def evaluate_look_ahead(particle):
+            return self._evaluate_look_ahead(particle, t)
+
+        simulate_one.simulate_batch = simulate_batch
+        simulate_one.async_simulate_one = async_simulate_one
+        simulate_one.static_objects = [
+            self.models, self.parameter_priors, self.model_prior,
+            self.model_perturbation_kernel, self.summary_statistics,
+            self.acceptor, self.x_0]
+        simulate_one.look_ahead = look_ahead
+        simulate_one.evaluate_look_ahead = evaluate_look_ahead
+        return simulate_one
 
     def run(self, minimum_epsilon: float, max_nr_populations: int,
             min_acceptance_rate: float = 0., **kwargs) -> History:
@@ -612,6 +875,11 @@ class ABCSMC:
 
         This method can be called repeatedly to sample further populations
         after sampling was stopped once.
+
+        The history answers queries for the last population from memory,
+        so the database is only written to. To write each population in the
+        background while the next one is sampled, set
+        ``abc.history.write_behind = True`` before calling this method.
         """
 
         # argument handling
@@ -632,81 +900,86 @@ class ABCSMC:
         # configure sampler by whoever wants to
         self.distance_function.configure_sampler(self.sampler)
 
-        # run loop over time points
-        t_max = t0 + max_nr_populations
-        for t in range(t0, t_max):
-
-            # get epsilon for generation t
-            current_eps = self.eps(t)
-            abclogger.info('t:' + str(t) + ' eps:' + str(current_eps))
-
-            # do some adaptations
-            self._fit_transitions(t)
-            self._adapt_population_size(t)
-
-            # cache model_probabilities to not query the database so often
-            model_probabilities = self.history.get_model_probabilities(
-                self.history.max_t)
-            abclogger.debug('now submitting population ' + str(t))
-
-            m = sp.array(model_probabilities.index)
-            p = sp.array(model_probabilities.p)
-
-            # simulation function
-            def simulate_one():
-                par = self._generate_valid_proposal(t, m, p)
-                return self._evaluate_proposal(
-                    *par,
-                    t,
-                    model_probabilities)
-
-            # sample for new population
-            sample = self.sampler.sample_until_n_accepted(
-                self.population_strategy.nr_particles, simulate_one)
-
-            # retrieve accepted population
-            population = sample.get_accepted_population()
-
-            # save to database before making any changes to the population
-            abclogger.debug('population ' + str(t) + ' done')
-            nr_evaluations = self.sampler.nr_evaluations_
-            model_names = [model.name for model in self.models]
-            self.history.append_population(
-                t, current_eps, population, nr_evaluations,
-                model_names)
-            abclogger.debug(
-                '\ntotal nr simulations up to t =' + str(t) + ' is '
-                + str(self.history.total_nr_simulations))
-
-            # prepare next iteration
-
-            # update distance function
-            df_updated = self.distance_function.update(
-                t + 1, sample.all_sum_stats)
-
-            # compute distances with the new distance measure
-            if df_updated:
-                def distance_to_ground_truth(x):
-                    return self.distance_function(t + 1, x, self.x_0)
-                population.update_distances(distance_to_ground_truth)
-
-            # update epsilon
-            self.eps.update(t + 1, population.get_weighted_distances())
-
-            # check early termination conditions
-
-            current_acceptance_rate = \
-                len(population.get_list()) / nr_evaluations
-            if (current_eps <= minimum_epsilon
-                    or (self.stop_if_only_single_model_alive
-                        and self.history.nr_of_models_alive() <= 1)
-                    or current_acceptance_rate < min_acceptance_rate):
-                break
-
-        # end of run loop
-
-        # close session and store end time
-        self.history.done()
+        try:
+            # run loop over time points
+            t_max = t0 + max_nr_populations
+            for t in range(t0, t_max):
+
+                # get epsilon for generation t
+                current_eps = self.eps(t)
+                abclogger.info('t:' + str(t) + ' eps:' + str(current_eps))
+
+                # do some adaptations
+                self._fit_transitions(t)
+                self._adapt_population_size(t)
+
+                # cache model_probabilities to not query the database so often
+                model_probabilities = \
+                    self.history.get_model_probabilities(t - 1)
+                abclogger.debug('now submitting population ' + str(t))
+
+                # simulation function
+                simulate_one = self._create_simulate_function(
+                    t, model_probabilities)
+
+                # sample for new population
+                sample = self.sampler.sample_until_n_accepted(
+                    self.population_strategy.nr_particles, simulate_one)
+
+                # weight the accepted particles, if the workers did not.
+                # particles from a sampler's look-ahead are weighted already
+                if self.deferred_weighting:
+                    self._calc_proposal_weights(
+                        [particle for particle in sample.accepted_particles
+                         if not particle.weighted], t, model_probabilities)
+
+                # retrieve accepted population
+                population = sample.get_accepted_population()
+
+                # save to database before making any changes to the population
+                abclogger.debug('population ' + str(t) + ' done')
+                nr_evaluations = self.sampler.nr_evaluations_
+                model_names = [model.name for model in self.models]
+                self.history.append_population(
+                    t, current_eps, population, nr_evaluations,
+                    model_names)
+                if abclogger.isEnabledFor(logging.DEBUG):
+                    abclogger.debug(
+                        '\ntotal nr simulations up to t =' + str(t) + ' is '
+                        + str(self.history.total_nr_simulations))
+
+                # prepare next iteration
+
+                # update distance function
+                df_updated = self.distance_function.update(
+                    t + 1, sample.all_sum_stats)
+
+                # compute distances with the new distance measure
+                if df_updated:
+                    def distance_to_ground_truth(x):
+                        return self.distance_function(t + 1, x, self.x_0)
+                    population.update_distances(distance_to_ground_truth)
+
+                # update epsilon
+                self.eps.update(t + 1, population.get_weighted_distances())
+
+                # check early termination conditions
+
+                current_acceptance_rate = \
+                    len(population.get_list()) / nr_evaluations
+                if (current_eps <= minimum_epsilon
+                        or (self.stop_if_only_single_model_alive
+                            and self.history.nr_of_models_alive(t) <= 1)
+                        or current_acceptance_rate < min_acceptance_rate):
+                    break
+
+            # end of run loop
+
+            # close session and store end time
+            self.history.done()
+        finally:
+            # shut down workers kept across generations, also on errors
+            self.sampler.stop()
 
         # return used history object
         return self.history
@@ -725,8 +998,7 @@ class ABCSMC:
         if t == 0:  # we need a particle population to do the fitting
             return
 
-        w = self.history.get_model_probabilities(
-            self.history.max_t)["p"].as_matrix()
+        w = self.history.get_model_probabilities(t - 1)["p"].as_matrix()
 
         # make a copy in case the population strategy messes with
         # the transitions
@@ -1,5 +1,7 @@
 import datetime
 import os
+import queue
+import threading
 from typing import List, Union
 import json
 import numpy as np
@@ -17,6 +19,9 @@ def with_session(f):
     @wraps(f)
     def f_wrapper(self: "History", *args, **kwargs):
         history_logger.debug('Database access through "{}"'.format(f.__name__))
+        if threading.current_thread() is not self._writer:
+            # wait for pending background writes
+            self.flush()
         no_session = self._session is None and self._engine is None
         if no_session:
             self._make_session()
@@ -68,15 +73,37 @@ class History:
     db: str
         SQLAlchemy database identifier.
 
+    bulk_insert: bool, optional (default = True)
+        Whether to write populations with bulk inserts, i.e. one
+        ``executemany`` per table and population with precomputed
+        primary keys, instead of building ORM objects particle by particle.
+        The resulting database content is the same.
+
+    write_behind: bool, optional (default = False)
+        Whether to write populations on a background thread.
+        :meth:`append_population` then returns immediately, unless
+        ``WRITE_BEHIND_QUEUE_SIZE`` populations are already waiting to be
+        written. Any other database access waits for the pending writes,
+        and errors of the background writes are raised there.
+        In-memory databases are always written synchronously.
+
     """
     DB_TIMEOUT = 120
+    WRITE_BEHIND_QUEUE_SIZE = 1
 
-    def __init__(self, db: str):
+    def __init__(self, db: str, bulk_insert: bool=True,
+                 write_behind: bool=False):
         """
         Only counts the simulations which appear in particles.
         If a simulation terminated prematurely, it is not counted.
         """
         self.db_identifier = db
+        self.bulk_insert = bulk_insert
+        self.write_behind = write_behind
+        self._write_queue = None
+        self._writer = None
+        self._write_error = None
+        self._cache = None
         self._session = None
         self._engine = None
         self.id = self._pre_calculate_id()
@@ -125,7 +152,17 @@ class History:
             return abcs[0].id
         return None
 
-    @with_session
+    def _cached_population(self, t):
+        """
+        The population appended last via :meth:`append_population`,
+        if it is population `t` of the current run, otherwise None.
+        Queries for this population are answered from memory.
+        """
+        if (self._cache is None or t is None
+                or self._cache[0] != self.id or self._cache[1] != int(t)):
+            return None
+        return self._cache[2]
+
     def alive_models(self, t) -> List:
         """
         Get the models which are still alive at time `t`.
@@ -144,6 +181,13 @@ class History:
             models which are still alive
 
         """
+        population = self._cached_population(t)
+        if population is not None:
+            return sorted(population.get_model_probabilities())
+        return self._alive_models(t)
+
+    @with_session
+    def _alive_models(self, t) -> List:
         t = int(t)
         alive = (self._session.query(Model.m)
                  .join(Population)
@@ -152,7 +196,6 @@ class History:
                  .filter(Population.t == t)).all()
         return sorted([a[0] for a in alive])
 
-    @with_session
     def get_distribution(self, m: int, t: int=None) \
             -> (pd.DataFrame, np.ndarray):
         """
@@ -180,6 +223,14 @@ class History:
         w:
             are the weights associated with each parameter
         """
+        population = self._cached_population(t)
+        if population is not None:
+            return population.get_distribution(int(m))
+        return self._get_distribution(m, t)
+
+    @with_session
+    def _get_distribution(self, m: int, t: int=None) \
+            -> (pd.DataFrame, np.ndarray):
         m = int(m)
         if t is None:
             t = self.max_t
@@ -389,17 +440,55 @@ class History:
         self._engine = None
 
     def __getstate__(self):
-        dct = self.__dict__.copy()
-        if self.inmemory:
-            dct["_engine"] = None
-            dct["_session"] = None
-        return dct
+        # only the database and run, pending background writes are not
+        # waited for, and neither the cache nor the connection is copied
+        return {"db_identifier": self.db_identifier,
+                "bulk_insert": self.bulk_insert,
+                "write_behind": self.write_behind,
+                "id": self.id}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._write_queue = None
+        self._writer = None
+        self._write_error = None
+        self._cache = None
+        self._session = None
+        self._engine = None
+
+    def _write_loop(self):
+        while True:
+            save, args = self._write_queue.get()
+            try:
+                if self._write_error is None:
+                    save(*args)
+            except Exception as e:
+                history_logger.error("Background write failed: {}"
+                                     .format(e))
+                self._write_error = e
+            finally:
+                self._write_queue.task_done()
+
+    def flush(self):
+        """
+        Wait until all populations appended in write-behind mode
+        are stored.
+
+        Raises the first error which occurred while writing in the
+        background.
+        """
+        if self._write_queue is not None:
+            self._write_queue.join()
+        if self._write_error is not None:
+            error, self._write_error = self._write_error, None
+            raise error
 
     @with_session
     @internal_docstring_warning
     def done(self):
         """
         Close database sessions and store end time of population.
+        Pending background writes are completed first.
 
         """
 
@@ -463,6 +552,86 @@ class History:
         self._session.commit()
         history_logger.debug("Appended population")
 
+    def _next_id(self, table) -> int:
+        max_id = self._session.query(func.max(table.id)).scalar()
+        return 1 if max_id is None else max_id + 1
+
+    @with_session
+    def _bulk_save_to_population_db(self, t: int, current_epsilon: float,
+                                    nr_simulations: int,
+                                    store: dict, model_probabilities: dict,
+                                    model_names):
+        # same content as _save_to_population_db, but the rows of each table
+        # are collected first, with primary keys assigned here, and then
+        # written with one executemany per table in a single transaction
+
+        population_id = self._next_id(Population)
+        model_id = self._next_id(Model)
+        particle_id = self._next_id(Particle)
+        parameter_id = self._next_id(Parameter)
+        sample_id = self._next_id(Sample)
+        sum_stat_id = self._next_id(SummaryStatistic)
+
+        population_rows = [dict(id=population_id, abc_smc_id=self.id, t=t,
+                                population_end_time=datetime.datetime.now(),
+                                nr_samples=nr_simulations,
+                                epsilon=current_epsilon)]
+        model_rows = []
+        particle_rows = []
+        parameter_rows = []
+        sample_rows = []
+        sum_stat_rows = []
+
+        for m, model_population in store.items():
+            model_rows.append(dict(id=model_id, population_id=population_id,
+                                   m=int(m),
+                                   p_model=float(model_probabilities[m]),
+                                   name=str(model_names[m])))
+
+            for store_item in model_population:
+                particle_rows.append(dict(id=particle_id, model_id=model_id,
+                                          w=float(store_item.weight)))
+                for key, value in store_item.parameter.items():
+                    if isinstance(value, dict):
+                        for key_dict, value_dict in value.items():
+                            parameter_rows.append(dict(
+                                id=parameter_id, particle_id=particle_id,
+                                name=key + "_" + key_dict, value=value_dict))
+                            parameter_id += 1
+                    else:
+                        parameter_rows.append(dict(
+                            id=parameter_id, particle_id=particle_id,
+                            name=key, value=value))
+                        parameter_id += 1
+                for distance, summ_stat in zip(
+                        store_item.accepted_distances,
+                        store_item.accepted_sum_stats):
+                    sample_rows.append(dict(id=sample_id,
+                                            particle_id=particle_id,
+                                            distance=float(distance)))
+                    for name, value in summ_stat.items():
+                        if name is None:
+                            raise Exception("Summary statistics need names.")
+                        sum_stat_rows.append(dict(id=sum_stat_id,
+                                                  sample_id=sample_id,
+                                                  name=name, value=value))
+                        sum_stat_id += 1
+                    sample_id += 1
+                particle_id += 1
+            model_id += 1
+
+        for table, rows in ((Population, population_rows),
+                            (Model, model_rows),
+                            (Particle, particle_rows),
+                            (Parameter, parameter_rows),
+                            (Sample, sample_rows),
+                            (SummaryStatistic, sum_stat_rows)):
+            if len(rows) > 0:
+                self._session.execute(table.__table__.insert(), rows)
+
+        self._session.commit()
+        history_logger.debug("Appended population")
+
     @internal_docstring_warning
     def append_population(self, t: int,
                           current_epsilon: float,
@@ -490,15 +659,48 @@ class History:
         model_names: list
             The model names.
 
+        The population is kept in memory to answer queries for it
+        without database access, until another population is appended.
+        It must therefore not be modified afterwards, apart from
+        updating its distances.
+
         """
         store = population.to_dict()
         model_probabilities = population.get_model_probabilities()
 
-        self._save_to_population_db(t, current_epsilon,
-                                    nr_simulations, store, model_probabilities,
-                                    model_names)
+        if self.bulk_insert:
+            save = self._bulk_save_to_population_db
+        else:
+            save = self._save_to_population_db
+        args = (t, current_epsilon, nr_simulations, store,
+                model_probabilities, model_names)
+
+        # in-memory databases are bound to the thread which created them
+        if not self.write_behind or self.db_identifier == "sqlite://":
+            save(*args)
+            self._update_cache(t, population)
+            return
+
+        if self._writer is None:
+            self._write_queue = queue.Queue(self.WRITE_BEHIND_QUEUE_SIZE)
+            self._writer = threading.Thread(target=self._write_loop,
+                                            daemon=True)
+            self._writer.start()
+        if self._write_error is not None:
+            self.flush()
+        # blocks if the queue is full
+        self._write_queue.put((save, args))
+        self._update_cache(t, population)
+
+    def _update_cache(self, t: int, population):
+        t = int(t)
+        if (self._cache is not None and self._cache[0] == self.id
+                and t <= self._cache[1]):
+            # the database might now hold several populations with this t
+            self._cache = (self.id, t, None)
+        else:
+            self._cache = (self.id, t, population)
 
-    @with_session
     def get_model_probabilities(self, t=None) -> pd.DataFrame:
         """
         Model probabilities.
@@ -513,7 +715,17 @@ class History:
         probabilities: np.ndarray
             Model probabilities
         """
+        population = self._cached_population(t)
+        if population is not None:
+            model_probabilities = population.get_model_probabilities()
+            return pd.DataFrame(
+                {"p": list(model_probabilities.values())},
+                index=pd.Index(list(model_probabilities.keys()), name="m")
+            ).sort_index()
+        return self._get_model_probabilities(t)
 
+    @with_session
+    def _get_model_probabilities(self, t=None) -> pd.DataFrame:
         if t is not None:
             t = int(t)
 
@@ -1,10 +1,9 @@
-import numpy.linalg as la
-import scipy as sp
+import numpy as np
 import pandas as pd
 from .base import Transition
 from scipy.spatial import cKDTree
-from .util import smart_cov
 from .exceptions import NotEnoughParticles
+from .util import truncated_mixture_density
 import logging
 
 logger = logging.getLogger("LocalTransition")
@@ -29,6 +28,14 @@ class LocalTransition(Transition):
         Calculate number of nearest neighbors to use according to
         ``k = k_fraction * population_size`` (and rounds it).
 
+    pdf_rtol: float, optional
+        If given, :meth:`pdf` only sums over the particles in a
+        neighborhood of each point, found via a KD-tree with a cutoff
+        which bounds the Mahalanobis distances under all local
+        covariances. Points for which the relative error cannot be
+        guaranteed to be below ``pdf_rtol`` are evaluated exactly.
+        Defaults to None, i.e. exact evaluation throughout.
+
     Attributes
     ----------
 
@@ -36,6 +43,11 @@ class LocalTransition(Transition):
         Scaling of the identity matrix to be added to the covariance
         in case the covariances are not invertible.
 
+    PDF_CHUNK_SIZE: int
+        Maximum number of entries of the intermediate
+        (points x particles x parameters) array in :meth:`pdf`.
+        Larger point sets are evaluated in chunks.
+
 
     .. [Filippi] Filippi, Sarah, Chris P. Barnes, Julien Cornebise,
                  and Michael P.H. Stumpf. “On Optimality of Kernels
@@ -46,8 +58,9 @@ class LocalTransition(Transition):
     """
     EPS = 1e-3
     MIN_K = 10
+    PDF_CHUNK_SIZE = 2 ** 22
 
-    def __init__(self, k=None, k_fraction=1/4, scaling=1):
+    def __init__(self, k=None, k_fraction=1/4, scaling=1, pdf_rtol=None):
         if k_fraction is not None:
             self.k_fraction = k_fraction
             self._k = None
@@ -56,6 +69,7 @@ class LocalTransition(Transition):
             self._k = k
 
         self.scaling = scaling
+        self.pdf_rtol = pdf_rtol
 
     @property
     def k(self):
@@ -82,64 +96,142 @@ class LocalTransition(Transition):
         ctree = cKDTree(X)
         _, indices = ctree.query(X, k=min(self.k + 1, X.shape[0]))
 
-        covs, inv_covs, dets = list(zip(*[self._cov_and_inv(n, indices)
-                                    for n in range(X.shape[0])]))
-        self.covs = sp.array(covs)
-        self.inv_covs = sp.array(inv_covs)
-        self.determinants = sp.array(dets)
-
-        self.normalization = sp.sqrt(
-            (2 * sp.pi) ** self.X_arr.shape[1] * self.determinants)
-
-        if not sp.isreal(self.normalization).all():
-            raise Exception("Normalization not real")
-        self.normalization = sp.real(self.normalization)
+        covs = self._covs(indices)
+        self.chols = self._cholesky(covs)
+        self.covs = covs
+        self.chol_invs = np.linalg.inv(self.chols)
+        self.inv_covs = np.einsum("nji,njk->nik",
+                                  self.chol_invs, self.chol_invs)
+        log_determinants = 2 * np.log(
+            np.diagonal(self.chols, axis1=1, axis2=2)).sum(axis=1)
+        self.determinants = np.exp(log_determinants)
+
+        self.log_normalization = .5 * (
+            self.X_arr.shape[1] * np.log(2 * np.pi) + log_determinants)
+        self.normalization = np.exp(self.log_normalization)
+
+        if self.pdf_rtol is not None:
+            # outside of the radius, the Mahalanobis distance under
+            # covariance n is at least radius**2 / max_eigenvalues[n]
+            self._tree = cKDTree(self.X_arr)
+            max_eigenvalues = np.linalg.eigvalsh(self.covs)[:, -1]
+            self._radius = np.sqrt(
+                -2 * np.log(self.pdf_rtol / len(self.X_arr))
+                * max_eigenvalues.max())
+            self._log_bound = (-.5 * self._radius**2 / max_eigenvalues
+                               - self.log_normalization).max()
 
     def pdf(self, x):
         x = x[self.X.columns].as_matrix()
         if len(x.shape) == 1:
-            return self._pdf_single(x)
-        else:
-            return sp.array([self._pdf_single(x) for x in x])
-
-    def _pdf_single(self, x):
-        distance = self.X_arr - x
-        cov_distance = sp.einsum("ij,ijk,ik->i",
-                                 distance, self.inv_covs, distance)
-        return sp.average(sp.exp(-.5 * cov_distance) / self.normalization,
-                          weights=self.w)
-
-    def _cov_and_inv(self, n, indices):
+            return float(self._pdf_chunk(x[None, :])[0])
+        n_particles, dim = self.X_arr.shape
+        chunk_size = max(1, self.PDF_CHUNK_SIZE // (n_particles * dim))
+        dens = np.zeros(len(x))
+        for start in range(0, len(x), chunk_size):
+            dens[start:start + chunk_size] = self._pdf_chunk(
+                x[start:start + chunk_size])
+        return dens
+
+    def _pdf_chunk(self, x):
         """
-        Calculate covariance around local support vector
-        and also the inverse
+        Mixture density at the rows of x, truncated if ``pdf_rtol``
+        is set.
         """
-        cov = self._cov(indices, n)
-        det = la.det(cov)
-        while det <= 0:
-            cov += sp.identity(cov.shape[0]) * self.EPS
-            det = la.det(cov)
-        inv_cov = la.inv(cov)
-        return cov, inv_cov, det
-
-    def _cov(self, indices, n):
-        if len(indices) > 1:
-            surrounding_indices = indices[n, 1:]
+        if self.pdf_rtol is None:
+            return self._exact_pdf_chunk(x)
+
+        def log_kernel(rows, cols, distances):
+            whitened = np.einsum("pij,pj->pi", self.chol_invs[cols],
+                                 x[rows] - self.X_arr[cols])
+            return (-.5 * (whitened**2).sum(axis=1)
+                    - self.log_normalization[cols])
+
+        w = np.asarray(self.w)
+        dens, exact = truncated_mixture_density(
+            self._tree, x, self._radius, w / w.sum(), log_kernel,
+            self._log_bound, self.pdf_rtol)
+        if exact.any():
+            dens[exact] = self._exact_pdf_chunk(x[exact])
+        return dens
+
+    def _exact_pdf_chunk(self, x):
+        """
+        Mixture density at the rows of x, using a
+        (len(x), n_particles, dim) array of whitened differences.
+        """
+        distance = self.X_arr[None, :, :] - x[:, None, :]
+        whitened = np.einsum("nij,mnj->mni", self.chol_invs, distance)
+        cov_distance = (whitened**2).sum(axis=2)
+        kernel = np.exp(-.5 * cov_distance - self.log_normalization)
+        w = np.asarray(self.w)
+        return kernel @ w / w.sum()
+
+    def _covs(self, indices):
+        """
+        Weighted covariances around all local support vectors,
+        stacked into an (n_particles, dim, dim) array.
+        """
+        n_particles, dim = self.X_arr.shape
+        if n_particles > 1:
+            surrounding_indices = indices[:, 1:]
             nearest_vector_deltas = (self.X_arr[surrounding_indices]
-                                     - self.X_arr[n])
+                                     - self.X_arr[:, None, :])
             local_weights = self.w[surrounding_indices]
         else:
-            nearest_vector_deltas = sp.absolute(self.X_arr)
-            local_weights = sp.array([1])
-        cov = smart_cov(nearest_vector_deltas,
-                        local_weights / local_weights.sum())
-        if sp.absolute(cov.sum()) == 0:
-            for k in range(cov.shape[0]):
-                cov[k, k] = sp.absolute(self.X_arr[0, k])
-        return cov * self.scaling
+            nearest_vector_deltas = np.absolute(self.X_arr)[None, :, :]
+            local_weights = np.ones((1, 1))
+        local_weights = local_weights / local_weights.sum(axis=1)[:, None]
+
+        if nearest_vector_deltas.shape[1] == 1:
+            # a single sample, see smart_cov
+            covs = np.zeros((n_particles, dim, dim))
+            diagonal = np.arange(dim)
+            covs[:, diagonal, diagonal] = np.absolute(
+                nearest_vector_deltas[:, 0, :])
+        else:
+            # weighted covariance as in np.cov(aweights=...)
+            means = np.einsum("nk,nki->ni",
+                              local_weights, nearest_vector_deltas)
+            centered = nearest_vector_deltas - means[:, None, :]
+            covs = np.einsum("nk,nki,nkj->nij",
+                             local_weights, centered, centered)
+            covs /= (1 - (local_weights**2).sum(axis=1))[:, None, None]
+
+        zero = np.absolute(covs.sum(axis=(1, 2))) == 0
+        for k in range(dim):
+            covs[zero, k, k] = np.absolute(self.X_arr[0, k])
+        return covs * self.scaling
+
+    def _cholesky(self, covs):
+        """
+        Batched Cholesky factors of the covariances. Scaled identity
+        matrices are added to the covariances which are not positive
+        definite until they are.
+        """
+        identity = np.identity(covs.shape[1])
+        bad = np.arange(len(covs))
+        while True:
+            eigenvalues = np.linalg.eigvalsh(covs[bad])
+            tolerance = (covs.shape[1] * np.finfo(float).eps
+                         * np.absolute(eigenvalues).max(axis=1))
+            bad = bad[eigenvalues[:, 0] <= tolerance]
+            if len(bad) == 0:
+                return np.linalg.cholesky(covs)
+            covs[bad] += identity * self.EPS
 
     def rvs_single(self):
-        support_index = sp.random.choice(self.w.shape[0], p=self.w)
-        sample = sp.random.multivariate_normal(self.X_arr[support_index],
-                                               self.covs[support_index])
-        return pd.Series(sample, index=self.X.columns)
+        return self.rvs(1).iloc[0]
+
+    def rvs(self, size=None):
+        if size is None:
+            return self.rvs_single()
+        if self.no_parameters:
+            return super().rvs(size)
+        support_indices = np.random.choice(self.w.shape[0], size=size,
+                                           p=self.w)
+        noise = np.einsum("nij,nj->ni", self.chols[support_indices],
+                          np.random.standard_normal(
+                              (size, self.X_arr.shape[1])))
+        return pd.DataFrame(self.X_arr[support_indices] + noise,
+                            columns=self.X.columns)
@@ -3,9 +3,10 @@ from typing import Union
 import numpy as np
 import pandas as pd
 import scipy.stats as st
+from scipy.spatial import cKDTree
 from .exceptions import NotEnoughParticles
 from .base import Transition
-from .util import smart_cov
+from .util import smart_cov, truncated_mixture_density
 
 
 def scott_rule_of_thumb(n_samples, dimension):
@@ -53,15 +54,31 @@ class MultivariateNormalTransition(Transition):
         where n_samples denotes the (effective) samples size (and is therefore)
         a float and dimension is the parameter dimension.
 
+    pdf_rtol: float, optional
+        If given, :meth:`pdf` only sums over the particles in a
+        neighborhood of each point, found via a KD-tree in the
+        Mahalanobis metric of the kernel. Points for which the relative
+        error cannot be guaranteed to be below ``pdf_rtol`` are evaluated
+        exactly. Defaults to None, i.e. exact evaluation throughout.
+
     """
-    def __init__(self, scaling=1, bandwidth_selector=silverman_rule_of_thumb):
+    #: Maximum number of entries of the intermediate
+    #: (points x particles x parameters) array in :meth:`pdf`.
+    #: Larger point sets are evaluated in chunks.
+    PDF_CHUNK_SIZE = 2 ** 22
+
+    def __init__(self, scaling=1, bandwidth_selector=silverman_rule_of_thumb,
+                 pdf_rtol=None):
         self.scaling = scaling
         self.bandwidth_selector = bandwidth_selector
+        self.pdf_rtol = pdf_rtol
 
     def fit(self, X: pd.DataFrame, w: np.ndarray):
         if len(X) == 0:
             raise NotEnoughParticles("Fitting not possible.")
         self._X_arr = X.as_matrix()
+        # exactly normalized, as required by np.random.choice
+        self._p = np.asarray(w) / np.sum(w)
         sample_cov = smart_cov(self._X_arr, w)
         dim = sample_cov.shape[0]
         eff_sample_size = 1 / (w**2).sum()
@@ -69,18 +86,79 @@ class MultivariateNormalTransition(Transition):
         self.cov = sample_cov * bw_factor**2 * self.scaling
         self.normal = st.multivariate_normal(cov=self.cov, allow_singular=True)
 
+        # the Cholesky factor is only available for a regular covariance,
+        # otherwise sampling and density fall back to numpy and scipy
+        try:
+            self._chol = np.linalg.cholesky(self.cov)
+        except np.linalg.LinAlgError:
+            self._chol = None
+        else:
+            self._chol_inv = np.linalg.inv(self._chol)
+            self._log_norm = (- .5 * dim * np.log(2 * np.pi)
+                              - np.log(np.diag(self._chol)).sum())
+            if self.pdf_rtol is not None:
+                # in whitened coordinates, the Mahalanobis distance
+                # is the Euclidean distance
+                self._tree = cKDTree(self._X_arr @ self._chol_inv.T)
+                self._radius = np.sqrt(
+                    -2 * np.log(self.pdf_rtol / len(self._X_arr)))
+
     def rvs_single(self):
-        sample = self.X.sample(weights=self.w).iloc[0]
-        perturbed = (sample +
-                     np.random.multivariate_normal(
-                         np.zeros(self.cov.shape[0]), self.cov))
-        return perturbed
+        return self.rvs(1).iloc[0]
+
+    def rvs(self, size=None):
+        if size is None:
+            return self.rvs_single()
+        if self.no_parameters:
+            return super().rvs(size)
+        indices = np.random.choice(len(self._X_arr), size=size, p=self._p)
+        if self._chol is not None:
+            noise = (np.random.standard_normal((size, self.cov.shape[0]))
+                     @ self._chol.T)
+        else:
+            noise = np.random.multivariate_normal(
+                np.zeros(self.cov.shape[0]), self.cov, size=size)
+        return pd.DataFrame(self._X_arr[indices] + noise,
+                            columns=self.X.columns)
 
     def pdf(self, x: Union[pd.Series, pd.DataFrame]):
         x = x[self.X.columns]
         x = np.array(x)
         if len(x.shape) == 1:
             x = x[None, :]
-        dens = np.array([(self.normal.pdf(xs - self._X_arr) * self.w).sum()
-                         for xs in x])
+        n_particles, dim = self._X_arr.shape
+        chunk_size = max(1, self.PDF_CHUNK_SIZE // (n_particles * dim))
+        dens = np.zeros(len(x))
+        for start in range(0, len(x), chunk_size):
+            dens[start:start + chunk_size] = self._pdf_chunk(
+                x[start:start + chunk_size])
         return dens if dens.size != 1 else float(dens)
+
+    def _pdf_chunk(self, x: np.ndarray) -> np.ndarray:
+        """
+        Mixture density at the rows of x, truncated if ``pdf_rtol``
+        is set.
+        """
+        if self.pdf_rtol is None or self._chol is None:
+            return self._exact_pdf_chunk(x)
+        dens, exact = truncated_mixture_density(
+            self._tree, x @ self._chol_inv.T, self._radius, np.asarray(self.w),
+            lambda rows, cols, distances: self._log_norm - .5 * distances**2,
+            self._log_norm - .5 * self._radius**2, self.pdf_rtol)
+        if exact.any():
+            dens[exact] = self._exact_pdf_chunk(x[exact])
+        return dens
+
+    def _exact_pdf_chunk(self, x: np.ndarray) -> np.ndarray:
+        """
+        Mixture density at the rows of x, using a
+        (len(x), n_particles, dim) array of differences.
+        """
+        diff = x[:, None, :] - self._X_arr[None, :, :]
+        if self._chol is not None:
+            z = diff @ self._chol_inv.T
+            kernel = np.exp(self._log_norm - .5 * (z**2).sum(axis=2))
+        else:
+            kernel = self.normal.pdf(diff.reshape(-1, diff.shape[2]))
+            kernel = np.reshape(kernel, diff.shape[:2])
+        return kernel @ np.asarray(self.w)
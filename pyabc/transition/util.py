@@ -1,4 +1,6 @@
+from typing import Callable
 import numpy as np
+from scipy.spatial import cKDTree
 
 
 def smart_cov(X_arr, w):
@@ -13,3 +15,59 @@ def smart_cov(X_arr, w):
     cov = np.cov(X_arr, aweights=w, rowvar=False)
     cov = np.atleast_2d(cov)
     return cov
+
+
+def truncated_mixture_density(support_tree: cKDTree, query: np.ndarray,
+                              radius: float, w: np.ndarray,
+                              log_kernel: Callable, log_bound: float,
+                              rtol: float):
+    """
+    Mixture density at the rows of ``query``, summing only over the
+    support points within ``radius`` of each query point.
+
+    Parameters
+    ----------
+
+    support_tree: cKDTree
+        Tree over the support points, in the coordinates in which
+        ``radius`` applies.
+
+    query: np.ndarray
+        The query points, in the same coordinates.
+
+    radius: float
+        The neighborhood cutoff.
+
+    w: np.ndarray
+        The normalized weights of the support points.
+
+    log_kernel: Callable
+        Called as ``log_kernel(rows, cols, distances)`` for the
+        (query point, support point) pairs within the radius,
+        returns the log kernel values of these pairs.
+
+    log_bound: float
+        Logarithm of an upper bound of the kernel values of support
+        points outside of the radius.
+
+    rtol: float
+        Relative error tolerance.
+
+    Returns
+    -------
+
+    density, exact: np.ndarray, np.ndarray
+        The truncated densities, and a boolean mask of the query points
+        for which the truncation error cannot be guaranteed to be below
+        ``rtol`` and which have to be evaluated exactly.
+    """
+    pairs = cKDTree(query).sparse_distance_matrix(
+        support_tree, radius, output_type="ndarray")
+    rows, cols = pairs["i"], pairs["j"]
+    density = np.bincount(
+        rows, weights=w[cols] * np.exp(log_kernel(rows, cols, pairs["v"])),
+        minlength=len(query))
+    excluded_weight = 1 - np.bincount(rows, weights=w[cols],
+                                      minlength=len(query))
+    error_bound = np.exp(log_bound) * np.maximum(excluded_weight, 0)
+    return density, error_bound > rtol * density
@@ -1,5 +1,13 @@
+import numpy as np
+import pickle
+import time
+from pyabc import ABCSMC, RV, Distribution
 from pyabc.sampler import (MulticoreParticleParallelSampler,
-                           MulticoreEvalParallelSampler)
+                           MulticoreEvalParallelSampler,
+                           SimulationCancelled, cancelled,
+                           raise_if_cancelled)
+from pyabc.sampler.cancellation import cancellable
+from pyabc.sampler.multicore_evaluation_parallel import GENERATION
 from pyabc.population import Particle
 import pytest
 from multiprocessing import ProcessError
@@ -37,3 +45,117 @@ def raise_exception(*args):
 def test_exception_from_worker_propagated(sampler):
     with pytest.raises(ProcessError):
         sampler.sample_until_n_accepted(10, raise_exception)
+
+
+def accept_one():
+    return Particle(0, {}, 1, [1], [1], [], True)
+
+
+def test_persistent_pool_survives_generations():
+    with MulticoreEvalParallelSampler(n_procs=2, persistent=True) as sampler:
+        sampler.sample_until_n_accepted(10, accept_one)
+        processes = sampler._pool[0]
+        sample = sampler.sample_until_n_accepted(5, accept_one)
+        assert sample.n_accepted == 5
+        assert sampler._pool[0] is processes
+        assert all(proc.is_alive() for proc in processes)
+    assert sampler._pool is None
+    assert not any(proc.is_alive() for proc in processes)
+
+
+def test_persistent_pool_exception_propagated():
+    sampler = MulticoreEvalParallelSampler(n_procs=2, persistent=True)
+    with pytest.raises(ProcessError):
+        sampler.sample_until_n_accepted(10, raise_exception)
+    assert sampler._pool is None
+    assert sampler.sample_until_n_accepted(3, accept_one).n_accepted == 3
+    sampler.stop()
+
+
+def test_persistent_pool_sends_static_objects_once():
+    static_object = {"x": list(range(1000))}
+
+    def simulate_one():
+        return Particle(0, {"n": len(static_object["x"])}, 1, [1], [{}],
+                        [], True)
+    simulate_one.static_objects = [static_object]
+
+    with MulticoreEvalParallelSampler(n_procs=2, persistent=True) as sampler:
+        sampler.sample_until_n_accepted(3, simulate_one)
+        _, _, new_static, static_hashes, _ = pickle.loads(
+            sampler._dump_task(GENERATION, (simulate_one, None),
+                               simulate_one.static_objects, 0, 1))
+        assert new_static == {} and len(static_hashes) == 1
+        # the workers still hold the static object
+        sample = sampler.sample_until_n_accepted(3, simulate_one)
+        assert all(particle.parameter["n"] == 1000
+                   for particle in sample.accepted_particles)
+
+
+def accept_large_sum_stat():
+    sum_stat = {"large": np.arange(10 ** 5, dtype=float), "small": 1}
+    return Particle(0, {}, 1, [1], [sum_stat], [sum_stat], True)
+
+
+@pytest.mark.parametrize("sampler_class", [MulticoreParticleParallelSampler,
+                                           MulticoreEvalParallelSampler])
+def test_shared_arrays(sampler_class):
+    sampler = sampler_class(n_procs=2, shared_arrays=True)
+    sampler.sample_factory.record_all_sum_stats = True
+    sample = sampler.sample_until_n_accepted(4, accept_large_sum_stat)
+    for sum_stat in sample.all_sum_stats:
+        assert isinstance(sum_stat["large"], np.ndarray)
+        assert (sum_stat["large"] == np.arange(10 ** 5)).all()
+        assert sum_stat["small"] == 1
+
+
+def accept_half():
+    return Particle(0, {}, 1, [1], [1], [], np.random.rand() < .5)
+
+
+def test_batched_eval_parallel_sampler():
+    sampler = MulticoreEvalParallelSampler(n_procs=2, batch_size=7)
+    sample = sampler.sample_until_n_accepted(20, accept_half)
+    assert sample.n_accepted == 20
+    assert sampler.nr_evaluations_ % 7 == 0
+
+
+def test_cancellation_check():
+    assert not cancelled()
+    with cancellable(lambda: True):
+        assert cancelled()
+        with pytest.raises(SimulationCancelled):
+            raise_if_cancelled()
+    assert not cancelled()
+    raise_if_cancelled()
+
+
+def accept_cancellable():
+    for _ in range(50):
+        raise_if_cancelled()
+        time.sleep(.001)
+    return Particle(0, {}, 1, [1], [1], [], np.random.rand() < .5)
+
+
+def test_cancelled_evaluations_are_discarded():
+    sampler = MulticoreEvalParallelSampler(n_procs=4)
+    sample = sampler.sample_until_n_accepted(6, accept_cancellable)
+    assert sample.n_accepted == 6
+
+
+def test_look_ahead():
+    def model(pars):
+        return {"y": pars["x"] + .1 * np.random.randn()}
+
+    prior = Distribution(x=RV("norm", 0, 1))
+    sampler = MulticoreEvalParallelSampler(n_procs=2, look_ahead=True)
+    abc = ABCSMC(model, prior, lambda x, y: abs(x["y"] - y["y"]),
+                 population_size=50, sampler=sampler)
+    abc.new("sqlite://", {"y": .5})
+    history = abc.run(minimum_epsilon=0, max_nr_populations=4)
+
+    assert sampler._pool is None
+    for t in range(4):
+        df, w = history.get_distribution(0, t)
+        assert len(w) == 50 and (w > 0).all()
+    assert abs((df.x * w).sum() - .5) < .3
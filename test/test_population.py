@@ -0,0 +1,77 @@
+import numpy as np
+from pyabc.parameters import Parameter
+from pyabc.population import Particle, Population
+
+
+def make_particles():
+    return [Particle(0, Parameter({"a": 1, "b": 2}), 1, [.1], [{"s": 1}],
+                     [{"s": 1}], True),
+            Particle(1, Parameter({"c": 3}), 3, [.2, .3], [{"s": 2}, {"s": 3}],
+                     [{"s": 2}, {"s": 3}], True),
+            Particle(0, Parameter({"a": 4, "b": 5}), 3, [.4], [{"s": 4}],
+                     [{"s": 4}], True)]
+
+
+def test_normalization_does_not_modify_particles():
+    particles = make_particles()
+    population = Population(particles)
+
+    assert [particle.weight for particle in particles] == [1, 3, 3]
+    assert population.get_model_probabilities() == {0: 4 / 7, 1: 3 / 7}
+
+    store = population.to_dict()
+    assert [particle.weight for particle in store[0]] == [.25, .75]
+    assert [particle.weight for particle in store[1]] == [1]
+    assert store[0][1].parameter == particles[2].parameter
+
+
+def test_weighted_distances():
+    population = Population(make_particles())
+    df = population.get_weighted_distances()
+
+    assert np.allclose(df.distance, [.1, .2, .3, .4])
+    assert np.allclose(df.w, [1 / 7, 3 / 7, 3 / 7, 3 / 7])
+
+
+def test_update_distances():
+    population = Population(make_particles())
+    population.update_distances(lambda sum_stat: sum_stat["s"] * 10)
+
+    assert np.allclose(population.get_weighted_distances().distance,
+                       [10, 20, 30, 40])
+    assert population.to_dict()[1][0].accepted_distances == [20, 30]
+
+
+def test_parameter_matrix():
+    population = Population(make_particles())
+    matrix, names = population.get_parameter_matrix()
+
+    assert names == ["a", "b", "c"]
+    assert np.array_equal(matrix[[0, 2]][:, :2], [[1, 2], [4, 5]])
+    assert np.isnan(matrix[1, 0]) and matrix[1, 2] == 3
+
+
+def test_distribution():
+    population = Population(make_particles())
+    df, w = population.get_distribution(0)
+
+    assert list(df.columns) == ["a", "b"]
+    assert np.array_equal(df.as_matrix(), [[1, 2], [4, 5]])
+    assert np.allclose(w, [.25, .75])
+
+
+def test_distribution_flattens_parameters_as_the_database():
+    particles = [Particle(0, Parameter({"a": {"x": 1, "y": 2}, "b": True}),
+                          1, [.1], [{}], [{}], True),
+                 Particle(1, Parameter({"c": np.nan}), 1, [.1], [{}], [{}],
+                          True)]
+    population = Population(particles)
+
+    df, _ = population.get_distribution(0)
+    assert list(df.columns) == ["a_x", "a_y", "b"]
+    assert np.array_equal(df.as_matrix(), [[1, 2, 1]])
+    # columns are chosen by the keys, not by the values
+    df, _ = population.get_distribution(1)
+    assert list(df.columns) == ["c"] and np.isnan(df.c[0])
+    df, w = population.get_distribution(2)
+    assert df.shape == (0, 0) and len(w) == 0
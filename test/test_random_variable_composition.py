@@ -1,7 +1,33 @@
 import unittest
+import numpy as np
+import pandas as pd
 
 from pyabc.parameters import Parameter
-from pyabc.random_variables import RV, Distribution
+from pyabc.random_variables import (RV, RVBase, Distribution,
+                                    LowerBoundDecorator)
+
+
+class ScalarUniform(RVBase):
+    """
+    A user defined random variable, which is not vectorized.
+    """
+
+    def copy(self):
+        return ScalarUniform()
+
+    def rvs(self):
+        return np.random.rand()
+
+    def pmf(self, x):
+        return 0.
+
+    def pdf(self, x: float):
+        if 0 <= x <= 1:
+            return 1.
+        return 0.
+
+    def cdf(self, x: float):
+        return min(max(x, 0.), 1.)
 
 
 class TextRVComposition(unittest.TestCase):
@@ -33,5 +59,27 @@ class TestRVInitialization(unittest.TestCase):
         self.assertEqual(0, a.rvs())
 
 
+class TestVectorizedDistribution(unittest.TestCase):
+    def setUp(self):
+        self.d = Distribution(
+            a=RV("uniform", 0, 1), b=ScalarUniform(),
+            c=LowerBoundDecorator(RV("norm", 0, 1), 0))
+        self.df = pd.DataFrame({"a": [.5, 2., .5], "b": [.5, .5, 2.],
+                                "c": [1., 1., 1.]})
+
+    def test_pdf_of_data_frame(self):
+        densities = self.d.pdf(self.df)
+        expected = [self.d.pdf(Parameter(row))
+                    for row in self.df.to_dict("records")]
+        np.testing.assert_allclose(densities, expected)
+        self.assertEqual(0, densities[2])
+
+    def test_rvs_of_size(self):
+        df = self.d.rvs(size=5)
+        self.assertEqual(["a", "b", "c"], sorted(df.columns))
+        self.assertEqual(5, len(df))
+        self.assertTrue((self.d.pdf(df) > 0).all())
+
+
 if __name__ == "__main__":
     unittest.main()
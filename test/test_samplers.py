@@ -1,5 +1,14 @@
+import asyncio
+import itertools
 import multiprocessing
+import threading
+import time
+from types import SimpleNamespace
+from subprocess import Popen
+import psutil
 import pytest
+from redis import StrictRedis
+import numpy as np
 import scipy as sp
 import scipy.stats as st
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
@@ -7,11 +16,17 @@ from pyabc import (ABCSMC, RV, Distribution,
                    MedianEpsilon,
                    PercentileDistanceFunction, SimpleModel,
                    ConstantPopulationSize)
-from pyabc.sampler import (SingleCoreSampler, MappingSampler,
+from pyabc.population import Particle
+from pyabc.sampler import (Sample, SingleCoreSampler, MappingSampler,
+                           AsyncioSampler,
+                           EvalParallelMappingSampler,
                            MulticoreParticleParallelSampler,
                            DaskDistributedSampler,
                            ConcurrentFutureSampler,
                            MulticoreEvalParallelSampler,
+                           ThreadEvalParallelSampler,
+                           thread_rng,
+                           RedisEvalParallelSampler,
                            RedisEvalParallelSamplerServerStarter)
 
 
@@ -49,6 +64,11 @@ class MultiProcessingMappingSampler(MappingSampler):
         super().__init__(multi_proc_map)
 
 
+class MultiProcessingEvalParallelMappingSampler(EvalParallelMappingSampler):
+    def __init__(self, map=None):
+        super().__init__(multi_proc_map, tasks_per_wave=8)
+
+
 class DaskDistributedSamplerBatch(DaskDistributedSampler):
     def __init__(self, map=None):
         batchsize = 20
@@ -59,17 +79,26 @@ def RedisEvalParallelSamplerServerStarterWrapper():
     return RedisEvalParallelSamplerServerStarter(batch_size=5)
 
 
+def RedisEvalParallelSamplerAdaptiveBatchWrapper():
+    return RedisEvalParallelSamplerServerStarter(adapt_batch_size=True)
+
+
 @pytest.fixture(params=[SingleCoreSampler,
                         RedisEvalParallelSamplerServerStarterWrapper,
+                        RedisEvalParallelSamplerAdaptiveBatchWrapper,
                         MulticoreEvalParallelSampler,
                         MultiProcessingMappingSampler,
                         MulticoreParticleParallelSampler,
                         MappingSampler,
+                        EvalParallelMappingSampler,
+                        MultiProcessingEvalParallelMappingSampler,
                         DaskDistributedSampler,
                         DaskDistributedSamplerBatch,
                         GenericFutureWithThreadPool,
                         GenericFutureWithProcessPool,
-                        GenericFutureWithProcessPoolBatch
+                        GenericFutureWithProcessPoolBatch,
+                        AsyncioSampler,
+                        ThreadEvalParallelSampler
                         ])
 def sampler(request):
     s = request.param()
@@ -167,3 +196,386 @@ def test_in_memory(redis_starter_sampler):
     db_path = "sqlite://"
     two_competing_gaussians_multiple_population(db_path,
                                                 redis_starter_sampler, 1)
+
+
+def test_sample_merge_keeps_accepted_and_rejected_apart():
+    def particle(accepted):
+        return Particle(0, {}, 1, [1], [{"s": 1}], [{"s": 2}], accepted)
+
+    samples = []
+    for _ in range(3):
+        sample = Sample(record_all_sum_stats=True)
+        sample.append(particle(False))
+        sample.append(particle(True))
+        samples.append(sample)
+
+    merged = Sample.merge(samples)
+    assert merged.n_accepted == 3
+    assert merged.record_all_sum_stats
+    assert len(merged.all_sum_stats) == 6
+    assert len(merged.get_accepted_population()) == 3
+    assert (samples[0] + samples[1]).n_accepted == 2
+
+    not_recording = Sample()
+    not_recording.append(particle(False))
+    assert not_recording.n_accepted == 0
+    assert not_recording.all_sum_stats == []
+
+
+def test_payload_static_objects_loaded_once():
+    from pyabc.sampler import payload
+
+    static_object = {"x": list(range(1000))}
+    changing = [0]
+
+    def f():
+        return len(static_object["x"]) + changing[0]
+
+    fetched = []
+
+    def fetch(content_hash):
+        fetched.append(content_hash)
+        return static[content_hash]
+
+    cache = {}
+    for generation in range(3):
+        changing[0] = generation
+        dump, static = payload.dumps(f, [static_object])
+        assert len(dump) < len(static[next(iter(static))])
+        assert payload.loads(dump, fetch, cache)() == 1000 + generation
+    assert len(fetched) == 1
+
+
+def test_adapt_batch_size():
+    from pyabc.sampler.redis_eps.cli import adapt_batch_size
+
+    # latency of 19 simulations allows a batch size of 19 * 19 at 5%
+    assert adapt_batch_size(.001, .019, .05, 10000, .5, 1) == 361
+    # fast simulations are bounded by the maximum batch size
+    assert adapt_batch_size(0, .01, .05, 10000, .5, 1) == 1000
+    # at the end of a population, the share of the worker is the bound
+    assert adapt_batch_size(.001, .019, .05, 10, .5, 4) == 5
+    assert adapt_batch_size(.001, .019, .05, 0, .5, 4) == 1
+
+
+def test_redis_frame_roundtrip():
+    from pyabc.parameters import Parameter
+    from pyabc.sampler.redis_eps import frame
+
+    sum_stats = [{"a": np.arange(6.).reshape(2, 3), "b": 1.5}
+                 for _ in range(3)]
+    sample = Sample(record_all_sum_stats=True)
+    sample.append(Particle(1, Parameter({"x": 1.}), 0, [], [],
+                           [sum_stats[0]], False))
+    sample.append(Particle(0, Parameter({"x": 2., "y": 3.}), .5,
+                           [.1, .2], sum_stats[1:], sum_stats[1:], True))
+
+    particle_id, decoded = frame.decode(frame.encode(7, sample))
+    assert particle_id == 7 and decoded.record_all_sum_stats
+    accepted, = decoded.accepted_particles
+    assert accepted.m == 0 and accepted.weight == .5
+    assert dict(accepted.parameter) == {"x": 2., "y": 3.}
+    assert accepted.accepted_distances == [.1, .2]
+    # shared summary statistics stay shared
+    assert accepted.accepted_sum_stats[0] is accepted.all_sum_stats[0]
+    assert (accepted.accepted_sum_stats[1]["a"] == sum_stats[2]["a"]).all()
+    # arrays can be modified in place
+    accepted.accepted_sum_stats[1]["a"] += 1
+    assert len(decoded.all_sum_stats) == 3
+    assert decoded.all_sum_stats[0]["b"] == 1.5
+
+    # non-float parameters are pickled
+    sample = Sample()
+    sample.append(Particle(0, Parameter({"n": 3}), 1, [0], [{}], [{}],
+                           True))
+    _, decoded = frame.decode(frame.encode(0, sample))
+    assert decoded.accepted_particles[0].parameter["n"] == 3
+
+
+def test_concurrent_redis_runs(redis_starter_sampler):
+    port = redis_starter_sampler.redis.connection_pool.connection_kwargs[
+        "port"]
+    samplers = [redis_starter_sampler,
+                RedisEvalParallelSampler(port=port, batch_size=5,
+                                         priority=1)]
+    assert samplers[0].run_id != samplers[1].run_id
+
+    # both runs are served by the same workers at the same time
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(
+            two_competing_gaussians_multiple_population,
+            "sqlite://", sampler, 1) for sampler in samplers]
+        for future in futures:
+            future.result()
+
+
+@pytest.fixture
+def redis_server():
+    # a bare server, without workers
+    port = max(c.laddr[1] for c in psutil.net_connections()) + 1
+    server = Popen(["redis-server", "--port", str(port)])
+    time.sleep(1)
+    yield StrictRedis(port=port)
+    server.terminate()
+    server.wait()
+
+
+def test_redis_workers_without_lease_are_dropped(redis_server):
+    from pyabc.sampler.redis_eps.cli import WorkerLease
+    from pyabc.sampler.redis_eps.cmd import WORKERS, key, live_workers
+
+    redis = redis_server
+    lease = WorkerLease(redis, "test_run")
+    assert lease.acquire() == 1
+    # a killed worker, whose lease has expired
+    redis.sadd(key("test_run", WORKERS), "dead_worker")
+    assert live_workers(redis, "test_run") == 1
+    assert redis.scard(key("test_run", WORKERS)) == 1
+    lease.release()
+    assert live_workers(redis, "test_run") == 0
+
+
+def test_redis_cutoff_check_queries_at_most_every_sleep_time(redis_server):
+    from pyabc.sampler.redis_eps.cli import CutoffCheck
+    from pyabc.sampler.redis_eps.cmd import (CUTOFF, GENERATION, SLEEP_TIME,
+                                             key)
+
+    redis = redis_server
+    redis.set(key("test_run", GENERATION), 1)
+    check = CutoffCheck(redis, "test_run", 5, b"1")
+    assert not check()
+    redis.set(key("test_run", CUTOFF), 3)
+    # the cached answer, also when polled in a tight loop
+    assert not any(check() for _ in range(1000))
+    time.sleep(SLEEP_TIME)
+    assert check()
+
+
+def test_eval_parallel_mapping_sampler_returns_smallest_ids():
+    calls = []
+
+    def logging_map(function, tasks):
+        calls.append(list(tasks))
+        return map(function, calls[-1])
+
+    counter = [0]
+
+    def simulate_one():
+        # every third evaluation is accepted
+        counter[0] += 1
+        return Particle(0, {"id": counter[0]}, 1, [0], [{}], [{}],
+                        counter[0] % 3 == 0)
+
+    sampler = EvalParallelMappingSampler(logging_map, mapper_pickles=True,
+                                         tasks_per_wave=4)
+    sample = sampler.sample_until_n_accepted(5, simulate_one)
+
+    assert [particle.parameter["id"]
+            for particle in sample.accepted_particles] == [3, 6, 9, 12, 15]
+    # the first wave expects all evaluations to be accepted
+    assert calls[0] == [(0, 2), (2, 2), (4, 2)]
+    # later waves are sized by the observed acceptance rate
+    assert len(calls) > 1 and calls[1][0][0] == 6
+    assert sampler.nr_evaluations_ == sum(
+        size for wave in calls for _, size in wave)
+
+
+def test_eval_parallel_mapping_sampler_raises_if_a_wave_fails():
+    def failing_map(function, tasks):
+        # as e.g. the SGE map, return the exceptions of failed tasks
+        return [ValueError(task) for task in tasks]
+
+    sampler = EvalParallelMappingSampler(failing_map, mapper_pickles=True,
+                                         tasks_per_wave=4)
+    with pytest.raises(ValueError):
+        sampler.sample_until_n_accepted(5, lambda: None)
+
+
+def test_asyncio_sampler_evaluates_async_models_concurrently():
+    running = [0, 0]
+
+    async def model(pars):
+        # count the concurrently running evaluations
+        running[0] += 1
+        running[1] = max(running)
+        try:
+            await asyncio.sleep(.01 * np.random.rand())
+        finally:
+            # also if cancelled
+            running[0] -= 1
+        return {"y": pars["x"] + .1 * np.random.randn()}
+
+    abc = ABCSMC(model, Distribution(x=RV("uniform", 0, 1)),
+                 PercentileDistanceFunction(measures_to_use=["y"]),
+                 ConstantPopulationSize(20), eps=MedianEpsilon(),
+                 sampler=AsyncioSampler(max_concurrency=10))
+    abc.new("sqlite://", {"y": .5})
+    history = abc.run(0, max_nr_populations=2)
+
+    assert history.max_t == 1
+    assert 1 < running[1] <= 10
+    assert abc.sampler.nr_evaluations_ >= 20
+
+
+def test_asyncio_sampler_returns_smallest_ids():
+    counter = [0]
+
+    async def async_simulate_one():
+        # later evaluations finish first
+        particle_id = counter[0]
+        counter[0] += 1
+        await asyncio.sleep(.01 * (10 - particle_id % 10))
+        return Particle(0, {"id": particle_id}, 1, [0], [{}], [{}],
+                        particle_id % 2 == 0)
+
+    def simulate_one():
+        pass
+    simulate_one.async_simulate_one = async_simulate_one
+
+    sampler = AsyncioSampler(max_concurrency=10)
+    sample = sampler.sample_until_n_accepted(3, simulate_one)
+
+    assert [particle.parameter["id"]
+            for particle in sample.accepted_particles] == [0, 2, 4]
+    # finished evaluations are replaced until 3 particles are accepted
+    assert sampler.nr_evaluations_ >= 10
+
+
+def test_asyncio_sampler_cancels_evaluations_on_error():
+    counter = [0]
+    cancelled = []
+
+    async def async_simulate_one():
+        particle_id = counter[0]
+        counter[0] += 1
+        if particle_id == 0:
+            raise ValueError()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(particle_id)
+            raise
+
+    def simulate_one():
+        pass
+    simulate_one.async_simulate_one = async_simulate_one
+
+    with pytest.raises(ValueError):
+        AsyncioSampler(max_concurrency=5).sample_until_n_accepted(
+            3, simulate_one)
+    assert sorted(cancelled) == [1, 2, 3, 4]
+
+
+def test_asyncio_sampler_in_running_event_loop():
+    async def async_simulate_one():
+        await asyncio.sleep(0)
+        return Particle(0, {}, 1, [0], [{}], [{}], True)
+
+    def simulate_one():
+        pass
+    simulate_one.async_simulate_one = async_simulate_one
+
+    async def main():
+        # e.g. within a Jupyter notebook
+        return AsyncioSampler().sample_until_n_accepted(5, simulate_one)
+
+    loop = asyncio.new_event_loop()
+    try:
+        sample = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    assert len(sample.accepted_particles) == 5
+
+
+def test_async_model_sampled_in_running_event_loop():
+    async def model(pars):
+        await asyncio.sleep(0)
+        return {"y": pars["x"]}
+
+    async def main():
+        # synchronous access, e.g. within a Jupyter notebook
+        return SimpleModel(model).sample({"x": 1})
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(main()) == {"y": 1}
+    finally:
+        loop.close()
+
+
+def test_thread_sampler_uses_thread_local_generators():
+    counter = itertools.count()
+    rngs = set()
+
+    def simulate_one():
+        particle_id = next(counter)
+        rngs.add(id(thread_rng()))
+        time.sleep(.001 * (10 - particle_id % 10))
+        return Particle(0, {"id": particle_id}, 1, [0], [{}], [{}],
+                        particle_id % 2 == 0)
+
+    sampler = ThreadEvalParallelSampler(n_threads=4)
+    sample = sampler.sample_until_n_accepted(5, simulate_one)
+
+    assert len(sample.accepted_particles) == 5
+    assert sampler.nr_evaluations_ >= 9
+    # each thread draws from its own generator
+    assert len(rngs) == 4
+
+
+def test_thread_sampler_returns_first_accepted_by_id(monkeypatch):
+    from pyabc.sampler import thread_evaluation_parallel
+
+    reserved = threading.local()
+
+    class RecordingCount:
+        """
+        The sampler's ID counter, recording the ID each thread reserved.
+        """
+
+        def __init__(self, start, step):
+            self._ids = itertools.count(start, step)
+
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            reserved.id = next(self._ids)
+            return reserved.id
+
+    monkeypatch.setattr(thread_evaluation_parallel, "itertools",
+                        SimpleNamespace(count=RecordingCount))
+
+    def simulate_one():
+        particle_id = reserved.id
+        # later evaluations finish earlier
+        time.sleep(.001 * (10 - particle_id % 10))
+        return Particle(0, {"id": particle_id}, 1, [0], [{}], [{}],
+                        particle_id % 3 == 0)
+
+    sampler = ThreadEvalParallelSampler(n_threads=4)
+    sample = sampler.sample_until_n_accepted(5, simulate_one)
+
+    assert [particle.parameter["id"]
+            for particle in sample.accepted_particles] == [0, 3, 6, 9, 12]
+
+
+def test_sampler_stopped_if_run_fails():
+    class FailingSampler(SingleCoreSampler):
+        stopped = False
+
+        def sample_until_n_accepted(self, n, simulate_one):
+            raise ValueError()
+
+        def stop(self):
+            self.stopped = True
+
+    sampler = FailingSampler()
+    abc = ABCSMC(lambda pars: {"y": pars["x"]},
+                 Distribution(x=RV("uniform", 0, 1)),
+                 PercentileDistanceFunction(measures_to_use=["y"]),
+                 ConstantPopulationSize(10), sampler=sampler)
+    abc.new("sqlite://", {"y": .5})
+    with pytest.raises(ValueError):
+        abc.run(0, max_nr_populations=1)
+    assert sampler.stopped
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import scipy.stats as st
+from pyabc import ABCSMC, RV, RVBase, Distribution
+from pyabc.population import Particle
+from pyabc.sampler import SingleCoreSampler
+from pyabc.sampler.base import simulate_batch
+
+
+def test_batch_proposals_valid_according_to_prior():
+    def model(pars):
+        return {"y": pars["x"]}
+
+    prior = Distribution(x=RV("uniform", 0, 1))
+    abc = ABCSMC([model, model], [prior, prior],
+                 lambda x, y: abs(x["y"] - y["y"]))
+    # wide transition, such that many proposals are outside the prior
+    df = pd.DataFrame({"x": [.1, .5, .9]})
+    for m in range(2):
+        abc.transitions[m].fit(df, np.ones(3) / 3)
+        abc.transitions[m].cov *= 100
+
+    ms, thetas = abc._generate_valid_proposals(
+        1, np.array([0, 1]), np.array([.3, .7]), 500)
+
+    assert len(ms) == len(thetas) == 500
+    assert set(ms) <= {0, 1}
+    xs = np.array([theta["x"] for theta in thetas])
+    assert ((0 <= xs) & (xs <= 1)).all()
+
+
+def test_batch_weights_match_single_particle_formula():
+    def model(pars):
+        return {"y": pars["x"]}
+
+    prior = Distribution(x=RV("norm", 0, 1))
+    abc = ABCSMC(model, prior, lambda x, y: abs(x["y"] - y["y"]))
+    df = pd.DataFrame({"x": st.norm().rvs(size=20)})
+    abc.transitions[0].fit(df, np.ones(20) / 20)
+    model_probabilities = pd.DataFrame({"p": [1.]}, index=[0])
+
+    particles = [Particle(0, {"x": x}, 0, [.1], [{}], [{}], True)
+                 for x in [-.5, 0, 1.5]]
+    abc._calc_proposal_weights(particles, 1, model_probabilities)
+
+    for particle in particles:
+        expected = (prior.pdf(particle.parameter)
+                    / abc.transitions[0].pdf(pd.Series(particle.parameter)))
+        assert np.isclose(particle.weight, expected)
+
+
+def test_simulate_batch_falls_back_to_simulate_one():
+    def simulate_one():
+        return Particle(0, {}, 1, [1], [{}], [{}], True)
+
+    assert len(simulate_batch(simulate_one, 3)) == 3
+
+    simulate_one.simulate_batch = lambda k: ["batched"] * k
+    assert simulate_batch(simulate_one, 2) == ["batched", "batched"]
+
+
+def test_scalar_model_prior_in_batch_proposals():
+    class ScalarModelPrior(RVBase):
+        """
+        A user defined model prior, whose rvs takes no size.
+        """
+
+        def copy(self):
+            return ScalarModelPrior()
+
+        def rvs(self):
+            return np.random.randint(2)
+
+        def pmf(self, x):
+            return .5
+
+        def pdf(self, x):
+            return 0.
+
+        def cdf(self, x):
+            return min(max(x + 1, 0), 2) / 2
+
+    def model(pars):
+        return {"y": pars["x"]}
+
+    prior = Distribution(x=RV("uniform", 0, 1))
+    abc = ABCSMC([model, model], [prior, prior],
+                 lambda x, y: abs(x["y"] - y["y"]),
+                 model_prior=ScalarModelPrior())
+    ms, thetas = abc._generate_valid_proposals(0, [0, 1], [.5, .5], 10)
+    assert len(ms) == len(thetas) == 10
+    assert set(ms) <= {0, 1}
+
+
+def test_deferred_weighting():
+    def model(pars):
+        return {"y": pars["x"] + .1 * np.random.randn()}
+
+    prior = Distribution(x=RV("norm", 0, 1))
+    abc = ABCSMC(model, prior, lambda x, y: abs(x["y"] - y["y"]),
+                 population_size=20, sampler=SingleCoreSampler())
+    abc.deferred_weighting = True
+    abc.new("sqlite://", {"y": .5})
+
+    # workers leave the weights to the main process
+    simulate_one = abc._create_simulate_function(
+        0, pd.DataFrame({"p": [1.]}, index=[0]))
+    assert all(particle.weight == 0 and not particle.weighted
+               for particle in simulate_batch(simulate_one, 5))
+
+    history = abc.run(minimum_epsilon=0, max_nr_populations=2)
+    _, w = history.get_distribution(0, 1)
+    assert len(w) == 20 and (w > 0).all()
+
+
+def test_look_ahead_particles_weighted_by_preliminary_proposal():
+    def model(pars):
+        return {"y": pars["x"]}
+
+    prior = Distribution(x=RV("norm", 0, 1))
+    abc = ABCSMC(model, prior, lambda x, y: abs(x["y"] - y["y"]),
+                 population_size=20, sampler=SingleCoreSampler())
+    abc.new("sqlite://", {"y": .5})
+    model_probabilities = pd.DataFrame({"p": [1.]}, index=[0])
+    simulate_one = abc._create_simulate_function(0, model_probabilities)
+    sample = abc.sampler.sample_until_n_accepted(20, simulate_one)
+
+    simulate_look_ahead = simulate_one.look_ahead(sample)
+    particle = simulate_look_ahead()
+    assert not particle.accepted and len(particle.all_sum_stats) == 1
+
+    df, w = sample.get_accepted_population().get_distribution(0)
+    abc.transitions[0].fit(df, w)
+    x = pd.DataFrame([dict(particle.parameter)])
+    assert np.isclose(particle.weight,
+                      prior.pdf(x) / abc.transitions[0].pdf(x))
+
+    # evaluated against the epsilon of the next generation
+    abc.eps.update(1, sample.get_accepted_population()
+                   .get_weighted_distances())
+    weight = particle.weight
+    particle = abc._create_simulate_function(
+        1, model_probabilities).evaluate_look_ahead(particle)
+    assert particle.accepted == (abs(particle.parameter["x"] - .5)
+                                 <= abc.eps(1))
+    assert particle.weight == (weight if particle.accepted else 0)
+    # and not weighted again by deferred weighting
+    assert particle.weighted
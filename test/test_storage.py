@@ -24,21 +24,24 @@ def path():
     return os.path.join(tempfile.gettempdir(), "history_test.db")
 
 
-@pytest.fixture(params=["file", "memory"])
+@pytest.fixture(params=[("file", True), ("memory", True),
+                        ("file", False), ("memory", False)])
 def history(request):
-    # Test in-memory and filesystem based database
-    if request.param == "file":
+    # Test in-memory and filesystem based database,
+    # with and without bulk inserts
+    db_type, bulk_insert = request.param
+    if db_type == "file":
         this_path = "/" + path()
-    elif request.param == "memory":
+    elif db_type == "memory":
         this_path = ""
     else:
-        raise Exception(f"Bad database type for testing: {request.param}")
+        raise Exception(f"Bad database type for testing: {db_type}")
     model_names = ["fake_name_{}".format(k) for k in range(50)]
-    h = History("sqlite://" + this_path)
+    h = History("sqlite://" + this_path, bulk_insert=bulk_insert)
     h.store_initial_data(0, {}, {}, {}, model_names,
                          "", "", '{"name": "pop_strategy_str_test"}')
     yield h
-    if request.param == "file":
+    if db_type == "file":
         try:
             os.remove(this_path)
         except FileNotFoundError:
@@ -350,4 +353,62 @@ def test_population_to_df(history: History):
 
 
 def test_pickle(history: History):
-    pickle.dumps(history)
+    copied = pickle.loads(pickle.dumps(history))
+    assert copied.id == history.id
+    assert copied.db_identifier == history.db_identifier
+    assert copied._cache is None and copied._write_queue is None
+
+
+def test_write_behind(history_uninitialized: History):
+    h = history_uninitialized
+    h.write_behind = True
+    h.store_initial_data(0, {}, {}, {}, ["m1"], "", "", "")
+    particle_list = [Particle(0,
+                              Parameter({"a": 23, "b": 12}),
+                              .2,
+                              [.1],
+                              [{"ss": .1}],
+                              [],
+                              True)]
+    for t in range(3):
+        h.append_population(t, 42, Population(particle_list), 2, ["m1"])
+
+    # reads wait for the pending writes
+    assert h.max_t == 2
+    df, w = h.get_distribution(0, 2)
+    assert df.a.iloc[0] == 23
+
+    # errors of background writes surface on the next database access
+    h.append_population(3, 42, Population(particle_list), 2, [])
+    with pytest.raises(IndexError):
+        h.done()
+    assert h.max_t == 2
+
+
+def test_last_population_cache(history: History):
+    particle_list = [Particle(0, Parameter({"a": 23, "b": 12}), .2, [.1],
+                              [{"ss": .1}], [], True),
+                     Particle(1, Parameter({"c": 1}), .6, [.2],
+                              [{"ss": .2}], [], True)]
+    history.append_population(0, 42, Population(particle_list), 2,
+                              ["m0", "m1"])
+
+    # answered from memory
+    assert history._cached_population(0) is not None
+    cached = (history.alive_models(0),
+              history.get_model_probabilities(0),
+              history.get_distribution(1, 0))
+
+    # answered from the database after an id change
+    history_id = history.id
+    history.id = history_id + 1
+    assert history._cached_population(0) is None
+    history.id = history_id
+    history._cache = None
+    assert history.alive_models(0) == cached[0] == [0, 1]
+    assert np.allclose(history.get_model_probabilities(0).p, cached[1].p)
+    assert (history.get_model_probabilities(0).index == cached[1].index).all()
+    df, w = history.get_distribution(1, 0)
+    assert list(df.columns) == list(cached[2][0].columns) == ["c"]
+    assert np.allclose(w, cached[2][1])
+    assert history.nr_of_models_alive(0) == 2
@@ -201,3 +201,73 @@ def test_mean_coefficient_of_variation_sample_not_full_rank(
     w = np.ones(len(df)) / len(df)
     transition.fit(df, w)
     transition.mean_cv()
+
+
+def test_multivariate_normal_batched_pdf_and_rvs():
+    df, w = data(20)
+    w = np.random.rand(20)
+    w /= w.sum()
+    transition = MultivariateNormalTransition()
+    transition.PDF_CHUNK_SIZE = 7 * 20 * 2
+    transition.fit(df, w)
+
+    points = transition.rvs(size=50)
+    assert list(points.columns) == ["a", "b"]
+    assert points.shape == (50, 2)
+
+    expected = np.array([(transition.normal.pdf(point - df.as_matrix()) * w)
+                         .sum() for point in points.as_matrix()])
+    assert np.allclose(transition.pdf(points), expected)
+
+
+def test_multivariate_normal_rvs_nearly_normalized_weights():
+    df, _ = data(20)
+    # close enough to 1 not to be normalized on fit,
+    # but too far off for np.random.choice
+    w = np.ones(20) / 20 * (1 + 1e-6)
+    transition = MultivariateNormalTransition()
+    transition.fit(df, w)
+    assert transition.rvs(size=10).shape == (10, 2)
+
+
+def test_local_transition_batched_fit_and_pdf():
+    df, w = data(50)
+    transition = LocalTransition(k=10)
+    transition.PDF_CHUNK_SIZE = 7 * 50 * 2
+    transition.fit(df, w)
+
+    # local covariances as computed by np.cov for each particle
+    X = df.as_matrix()
+    neighbors = np.argsort(((X[:, None] - X[None]) ** 2).sum(axis=2),
+                           axis=1)[:, 1:transition.k + 1]
+    for n in [0, 17]:
+        expected_cov = np.cov(X[neighbors[n]] - X[n], rowvar=False,
+                              aweights=w[neighbors[n]])
+        assert np.allclose(transition.covs[n], expected_cov)
+
+    points = transition.rvs(size=30)
+    expected = np.array([
+        np.average([np.exp(-.5 * (X[n] - point)
+                           @ np.linalg.inv(transition.covs[n])
+                           @ (X[n] - point))
+                    / np.sqrt((2 * np.pi) ** 2
+                              * np.linalg.det(transition.covs[n]))
+                    for n in range(len(X))], weights=w)
+        for point in points.as_matrix()])
+    assert np.allclose(transition.pdf(points), expected)
+
+
+@pytest.mark.parametrize("transition_class",
+                         [LocalTransition, MultivariateNormalTransition])
+def test_truncated_pdf_within_tolerance(transition_class):
+    df, w = data(200)
+    exact = transition_class()
+    exact.fit(df, w)
+    truncated = transition_class(pdf_rtol=1e-3)
+    truncated.fit(df, w)
+
+    # include points far off the support, which are evaluated exactly
+    points = pd.concat([exact.rvs(size=100),
+                        pd.DataFrame({"a": [3, -2], "b": [3, 5]})])
+    assert np.allclose(truncated.pdf(points), exact.pdf(points),
+                       rtol=1e-3, atol=0)
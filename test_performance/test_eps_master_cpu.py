@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+from pyabc.population import Particle
+from pyabc.sampler import ConcurrentFutureSampler
+
+
+SIMULATION_TIME = .05
+N_PARTICLES = 40
+
+
+def simulate_one():
+    # a slow simulation which does not use the CPU
+    time.sleep(SIMULATION_TIME)
+    return Particle(0, {}, 1, [0], [{}], [{}], True)
+
+
+@pytest.mark.parametrize("n_workers", [1, 4, 16, 64])
+def test_master_cpu_usage(n_workers):
+    """
+    The master has to block while waiting for the workers,
+    independently of the number of running jobs.
+    """
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        sampler = ConcurrentFutureSampler(executor,
+                                          client_max_jobs=n_workers)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        sample = sampler.sample_until_n_accepted(N_PARTICLES, simulate_one)
+        cpu_time = time.process_time() - cpu_start
+        wall_time = time.perf_counter() - wall_start
+
+    assert len(sample.accepted_particles) == N_PARTICLES
+    print("workers: {}, wall time: {:.3f}s, master CPU time: {:.3f}s"
+          .format(n_workers, wall_time, cpu_time))
+    assert cpu_time < .25 * wall_time